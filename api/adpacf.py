@@ -1,13 +1,14 @@
+from core.combinations import CombinationSpace
 from core.dialog_state import dialog
 from core.schemas import DialogResponse
 
-from db.goal import GoalNode, serialize_tree
-from db.session import SessionLocal
+from db.goal import GoalNode
+from db.session import current_session
 from db.goals import (
     get_classifier_with_items,
     create_classifier,
-    add_classifier_item,
-    replace_goals_from_tree,
+    add_classifier_items,
+    sync_goals_from_tree,
 )
 
 
@@ -15,11 +16,13 @@ def _persist_tree():
     scheme_id = getattr(dialog, "active_scheme_id", None)
     if scheme_id is None:
         return
-    session = SessionLocal()
-    try:
-        replace_goals_from_tree(session, scheme_id, dialog.root)
-    finally:
-        session.close()
+    session = current_session()
+    renumbered = sync_goals_from_tree(session, scheme_id, dialog.root)
+    ids = {old_id: node.id for old_id, node in renumbered}
+    for old_id, node in renumbered:
+        dialog.goals.rekey(old_id, node)
+    dialog.sums.rekey(ids)
+    dialog.ose_store.rekey_goals(ids)
 
 
 def _resp(state: str, question: str) -> DialogResponse:
@@ -27,7 +30,6 @@ def _resp(state: str, question: str) -> DialogResponse:
         phase="adpacf",
         state=state,
         question=question,
-        tree=serialize_tree(dialog.root) if dialog.root else [],
     )
 
 
@@ -36,7 +38,7 @@ def _init_classifiers() -> DialogResponse:
     dialog.clfs = []
     dialog.clf_tmp_name = None
     dialog.clf_parent_goal = None
-    dialog.clf_indices = None
+    dialog.clf_index = None
     dialog.clf_level = 1
     return _resp("clf_name", "Введите название классификатора (признака структуризации).")
 
@@ -44,46 +46,30 @@ def _init_classifiers() -> DialogResponse:
 def _find_goal(raw: str):
     raw = raw.strip()
     if raw.isdigit():
-        target_id = int(raw)
+        return dialog.goals.get(int(raw))
 
-        def _find_by_id(n: GoalNode):
-            if not n:
-                return None
-            if getattr(n, "id", None) == target_id:
-                return n
-            for ch in getattr(n, "children", []) or []:
-                got = _find_by_id(ch)
-                if got:
-                    return got
-            return None
+    return dialog.goals.find(raw)
 
-        return _find_by_id(dialog.root)
 
-    return dialog.goal_by_name.get(raw.lower())
+def _clf_space() -> CombinationSpace:
+    # тот же перебор, что и у страниц/пакетного решения (api.clf_combinations): номер сочетания в пространстве
+    return CombinationSpace([c["items"] for c in dialog.clfs])
 
 
 def _clf_combo_text():
-    parts = []
-    for i, clf in enumerate(dialog.clfs):
-        idx = dialog.clf_indices[i]
-        parts.append(clf["items"][idx])
-    return parts
+    return _clf_space().at(dialog.clf_index)
 
 
 def _clf_advance():
-    for i in range(len(dialog.clf_indices) - 1, -1, -1):
-        dialog.clf_indices[i] += 1
-        if dialog.clf_indices[i] < len(dialog.clfs[i]["items"]):
-            return True
-        dialog.clf_indices[i] = 0
-    return False
+    dialog.clf_index += 1
+    return dialog.clf_index < _clf_space().total
 
 
 def _handle_ask_root(text: str) -> DialogResponse:
     if not text:
         return DialogResponse(phase="adpacf", state="ask_root", question="Введите название главной цели:", tree=[])
 
-    if text.lower() in dialog.used_names:
+    if dialog.goals.has_name(text):
         return DialogResponse(
             phase="adpacf",
             state="ask_root",
@@ -94,8 +80,7 @@ def _handle_ask_root(text: str) -> DialogResponse:
     root = GoalNode(text)
     dialog.root = root
     dialog.current_node = root
-    dialog.used_names.add(text.lower())
-    dialog.goal_by_name[text.lower()] = root
+    dialog.goals.rebuild(root)
     dialog.state = "ask_add_subgoal"
     _persist_tree()
 
@@ -105,7 +90,6 @@ def _handle_ask_root(text: str) -> DialogResponse:
         question=(
             f"Добавить подцель для '{root.name}'?\n"
         ),
-        tree=serialize_tree(root),
     )
 
 
@@ -140,13 +124,12 @@ def _handle_ask_subgoal_name(text: str) -> DialogResponse:
     if not text:
         return _resp("ask_subgoal_name", "Название не может быть пустым. Введите подцель:")
 
-    if text.lower() in dialog.used_names:
+    if dialog.goals.has_name(text):
         return _resp("ask_subgoal_name", "Название уже используется. Введите другое название подцели:")
 
     child = dialog.current_node.add_child(text)
     dialog.current_node = child
-    dialog.used_names.add(text.lower())
-    dialog.goal_by_name[text.lower()] = child
+    dialog.goals.add(child)
     dialog.state = "ask_add_subgoal"
     _persist_tree()
 
@@ -168,29 +151,12 @@ def _handle_clf_items(text: str) -> DialogResponse:
         return _resp("clf_items", "Введите хотя бы один элемент через запятую:")
 
     scheme_id = getattr(dialog, "active_scheme_id", None)
-    session = SessionLocal()
-    try:
-        clf = get_classifier_with_items(session, scheme_id, dialog.clf_tmp_name, level=dialog.clf_level)
-        if not clf:
-            clf = create_classifier(session, scheme_id, dialog.clf_tmp_name, level=dialog.clf_level)
-
-        existing = {it.value.strip().lower() for it in (clf.items or []) if it.value}
-        for v in items:
-            v_norm = v.strip()
-            if not v_norm:
-                continue
-            if v_norm.lower() in existing:
-                continue
-            try:
-                add_classifier_item(session, clf.id, v_norm)
-                existing.add(v_norm.lower())
-            except Exception:
-                session.rollback()
-
-        clf = get_classifier_with_items(session, scheme_id, dialog.clf_tmp_name, level=dialog.clf_level)
-        all_items = [it.value for it in (clf.items or [])]
-    finally:
-        session.close()
+    session = current_session()
+    clf = get_classifier_with_items(session, scheme_id, dialog.clf_tmp_name, level=dialog.clf_level)
+    if not clf:
+        clf = create_classifier(session, scheme_id, dialog.clf_tmp_name, level=dialog.clf_level)
+
+    all_items, _added = add_classifier_items(session, clf.id, items)
 
     dialog.clfs.append({"name": dialog.clf_tmp_name, "items": all_items, "level": dialog.clf_level})
     dialog.clf_tmp_name = None
@@ -232,7 +198,7 @@ def _handle_clf_parent_goal(text: str) -> DialogResponse:
         return _resp("clf_parent_goal", "Цель не найдена. Введите название цели точно как в дереве:")
 
     dialog.clf_parent_goal = parent
-    dialog.clf_indices = [0 for _ in dialog.clfs]
+    dialog.clf_index = 0
     dialog.state = "clf_combo_decide"
 
     combo_s = " / ".join(_clf_combo_text())
@@ -249,17 +215,16 @@ def _handle_clf_combo_decide(text: str) -> DialogResponse:
     if parent:
         name = " / ".join(_clf_combo_text())
         if answer_low == "да":
-            if parent.level < dialog.max_level and name.lower() not in dialog.used_names:
+            if parent.level < dialog.max_level and not dialog.goals.has_name(name):
                 child = parent.add_child(name)
-                dialog.used_names.add(name.lower())
-                dialog.goal_by_name[name.lower()] = child
+                dialog.goals.add(child)
                 _persist_tree()
 
     has_next = _clf_advance()
     if not has_next:
         dialog.clf_done = True
         dialog.clf_parent_goal = None
-        dialog.clf_indices = None
+        dialog.clf_index = None
         dialog.state = "finish_adpacf"
         return _resp("finish_adpacf", "Классификаторы завершены. Переходим к ОСЭ.")
 
@@ -288,7 +253,6 @@ def handle_adpacf(ans: str) -> DialogResponse:
             phase="adpacf",
             state="error",
             question="Неизвестное состояние в АДПАЦФ.",
-            tree=serialize_tree(dialog.root) if dialog.root else [],
         )
 
     return handler(text)
@@ -1,9 +1,9 @@
 import math
 from core.dialog_state import dialog
 from core.schemas import DialogResponse
-from db.goal import serialize_tree, collect_goals
-from db.goals import replace_ose_results
-from db.session import SessionLocal
+from core.aggregates import SubtreeSums
+from db.goal import GoalIndex, collect_goals
+from db.session import current_session
 
 
 def _strip_summaries(rows: list[dict]) -> list[dict]:
@@ -22,52 +22,17 @@ def calculate_ose(p: float, q: float) -> float:
 
 
 def _append_goal_summaries(rows: list[dict], root) -> list[dict]:
-    base_sum: dict[str, float] = {}
-    for r in rows:
-        try:
-            h = float(r.get("H", 0) or 0)
-        except Exception:
-            h = 0.0
-        g = r.get("goal", "") or ""
-        base_sum[g] = base_sum.get(g, 0.0) + h
+    goals = GoalIndex(root)
+    sums = SubtreeSums()
+    sums.rebuild(rows, goals, root)
+    return list(rows) + sums.summary_rows(goals, root)
 
-    children: dict[str, list[str]] = {}
 
-    def walk(n):
-        if not n:
-            return
-        children.setdefault(n.name, [])
-        for ch in getattr(n, "children", []) or []:
-            children.setdefault(n.name, []).append(ch.name)
-            walk(ch)
-
-    walk(root)
-
-    total_sum: dict[str, float] = {}
-
-    def fold(goal_name: str) -> float:
-        if goal_name in total_sum:
-            return total_sum[goal_name]
-
-        s = base_sum.get(goal_name, 0.0)
-        for ch in children.get(goal_name, []):
-            s += fold(ch)
-
-        total_sum[goal_name] = s
-        return s
-
-    for g in children.keys():
-        fold(g)
-
-    out = list(rows)
-
-    for g, s in base_sum.items():
-        out.append({"goal": g, "factor": "ΣH (по цели)", "p": "", "q": "", "H": round(s, 4)})
-
-    for g, s in total_sum.items():
-        out.append({"goal": g, "factor": "ΣH (по поддереву)", "p": "", "q": "", "H": round(s, 4)})
-
-    return out
+def _refresh_summaries() -> None:
+    rows = dialog.ose_store.rows()
+    if dialog.root:
+        rows += dialog.sums.summary_rows(dialog.goals, dialog.root)
+    dialog.factors_results = rows
 
 
 def _resp(state: str, question: str) -> DialogResponse:
@@ -75,14 +40,13 @@ def _resp(state: str, question: str) -> DialogResponse:
         phase="adpose",
         state=state,
         question=question,
-        tree=serialize_tree(dialog.root),
         ose_results=dialog.factors_results,
     )
 
 
 def _finish_ose() -> DialogResponse:
     dialog.state = "finish_ose"
-    dialog.factors_results = _append_goal_summaries(_strip_summaries(dialog.factors_results), dialog.root)
+    _refresh_summaries()
     return _resp(
         "finish_ose",
         "ОСЭ завершена.\n"
@@ -135,11 +99,8 @@ def _persist_ose():
     scheme_id = getattr(dialog, "active_scheme_id", None)
     if scheme_id is None:
         return
-    session = SessionLocal()
-    try:
-        replace_ose_results(session, scheme_id, _strip_summaries(dialog.factors_results))
-    finally:
-        session.close()
+    session = current_session()
+    dialog.ose_store.flush(session, scheme_id)
 
 
 def _handle_ask_q(text: str) -> DialogResponse:
@@ -156,15 +117,18 @@ def _handle_ask_q(text: str) -> DialogResponse:
     p = dialog._p
     H = calculate_ose(p, q)
 
-    dialog.factors_results.append(
-        {
-            "goal": dialog._ose_goal.name,
-            "factor": dialog.current_factor_name,
-            "p": p,
-            "q": q,
-            "H": H,
-        }
-    )
+    row = {
+        "goal_id": dialog._ose_goal.id,
+        "goal": dialog._ose_goal.name,
+        "factor": dialog.current_factor_name,
+        "p": p,
+        "q": q,
+        "H": H,
+    }
+    dialog.ose_store.put(row)
+    dialog.sums.set_cell(dialog._ose_goal, dialog.current_factor_name, H)
+    dialog.factors_results.append(row)
+    _persist_ose()
 
     nxt = dialog.ose_goal_idx + 1
     if nxt < len(dialog.ose_goals):
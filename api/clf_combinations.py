@@ -0,0 +1,132 @@
+import os
+from typing import List
+
+from fastapi import HTTPException, status
+
+from core.combinations import CombinationSpace
+from core.dialog_state import dialog
+from core.schemas import ClfComboDecideRequest, DialogResponse
+
+from api.adpacf import _clf_space, _find_goal, _persist_tree, _resp
+from api.adpose import _refresh_summaries
+from api.edit_commands import menu_question
+
+
+PAGE_LIMIT = 500
+BULK_LIMIT = int(os.getenv("CLF_BULK_LIMIT", "5000"))
+
+
+def _space() -> CombinationSpace:
+    if not getattr(dialog, "clfs", None):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Классификаторы ещё не заданы.")
+    return _clf_space()
+
+
+def handle_combinations_page(offset: int, limit: int) -> dict:
+    space = _space()
+    limit = max(0, min(limit, PAGE_LIMIT))
+    offset = max(0, offset)
+    return {
+        "total": space.total,
+        "offset": offset,
+        "limit": limit,
+        "classifiers": [{"name": c["name"], "items": c["items"]} for c in dialog.clfs],
+        "items": [
+            {"index": i, "items": parts, "name": " / ".join(parts)}
+            for i, parts in space.page(offset, limit)
+        ],
+    }
+
+
+def _allowed(space: CombinationSpace, req: ClfComboDecideRequest) -> CombinationSpace:
+    if req.mode == "all":
+        return space
+    if req.mode == "none":
+        return CombinationSpace([])
+    if req.mode != "rules":
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=["mode: all, none или rules"])
+
+    by_name = {c["name"].strip().lower(): i for i, c in enumerate(dialog.clfs)}
+    allowed = [list(range(r)) for r in space.radices]
+    errors: List[str] = []
+
+    for rule in req.rules:
+        key = rule.classifier
+        ci = key if isinstance(key, int) else by_name.get(str(key).strip().lower())
+        if ci is None or not 0 <= ci < len(space.radices):
+            errors.append(f"классификатор не найден: {key}")
+            continue
+
+        pos = {v.strip().lower(): j for j, v in enumerate(space.items[ci])}
+        for v in (rule.include or []) + rule.exclude:
+            if v.strip().lower() not in pos:
+                errors.append(f"элемент не найден: {v} (классификатор {dialog.clfs[ci]['name']})")
+
+        keep = set(allowed[ci])
+        if rule.include is not None:
+            keep &= {pos[v.strip().lower()] for v in rule.include if v.strip().lower() in pos}
+        keep -= {pos[v.strip().lower()] for v in rule.exclude if v.strip().lower() in pos}
+        allowed[ci] = sorted(keep)
+
+    if errors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors)
+    return space.restrict(allowed)
+
+
+def handle_combinations_decide(req: ClfComboDecideRequest) -> DialogResponse:
+    space = _space()
+
+    parent = _find_goal(str(req.parent)) if req.parent is not None else dialog.clf_parent_goal
+    if parent is None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=["цель-родитель не найдена"])
+
+    accepted = _allowed(space, req)
+    if accepted.total > BULK_LIMIT:
+        counts = ", ".join(f"{c['name']} — {r}" for c, r in zip(dialog.clfs, accepted.radices))
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=[
+                f"правила пропускают {accepted.total} сочетаний, допустимо не больше {BULK_LIMIT} (CLF_BULK_LIMIT)",
+                f"элементов по классификаторам: {counts}",
+                'сузьте выбор: mode "rules" и правила вида {"classifier": <название или номер>, '
+                '"include": [...]} или "exclude": [...]; остальное можно решить следующими запросами',
+            ],
+        )
+    if accepted.total and parent.level >= dialog.max_level:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=[f"у '{parent.name}' достигнут максимальный уровень ({dialog.max_level})"],
+        )
+
+    created = 0
+    for _, parts in accepted.iter_from(0):
+        name = " / ".join(parts)
+        if dialog.goals.has_name(name):
+            continue
+        dialog.goals.add(parent.add_child(name))
+        created += 1
+
+    # одно обновление дерева в БД на всю пачку
+    if created:
+        _persist_tree()
+        if dialog.phase != "adpacf":
+            _refresh_summaries()
+
+    msg = f"Добавлено подцелей: {created}, пропущено (уже есть): {accepted.total - created}."
+    if dialog.state in ("clf_parent_goal", "clf_combo_decide"):
+        dialog.clf_done = True
+        dialog.clf_parent_goal = None
+        dialog.clf_index = None
+        # этап завершается сразу, как в _answer: иначе следующий ответ уйдёт в finish_adpacf
+        dialog.phase = dialog.state = "menu"
+        resp = DialogResponse(
+            phase="menu",
+            state="menu",
+            question=menu_question(),
+            ose_results=dialog.factors_results,
+        )
+    else:
+        resp = _resp(dialog.state, msg)
+        resp.phase = dialog.phase
+    resp.message = msg
+    return resp
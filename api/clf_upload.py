@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+import os
+from typing import List, Optional
+
+from fastapi import HTTPException, status
+
+from core.dialog_state import dialog
+from db.goals import add_classifier_items, create_classifier, get_classifier_with_items
+from db.session import current_session
+
+
+MAX_UPLOAD_BYTES = int(os.getenv("CLF_UPLOAD_MAX_BYTES", str(2 * 1024 * 1024)))
+
+
+def parse_items_body(body: bytes, content_type: Optional[str]) -> List[str]:
+    # JSON: ["a", "b"] или {"items": [...]}; CSV — первый столбец; иначе — по строке
+    # на элемент, в строке можно перечислить через запятую, как в диалоге
+    if len(body) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Файл слишком большой.")
+
+    ct = (content_type or "").lower()
+    text = body.decode("utf-8-sig", errors="replace")
+
+    if "json" in ct:
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        if isinstance(data, dict):
+            data = data.get("items")
+        if not isinstance(data, list):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Ожидается список элементов.")
+        return [str(x) for x in data if x is not None]
+
+    if "csv" in ct:
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        return [r[0] for r in csv.reader(io.StringIO(text), dialect) if r]
+
+    return [x for line in text.splitlines() for x in line.split(",")]
+
+
+def handle_items_upload(name: str, level: int, values: List[str]) -> dict:
+    scheme_id = getattr(dialog, "active_scheme_id", None)
+    if scheme_id is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Активная схема не выбрана.")
+    name = name.strip()
+    if not name:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Пустое название классификатора.")
+
+    session = current_session()
+    clf = get_classifier_with_items(session, scheme_id, name, level=level)
+    if not clf:
+        clf = create_classifier(session, scheme_id, name, level=level)
+    items, added = add_classifier_items(session, clf.id, values)
+
+    # классификатор уже выбран в диалоге — сочетания должны видеть новые элементы
+    for c in getattr(dialog, "clfs", None) or []:
+        if c["name"] == name and c.get("level", 1) == level:
+            c["items"] = items
+
+    return {
+        "classifier": name,
+        "level": level,
+        "added": added,
+        "skipped": len([v for v in values if v.strip()]) - added,
+        "items": items,
+    }
@@ -0,0 +1,92 @@
+import os
+from typing import List, Tuple
+
+from fastapi import HTTPException, status
+
+from core.dialog_state import current_dialog, dialog
+from core.dialog_store import restore_state, serialize_state
+from db.session import current_session
+from db.goals import sync_goals_from_tree
+
+from api.edit_commands import (
+    _COMMANDS, _deferred, _recalc_ose_results,
+    EditCommandError, try_parse_edit_command,
+)
+
+
+MAX_COMMANDS = int(os.getenv("EDIT_BATCH_MAX", "500"))
+
+# только команды, которые меняют состояние диалога в памяти; классификаторы
+# пишутся в БД сразу, а навигация по этапам в пакете смысла не имеет
+BATCHABLE = {"rename_goal", "delete_goal", "move_goal", "delete_factor", "clear_ose"}
+
+
+def _persist(pending: set) -> None:
+    scheme_id = getattr(dialog, "active_scheme_id", None)
+    if scheme_id is None:
+        return
+
+    # коммит — общий для запроса (см. db.session.UnitOfWork); при ошибке откатывается весь запрос
+    session = current_session()
+    renumbered = []
+    if "tree" in pending:
+        renumbered = sync_goals_from_tree(session, scheme_id, dialog.root)
+    if "ose" in pending:
+        dialog.ose_store.flush(session, scheme_id)
+
+    ids = {old_id: node.id for old_id, node in renumbered}
+    for old_id, node in renumbered:
+        dialog.goals.rekey(old_id, node)
+    dialog.sums.rekey(ids)
+    dialog.ose_store.rekey_goals(ids)
+
+
+def run_command_batch(commands: List[str]) -> Tuple[bool, List[dict]]:
+    if dialog.phase != "menu" or dialog.state != "menu":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Пакет команд доступен только из меню.")
+    if len(commands) > MAX_COMMANDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Не больше {MAX_COMMANDS} команд в пакете.",
+        )
+
+    snapshot = serialize_state(current_dialog())
+    pending: set = set()
+    results: List[dict] = []
+    ok = True
+
+    token = _deferred.set(pending)
+    try:
+        for i, text in enumerate(commands):
+            cmd = try_parse_edit_command(text)
+            if cmd is None or cmd[0] not in BATCHABLE:
+                msg = "Команда не распознана." if cmd is None else "Команда не поддерживается в пакете."
+                results.append({"index": i, "command": text, "ok": False, "message": msg})
+                ok = False
+                break
+            try:
+                resp = _COMMANDS[cmd[0]](cmd)
+            except EditCommandError as e:
+                results.append({"index": i, "command": text, "ok": False, "message": str(e)})
+                ok = False
+                break
+            results.append({"index": i, "command": text, "ok": True, "message": resp.question})
+    finally:
+        _deferred.reset(token)
+
+    if not ok:
+        restore_state(current_dialog(), snapshot)
+        return False, results
+
+    try:
+        if "recalc" in pending:
+            _recalc_ose_results()
+        _persist(pending)
+    except Exception:
+        # сначала память: откат сессии тоже может упасть
+        restore_state(current_dialog(), snapshot)
+        current_session().rollback()
+        results.append({"index": None, "command": None, "ok": False, "message": "Не удалось сохранить изменения."})
+        return False, results
+
+    return True, results
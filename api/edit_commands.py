@@ -1,55 +1,70 @@
 import re
+from contextvars import ContextVar
+from typing import Optional
 
+from core.combinations import CombinationSpace
+from core.command_grammar import CommandGrammar
 from core.dialog_state import dialog
 from core.schemas import DialogResponse
-from db.goal import collect_goals, serialize_tree
-from db.session import SessionLocal
+from db.session import current_session
+from db.traversal import iter_preorder_depth
 from db.goals import (
     list_classifiers,
     add_classifier_item,
     get_classifier_with_items,
     delete_classifier,
-    replace_goals_from_tree, replace_ose_results,
+    move_goal,
+    sync_goals_from_tree,
 )
 
-from api.adpose import _strip_summaries, _append_goal_summaries
+
+# в пакетном режиме (api.edit_batch) запись в БД и пересчёт сводок откладываются:
+# здесь только отмечается, что нужно сделать в конце пакета
+_deferred: ContextVar[Optional[set]] = ContextVar("edit_deferred", default=None)
+
+
+class EditCommandError(Exception):
+    pass
 
 
 def edit_response(text):
+    if _deferred.get() is not None:
+        # внутри пакета нужен только текст ответа, дерево отдаётся один раз в конце
+        return DialogResponse(phase=dialog.phase, state=dialog.state, question=text, tree=[])
     return DialogResponse(
         phase=dialog.phase,
         state=dialog.state,
         question=text,
-        tree=serialize_tree(dialog.root) if dialog.root else [],
         ose_results=dialog.factors_results,
         message=None,
     )
 
-def _rebuild_goal_maps():
-    dialog.used_names = set()
-    dialog.goal_by_name = {}
-    if not dialog.root:
-        return
-    for g in collect_goals(dialog.root):
-        dialog.used_names.add(g.name.lower())
-        dialog.goal_by_name[g.name.lower()] = g
-
-
 def _recalc_ose_results():
-    base = _strip_summaries(dialog.factors_results)
-    dialog.factors_results = _append_goal_summaries(base, dialog.root) if dialog.root else base
-
+    pending = _deferred.get()
+    if pending is not None:
+        pending.add("recalc")
+        return
+    base = dialog.ose_store.rows()
+    if dialog.root:
+        base += dialog.sums.summary_rows(dialog.goals, dialog.root)
+    dialog.factors_results = base
 
 
 def _persist_tree():
     scheme_id = getattr(dialog, "active_scheme_id", None)
     if scheme_id is None:
         return
-    session = SessionLocal()
-    try:
-        replace_goals_from_tree(session, scheme_id, dialog.root)
-    finally:
-        session.close()
+    pending = _deferred.get()
+    if pending is not None:
+        pending.add("tree")
+        return
+    session = current_session()
+    renumbered = sync_goals_from_tree(session, scheme_id, dialog.root)
+    ids = {old_id: node.id for old_id, node in renumbered}
+    for old_id, node in renumbered:
+        dialog.goals.rekey(old_id, node)
+    dialog.sums.rekey(ids)
+    dialog.ose_store.rekey_goals(ids)
 
 
 def _help_text():
@@ -64,123 +79,107 @@ def _help_text():
             "- покажи классификаторы",
             "- переименовать цель <старое> в <новое>",
             "- удалить цель <имя>",
+            "- переместить цель <имя> под <имя>",
             "- удалить классификатор <имя>",
+            "- начать классификаторы для цели <имя>",
+            '- используй классификаторы "A" и "B" [и "C" ...]',
+            "- (в режиме сочетаний) да / нет / пропустить [N] / сочетание N / стоп классификаторы",
             "- удалить фактор <имя>",
             "- удалить осэ",
         ]
     )
 
-def try_parse_edit_command(text):
-    s = text.strip()
-
-    if s.lower() in ["помощь", "help", "команды", "?"]:
-        return ("help",)
-
-    if s.lower() in ["завершить", "конец", "finish", "stop"]:
-        return ("finish",)
+def _clf_use(m):
+    names = _split_clf_names(m.group(1))
+    if len(names) >= 2:
+        return ("clf_use", names)
+    return None
 
-    if s.lower() in ["цели", "цель", "дерево", "добавить цели", "добавить цель"]:
-        return ("go_tree",)
 
-    if s.lower() in ["осэ", "ose", "посчитать осэ", "считать осэ"]:
-        return ("go_ose",)
+def _build_grammar():
+    g = CommandGrammar()
 
-    m = re.match(r'добав(ить|ь)\s+классификатор\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
-    if not m:
-        m = re.match(r'добав(ить|ь)\s+классификатор\s+(.+?)\s*$', s, flags=re.IGNORECASE)
-    if m:
-        return ("add_classifier", m.group(2))
+    g.phrase(["помощь", "help", "команды", "?"], ("help",))
+    g.phrase(["завершить", "конец", "finish", "stop"], ("finish",))
+    g.phrase(["цели", "цель", "дерево", "добавить цели", "добавить цель"], ("go_tree",))
+    g.phrase(["осэ", "ose", "посчитать осэ", "считать осэ"], ("go_ose",))
+    g.phrase(["удалить осэ", "очистить осэ", "сбросить осэ"], ("clear_ose",))
+    g.phrase(["покажи классификаторы", "показать классификаторы"], ("show_classifiers",))
 
-    m = re.match(
-        r'добав(ить|ь)\s+элемент\s+"(.+?)"\s+в\s+классификатор\s+"(.+?)"\s*$',
-        s,
-        flags=re.IGNORECASE,
+    g.pattern(
+        ["добавить классификатор", "добавь классификатор"],
+        [r'добав(ить|ь)\s+классификатор\s+"(.+?)"\s*$', r'добав(ить|ь)\s+классификатор\s+(.+?)\s*$'],
+        lambda m: ("add_classifier", m.group(2)),
     )
-    if not m:
-        m = re.match(
+    g.pattern(
+        ["добавить элемент", "добавь элемент"],
+        [
+            r'добав(ить|ь)\s+элемент\s+"(.+?)"\s+в\s+классификатор\s+"(.+?)"\s*$',
             r'добав(ить|ь)\s+элемент\s+(.+?)\s+в\s+классификатор\s+(.+?)\s*$',
-            s,
-            flags=re.IGNORECASE,
-        )
-    if m:
-        return ("add_classifier_item", m.group(2), m.group(3))
-
-    m = re.match(r'переименовать\s+цель\s+"(.+?)"\s+в\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
-    if not m:
-        m = re.match(r'переименовать\s+цель\s+(.+?)\s+в\s+(.+?)\s*$', s, flags=re.IGNORECASE)
-    if m:
-        return ("rename_goal", m.group(1), m.group(2))
-
-    m = re.match(r'удалить\s+цель\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
-    if not m:
-        m = re.match(r'удалить\s+цель\s+(.+?)\s*$', s, flags=re.IGNORECASE)
-    if m:
-        return ("delete_goal", m.group(1))
-
-    m = re.match(r'удалить\s+классификатор\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
-    if not m:
-        m = re.match(r'удалить\s+классификатор\s+(.+?)\s*$', s, flags=re.IGNORECASE)
-    if m:
-        return ("delete_classifier", m.group(1))
-
-    m = re.match(r'удалить\s+фактор\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
-    if not m:
-        m = re.match(r'удалить\s+фактор\s+(.+?)\s*$', s, flags=re.IGNORECASE)
-    if m:
-        return ("delete_factor", m.group(1))
-
-    if s.lower() in ["удалить осэ", "очистить осэ", "сбросить осэ"]:
-        return ("clear_ose",)
-
-    if s.lower() in ["покажи классификаторы", "показать классификаторы"]:
-        return ("show_classifiers",)
-
-    m = re.match(
-        r'начать\s+классификаторы\s+для\s+цели\s+"(.+?)"\s*$',
-        s,
-        flags=re.IGNORECASE,
+        ],
+        lambda m: ("add_classifier_item", m.group(2), m.group(3)),
     )
-    if not m:
-        m = re.match(
-            r'начать\s+классификаторы\s+для\s+цели\s+(.+?)\s*$',
-            s,
-            flags=re.IGNORECASE,
+    g.pattern(
+        ["переименовать цель"],
+        [r'переименовать\s+цель\s+"(.+?)"\s+в\s+"(.+?)"\s*$', r'переименовать\s+цель\s+(.+?)\s+в\s+(.+?)\s*$'],
+        lambda m: ("rename_goal", m.group(1), m.group(2)),
+    )
+    g.pattern(
+        ["переместить цель"],
+        [r'переместить\s+цель\s+"(.+?)"\s+под\s+"(.+?)"\s*$', r'переместить\s+цель\s+(.+?)\s+под\s+(.+?)\s*$'],
+        lambda m: ("move_goal", m.group(1), m.group(2)),
+    )
+    for word, kind in (("цель", "delete_goal"), ("классификатор", "delete_classifier"), ("фактор", "delete_factor")):
+        g.pattern(
+            [f"удалить {word}"],
+            [rf'удалить\s+{word}\s+"(.+?)"\s*$', rf'удалить\s+{word}\s+(.+?)\s*$'],
+            lambda m, kind=kind: (kind, m.group(1)),
         )
-    if m:
-        return ("clf_start_for_goal", m.group(1))
+    g.pattern(
+        ["начать классификаторы для цели"],
+        [
+            r'начать\s+классификаторы\s+для\s+цели\s+"(.+?)"\s*$',
+            r'начать\s+классификаторы\s+для\s+цели\s+(.+?)\s*$',
+        ],
+        lambda m: ("clf_start_for_goal", m.group(1)),
+    )
+    g.pattern(["используй классификаторы"], [r'используй\s+классификаторы\s+(.+?)\s*$'], _clf_use)
 
-    m = re.match(
-        r'используй\s+классификаторы\s+"(.+?)"\s+и\s+"(.+?)"\s*$',
-        s,
-        flags=re.IGNORECASE,
+    # только в режиме перебора сочетаний
+    g.phrase(
+        ["следующее сочетание", "следующее", "пропустить", "продолжить"],
+        ("clf_skip", 1),
+        state="clf_pair_decide",
     )
-    if not m:
-        m = re.match(
-            r'используй\s+классификаторы\s+(.+?)\s+и\s+(.+?)\s*$',
-            s,
-            flags=re.IGNORECASE,
-        )
-    if m:
-        return ("clf_use_two", m.group(1), m.group(2))
+    g.phrase(["стоп классификаторы", "остановить классификаторы"], ("clf_stop",), state="clf_pair_decide")
+    g.pattern(
+        ["пропустить"],
+        [r'пропустить\s+(\d+)\s*$'],
+        lambda m: ("clf_skip", int(m.group(1))),
+        state="clf_pair_decide",
+    )
+    g.pattern(
+        ["сочетание", "сочетанию", "перейти к сочетание", "перейти к сочетанию"],
+        [r'(?:перейти\s+к\s+)?сочетани[юе]\s+(\d+)\s*$'],
+        lambda m: ("clf_goto", int(m.group(1))),
+        state="clf_pair_decide",
+    )
+    return g
 
-    if dialog.state == "clf_pair_decide" and s.lower() in ["следующее сочетание", "следующее", "пропустить", "продолжить"]:
-        return ("clf_next_pair",)
 
-    if dialog.state == "clf_pair_decide" and s.lower() in ["стоп классификаторы", "остановить классификаторы"]:
-        return ("clf_stop",)
+_GRAMMAR = _build_grammar()
 
-    return None
+
+def try_parse_edit_command(text):
+    return _GRAMMAR.parse(text, dialog.state)
 
 def cmd_show_classifiers(_cmd):
     scheme_id = dialog.active_scheme_id
     if scheme_id is None:
         return edit_response("Активная схема не выбрана.")
 
-    session = SessionLocal()
-    try:
-        items = list_classifiers(session, scheme_id)
-    finally:
-        session.close()
+    session = current_session()
+    items = list_classifiers(session, scheme_id)
 
     if not items:
         return edit_response("Классификаторы не заданы.")
@@ -205,7 +204,7 @@ def cmd_add_classifier(cmd):
         dialog.clfs = []
         dialog.clf_tmp_name = None
         dialog.clf_parent_goal = None
-        dialog.clf_indices = None
+        dialog.clf_index = None
         dialog.clf_level = 1
         dialog.clf_done = False
 
@@ -219,7 +218,6 @@ def cmd_add_classifier(cmd):
             f"Классификатор = '{dialog.clf_tmp_name}'.\n"
             "Введите элементы через запятую (ключевые слова):"
         ),
-        tree=serialize_tree(dialog.root) if dialog.root else [],
         ose_results=dialog.factors_results,
         message=None,
     )
@@ -229,76 +227,125 @@ def cmd_add_classifier_item(cmd):
     value = cmd[1].strip()
     clf_name = cmd[2].strip()
     scheme_id = dialog.active_scheme_id
-    session = SessionLocal()
+    session = current_session()
+    clf = get_classifier_with_items(session, scheme_id, clf_name)
+    if not clf:
+        return edit_response("Классификатор не найден.")
+    # savepoint: ошибка вставки не должна откатить остальную работу запроса
     try:
-        clf = get_classifier_with_items(session, scheme_id, clf_name)
-        if not clf:
-            return edit_response("Классификатор не найден.")
-        add_classifier_item(session, clf.id, value)
+        with session.begin_nested():
+            add_classifier_item(session, clf.id, value)
     except Exception:
-        session.rollback()
         return edit_response("Не удалось добавить элемент.")
-    finally:
-        session.close()
 
     return edit_response(f"Элемент '{value}' добавлен.")
 
 
 def cmd_clf_start_for_goal(cmd):
-    goal_name = cmd[1].strip().lower()
-
-    if goal_name not in dialog.goal_by_name:
+    parent = dialog.goals.find(cmd[1])
+    if parent is None:
         return edit_response("Цель не найдена.")
 
-    parent = dialog.goal_by_name[goal_name]
     if parent.level >= dialog.max_level:
         return edit_response("Достигнут максимальный уровень.")
 
     dialog.clf_parent_goal = parent
     dialog.clf_level = parent.level + 1
-    dialog.clf_pairs = []
-    dialog.clf_pair_idx = 0
-    dialog.state = "ask_add_subgoal"
+    dialog.clf_combo_items = []
+    dialog.clf_combo_idx = 0
+    dialog.state = "menu"
+
+    return edit_response(
+        f"Режим классификаторов для цели '{parent.name}'.\n"
+        'Далее: используй классификаторы "A" и "B" [и "C" ...]'
+    )
+
+
+def _split_clf_names(raw):
+    quoted = re.findall(r'"(.+?)"', raw)
+    if quoted:
+        return [q.strip() for q in quoted if q.strip()]
+    return [p.strip() for p in re.split(r'\s+и\s+|,', raw, flags=re.IGNORECASE) if p.strip()]
+
+
+def _clf_space():
+    return CombinationSpace(dialog.clf_combo_items or [])
+
+
+def _clf_combo_question():
+    space = _clf_space()
+    parts = space.at(dialog.clf_combo_idx)
+    return f"[{dialog.clf_combo_idx + 1}/{space.total}] {' / '.join(parts)} — добавить как подцель? (да/нет)"
+
+
+def _clf_finish(text):
+    dialog.clf_combo_items = []
+    dialog.clf_combo_idx = 0
+    dialog.state = "menu"
+    return edit_response(text)
+
 
-    return edit_response(f"Режим классификаторов для цели '{parent.name}'.")
+def _clf_move_to(index):
+    if index >= _clf_space().total:
+        return _clf_finish("Сочетания закончились.")
+    dialog.clf_combo_idx = index
+    return edit_response(_clf_combo_question())
 
 
-def cmd_clf_use_two(cmd):
-    c1_name, c2_name = cmd[1].strip(), cmd[2].strip()
+def cmd_clf_use(cmd):
+    names = cmd[1]
     scheme_id = dialog.active_scheme_id
-    session = SessionLocal()
-    try:
-        c1 = get_classifier_with_items(session, scheme_id, c1_name)
-        c2 = get_classifier_with_items(session, scheme_id, c2_name)
-    finally:
-        session.close()
+    if dialog.clf_parent_goal is None:
+        return edit_response("Сначала выберите цель: начать классификаторы для цели <имя>")
+
+    session = current_session()
+    clfs = [get_classifier_with_items(session, scheme_id, n) for n in names]
+
+    missing = [n for n, c in zip(names, clfs) if not c]
+    if missing:
+        return edit_response("Классификатор не найден: " + ", ".join(missing))
 
-    if not c1 or not c2:
-        return edit_response("Один из классификаторов не найден.")
+    items = [[it.value for it in c.items] for c in clfs]
+    if any(not x for x in items):
+        return edit_response("У классификатора нет элементов.")
 
-    dialog.clf_pairs = [(a.value, b.value) for a in c1.items for b in c2.items]
-    dialog.clf_pair_idx = 0
+    # в состоянии только списки элементов и номер текущего сочетания
+    dialog.clf_combo_items = items
+    dialog.clf_combo_idx = 0
     dialog.state = "clf_pair_decide"
+    return edit_response(_clf_combo_question())
+
+
+def cmd_clf_skip(cmd):
+    return _clf_move_to(dialog.clf_combo_idx + max(1, cmd[1]))
+
+
+def cmd_clf_goto(cmd):
+    total = _clf_space().total
+    if not 1 <= cmd[1] <= total:
+        return edit_response(f"Номер сочетания должен быть от 1 до {total}.\n" + _clf_combo_question())
+    return _clf_move_to(cmd[1] - 1)
 
-    x, y = dialog.clf_pairs[0]
-    return edit_response(f"{x} / {y} — добавить как подцель? (да/нет)")
 
-def cmd_clf_next_pair(_cmd):
-    dialog.clf_pair_idx += 1
-    if dialog.clf_pair_idx >= len(dialog.clf_pairs):
-        dialog.state = "ask_add_subgoal"
-        dialog.clf_pairs = []
-        return edit_response("Сочетания закончились.")
+def handle_clf_pair_answer(text):
+    low = text.strip().lower()
+    if low not in ("да", "нет"):
+        return edit_response(_clf_combo_question())
 
-    x, y = dialog.clf_pairs[dialog.clf_pair_idx]
-    return edit_response(f"{x} / {y} — добавить? (да/нет)", state="clf_pair_decide")
+    parent = dialog.clf_parent_goal
+    if low == "да" and parent is not None:
+        name = " / ".join(_clf_space().at(dialog.clf_combo_idx))
+        if parent.level < dialog.max_level and not dialog.goals.has_name(name):
+            dialog.goals.add(parent.add_child(name))
+            _persist_tree()
+            _recalc_ose_results()
+
+    return _clf_move_to(dialog.clf_combo_idx + 1)
 
 
 def cmd_clf_stop(_cmd):
-    dialog.clf_pairs = []
     dialog.clf_parent_goal = None
-    dialog.state = "ask_add_subgoal"
-    return edit_response("Режим классификаторов остановлен.")
+    return _clf_finish("Режим классификаторов остановлен.")
 
 
 def menu_question():
@@ -330,20 +377,20 @@ def cmd_go_ose(_cmd):
 
 
 def cmd_rename_goal(cmd):
-    old_name = cmd[1].strip().lower()
+    old_name = cmd[1].strip()
     new_name = cmd[2].strip()
     if not dialog.root:
-        return edit_response("Дерево целей не задано.")
+        raise EditCommandError("Дерево целей не задано.")
     if not new_name:
-        return edit_response("Пустое имя цели.")
-    if new_name.lower() in dialog.used_names:
-        return edit_response("Название уже существует.")
-    node = dialog.goal_by_name.get(old_name)
+        raise EditCommandError("Пустое имя цели.")
+    if dialog.goals.has_name(new_name):
+        raise EditCommandError("Название уже существует.")
+    node = dialog.goals.find(old_name)
     if not node:
-        return edit_response("Цель не найдена.")
-    node.name = new_name
-    _rebuild_goal_maps()
+        raise EditCommandError("Цель не найдена.")
+    dialog.goals.rename(node, new_name)
     _persist_tree()
+    dialog.ose_store.rename_goal(node.id, new_name)
     _recalc_ose_results()
     return edit_response("Цель переименована.")
 
@@ -353,62 +400,112 @@ def _find_goal_token(token: str):
     if not dialog.root:
         return None
     if t.isdigit():
-        gid = int(t)
-        for g in collect_goals(dialog.root):
-            if g.id == gid:
-                return g
-        return None
-    return dialog.goal_by_name.get(t.lower())
+        return dialog.goals.get(int(t))
+    return dialog.goals.find(t)
 
 
 def _persist_ose():
     scheme_id = getattr(dialog, "active_scheme_id", None)
     if scheme_id is None:
         return
-    session = SessionLocal()
-    try:
-        replace_ose_results(session, scheme_id, _strip_summaries(dialog.factors_results))
-    finally:
-        session.close()
+    pending = _deferred.get()
+    if pending is not None:
+        pending.add("ose")
+        return
+    session = current_session()
+    dialog.ose_store.flush(session, scheme_id)
 
 
 def cmd_delete_goal(cmd):
     token = cmd[1]
     node = _find_goal_token(token)
     if not node:
-        return edit_response("Цель не найдена.")
+        raise EditCommandError("Цель не найдена.")
     if node.parent is None:
-        return edit_response("Нельзя удалить корневую цель.")
+        raise EditCommandError("Нельзя удалить корневую цель.")
+    dialog.sums.remove_subtree(node)
     node.parent.children = [ch for ch in node.parent.children if ch is not node]
     if dialog.current_node is node:
         dialog.current_node = node.parent
-    _rebuild_goal_maps()
+    removed = {n.id for n in dialog.goals.remove_subtree(node)}
+    # строки ОСЭ поддерева удаляются в БД каскадом вместе с целями
     _persist_tree()
-    base = [r for r in _strip_summaries(dialog.factors_results) if str(r.get("goal", "")).lower() != node.name.lower()]
+    dialog.ose_store.forget_goals(removed)
+    base = dialog.ose_store.rows()
     dialog.factors_results = base
     dialog.factor_set = set(r.get("factor") for r in base if r.get("factor"))
     _recalc_ose_results()
     return edit_response("Цель удалена.")
 
 
+def _persist_move(node):
+    scheme_id = getattr(dialog, "active_scheme_id", None)
+    if scheme_id is None:
+        return
+    pending = _deferred.get()
+    if pending is not None:
+        pending.add("tree")
+        return
+    # только строки переносимого поддерева, без сверки всего дерева
+    move_goal(current_session(), scheme_id, node.id, node.parent.id)
+
+
+def check_move(node, parent) -> list:
+    # поддерево node с глубинами; ошибка — если перенос под parent недопустим
+    if node.parent is None:
+        raise EditCommandError("Нельзя переместить корневую цель.")
+    p = parent
+    while p is not None:
+        if p is node:
+            raise EditCommandError("Нельзя переместить цель внутрь её же поддерева.")
+        p = p.parent
+
+    sub = list(iter_preorder_depth(node))
+    if parent.level + 1 + max(d for _, d in sub) > dialog.max_level:
+        raise EditCommandError(f"После переноса будет превышен максимальный уровень ({dialog.max_level}).")
+    return sub
+
+
+def cmd_move_goal(cmd):
+    node = _find_goal_token(cmd[1])
+    parent = _find_goal_token(cmd[2])
+    if not node or not parent:
+        raise EditCommandError("Цель не найдена.")
+    if node.parent is parent:
+        return edit_response("Цель уже находится там.")
+    sub = check_move(node, parent)
+
+    old_parent = node.parent
+    dialog.sums.move_subtree(node, old_parent, parent)
+    old_parent.children = [ch for ch in old_parent.children if ch is not node]
+    parent.children.append(node)
+    node.parent = parent
+    for n, d in sub:
+        n.level = parent.level + 1 + d
+
+    _persist_move(node)
+    _recalc_ose_results()
+    return edit_response("Цель перемещена.")
+
+
 def cmd_delete_classifier(cmd):
     name = cmd[1].strip()
     scheme_id = dialog.active_scheme_id
     if scheme_id is None:
         return edit_response("Активная схема не выбрана.")
-    session = SessionLocal()
+    session = current_session()
     try:
-        ok = delete_classifier(session, scheme_id, name)
+        with session.begin_nested():
+            ok = delete_classifier(session, scheme_id, name)
     except Exception:
-        session.rollback()
         return edit_response("Не удалось удалить классификатор.")
-    finally:
-        session.close()
     if not ok:
         return edit_response("Классификатор не найден.")
     return edit_response("Классификатор удалён.")
 
 def cmd_clear_ose(_cmd):
+    dialog.ose_store.clear()
+    dialog.sums.clear()
     dialog.factors_results = []
     dialog.factor_set = set()
     dialog.current_factor_name = None
@@ -419,9 +516,14 @@ def cmd_clear_ose(_cmd):
     return edit_response("ОСЭ очищено.")
 
 def cmd_delete_factor(cmd):
-    name = cmd[1].strip().lower()
-    base = _strip_summaries(dialog.factors_results)
-    base2 = [r for r in base if str(r.get("factor", "")).lower() != name]
+    removed = dialog.ose_store.drop_factor(cmd[1])
+    if not removed:
+        raise EditCommandError("Фактор не найден.")
+    for r in removed:
+        node = dialog.goals.get(r["goal_id"])
+        if node is not None:
+            dialog.sums.remove_cell(node, str(r.get("factor", "")))
+    base2 = dialog.ose_store.rows()
     dialog.factors_results = base2
     dialog.factor_set = set(r.get("factor") for r in base2 if r.get("factor"))
     _recalc_ose_results()
@@ -434,6 +536,7 @@ _COMMANDS = {
     "go_ose": cmd_go_ose,
     "rename_goal": cmd_rename_goal,
     "delete_goal": cmd_delete_goal,
+    "move_goal": cmd_move_goal,
     "delete_classifier": cmd_delete_classifier,
     "delete_factor": cmd_delete_factor,
     "clear_ose": cmd_clear_ose,
@@ -442,8 +545,9 @@ _COMMANDS = {
     "add_classifier": cmd_add_classifier,
     "add_classifier_item": cmd_add_classifier_item,
     "clf_start_for_goal": cmd_clf_start_for_goal,
-    "clf_use_two": cmd_clf_use_two,
-    "clf_next_pair": cmd_clf_next_pair,
+    "clf_use": cmd_clf_use,
+    "clf_skip": cmd_clf_skip,
+    "clf_goto": cmd_clf_goto,
     "clf_stop": cmd_clf_stop,
 }
 
@@ -452,4 +556,7 @@ def handle_edit_command(cmd):
     handler = _COMMANDS.get(kind)
     if not handler:
         return edit_response("Неизвестная команда.")
-    return handler(cmd)
\ No newline at end of file
+    try:
+        return handler(cmd)
+    except EditCommandError as e:
+        return edit_response(str(e))
\ No newline at end of file
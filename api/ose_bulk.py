@@ -0,0 +1,186 @@
+import csv
+import io
+import json
+from typing import List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+
+from core.dialog_state import dialog
+from core.schemas import OseMatrixRequest
+from core.sensitivity import calculate_ose_matrix
+from db.goal import GoalNode
+from db.session import current_session
+
+from api.adpose import _refresh_summaries
+
+
+MAX_ERRORS = 20
+
+
+def _parse_number(raw: str) -> float:
+    raw = raw.strip()
+    if raw == "":
+        return np.nan
+    return float(raw.replace(",", "."))
+
+
+def _matrix_from_csv(text: str) -> OseMatrixRequest:
+    # длинный формат: goal;factor;p;q — по строке на ячейку, как выгружают из таблиц
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(io.StringIO(text), dialect)
+
+    rows = [r for r in reader if any(c.strip() for c in r)]
+    if rows and rows[0] and rows[0][0].strip().lower() in ("goal", "цель"):
+        rows = rows[1:]
+
+    goals: List[str] = []
+    factors: List[str] = []
+    g_pos: dict = {}
+    f_pos: dict = {}
+    cells: List[Tuple[int, int, float, float]] = []
+    errors: List[str] = []
+
+    for line_no, r in enumerate(rows, start=1):
+        if len(r) < 4:
+            errors.append(f"строка {line_no}: ожидается goal, factor, p, q")
+            continue
+        g, f = r[0].strip(), r[1].strip()
+        try:
+            p, q = _parse_number(r[2]), _parse_number(r[3])
+        except ValueError:
+            errors.append(f"строка {line_no}: p и q должны быть числами")
+            continue
+        if g not in g_pos:
+            g_pos[g] = len(goals)
+            goals.append(g)
+        if f not in f_pos:
+            f_pos[f] = len(factors)
+            factors.append(f)
+        cells.append((g_pos[g], f_pos[f], p, q))
+
+        if len(errors) >= MAX_ERRORS:
+            break
+
+    if errors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors)
+
+    p_m = np.full((len(goals), len(factors)), np.nan)
+    q_m = np.full((len(goals), len(factors)), np.nan)
+    for gi, fi, p, q in cells:
+        p_m[gi, fi] = p
+        q_m[gi, fi] = q
+
+    return OseMatrixRequest(
+        goals=goals,
+        factors=factors,
+        p=[[None if np.isnan(x) else float(x) for x in row] for row in p_m],
+        q=[[None if np.isnan(x) else float(x) for x in row] for row in q_m],
+    )
+
+
+def parse_matrix_body(body: bytes, content_type: Optional[str]) -> OseMatrixRequest:
+    ct = (content_type or "").lower()
+    text = body.decode("utf-8-sig", errors="replace")
+    if "json" in ct:
+        try:
+            return OseMatrixRequest.model_validate(json.loads(text))
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    return _matrix_from_csv(text)
+
+
+def _resolve_goals(tokens: List) -> Tuple[List[GoalNode], List[str]]:
+    nodes: List[GoalNode] = []
+    errors: List[str] = []
+    for t in tokens:
+        s = str(t).strip()
+        node = dialog.goals.get(int(s)) if s.isdigit() else dialog.goals.find(s)
+        if node is None and s.isdigit():
+            node = dialog.goals.find(s)
+        if node is None:
+            errors.append(f"цель не найдена: {s}")
+        nodes.append(node)
+    return nodes, errors
+
+
+def _validate(req: OseMatrixRequest, p: np.ndarray, q: np.ndarray) -> List[str]:
+    errors: List[str] = []
+    shape = (len(req.goals), len(req.factors))
+    if p.shape != shape or q.shape != shape:
+        return [f"p и q должны быть матрицами {shape[0]}×{shape[1]} (цели × факторы)"]
+
+    factors = [f.strip() for f in req.factors]
+    if any(not f for f in factors):
+        errors.append("пустое название фактора")
+    if len({f.lower() for f in factors}) != len(factors):
+        errors.append("названия факторов повторяются")
+
+    for name, m in (("p", p), ("q", q)):
+        bad = np.argwhere(~np.isnan(m) & ((m < 0) | (m > 1)))
+        for gi, fi in bad[:MAX_ERRORS]:
+            errors.append(f"{name} вне [0..1]: цель {req.goals[gi]}, фактор {req.factors[fi]}")
+
+    half = np.isnan(p) != np.isnan(q)
+    for gi, fi in np.argwhere(half)[:MAX_ERRORS]:
+        errors.append(f"задано только одно из p/q: цель {req.goals[gi]}, фактор {req.factors[fi]}")
+
+    return errors[:MAX_ERRORS]
+
+
+def handle_ose_matrix(req: OseMatrixRequest) -> dict:
+    if not dialog.root:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Сначала задайте дерево целей.")
+    scheme_id = getattr(dialog, "active_scheme_id", None)
+    if scheme_id is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Активная схема не выбрана.")
+
+    if not req.goals or not req.factors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=["пустая матрица"])
+    try:
+        p = np.array(req.p, dtype=float)
+        q = np.array(req.q, dtype=float)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=["строки матриц p и q должны быть одной длины"],
+        )
+
+    nodes, errors = _resolve_goals(req.goals)
+    errors += _validate(req, p, q)
+    if errors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors[:MAX_ERRORS])
+
+    h = calculate_ose_matrix(np.nan_to_num(p), np.nan_to_num(q))
+    filled = ~np.isnan(p)
+
+    factors = [f.strip() for f in req.factors]
+    for gi, fi in np.argwhere(filled):
+        node = nodes[gi]
+        factor = factors[fi]
+        row = {
+            "goal_id": node.id,
+            "goal": node.name,
+            "factor": factor,
+            "p": float(p[gi, fi]),
+            "q": float(q[gi, fi]),
+            "H": float(h[gi, fi]),
+        }
+        dialog.ose_store.put(row)
+        dialog.sums.set_cell(node, factor, row["H"])
+        dialog.factor_set.add(factor.lower())
+
+    session = current_session()
+    dialog.ose_store.flush(session, scheme_id)
+
+    _refresh_summaries()
+
+    return {
+        "written": int(filled.sum()),
+        "skipped": int(filled.size - filled.sum()),
+        "ose_results": dialog.factors_results,
+    }
@@ -0,0 +1,127 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from core.dialog_state import dialog
+from core.schemas import OseSensitivityRequest
+from core.sensitivity import (
+    DEFAULT_SAMPLES, MAX_GOAL_SAMPLES, MAX_SAMPLES, MAX_WORKERS, TIME_LIMIT,
+    TreeCells, calculate_ose_matrix, run_samples, summarize,
+)
+from db.traversal import iter_postorder, iter_preorder
+
+from api.ose_bulk import MAX_ERRORS
+
+
+def _range(spec: Optional[List[float]], base: float, spread: float) -> Tuple[float, float, float]:
+    if spec is None:
+        return max(0.0, base - spread), base, min(1.0, base + spread)
+    if len(spec) == 2:
+        lo, hi = spec
+        return lo, min(max(base, lo), hi), hi
+    lo, mode, hi = spec
+    return lo, mode, hi
+
+
+def _bad_range(spec: Optional[List[float]]) -> bool:
+    if spec is None:
+        return False
+    if len(spec) not in (2, 3):
+        return True
+    return any(x < 0 or x > 1 for x in spec) or list(spec) != sorted(spec)
+
+
+def _float(v) -> float:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def handle_ose_sensitivity(req: OseSensitivityRequest) -> dict:
+    if not dialog.root:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Сначала задайте дерево целей.")
+    if req.distribution not in ("uniform", "triangular"):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=["distribution: uniform или triangular"],
+        )
+    if not 0 < req.level < 1:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=["level должен быть в (0..1)"])
+
+    nodes = list(iter_postorder(dialog.root))
+    pos = {n.id: i for i, n in enumerate(nodes)}
+    parent = [pos[n.parent.id] if n.parent is not None else -1 for n in nodes]
+
+    errors: List[str] = []
+    overrides: Dict[Tuple[int, str], object] = {}
+    for c in req.cells:
+        s = str(c.goal).strip()
+        node = dialog.goals.get(int(s)) if s.isdigit() else dialog.goals.find(s)
+        if node is None and s.isdigit():
+            node = dialog.goals.find(s)
+        if node is None:
+            errors.append(f"цель не найдена: {s}")
+            continue
+        if _bad_range(c.p) or _bad_range(c.q):
+            errors.append(f"диапазон вне [0..1] или не по возрастанию: цель {s}, фактор {c.factor}")
+            continue
+        overrides[(node.id, c.factor.strip().lower())] = c
+
+    cell_goal: List[int] = []
+    p_lo, p_mode, p_hi, q_lo, q_mode, q_hi = [], [], [], [], [], []
+    for row in dialog.ose_store.rows():
+        node = dialog.goals.get(row["goal_id"])
+        if node is None or node.id not in pos:
+            continue
+        factor = str(row.get("factor", ""))
+        c = overrides.pop((node.id, factor.strip().lower()), None)
+        p = _range(c.p if c else None, _float(row.get("p")), req.spread)
+        q = _range(c.q if c else None, _float(row.get("q")), req.spread)
+        cell_goal.append(pos[node.id])
+        for acc, v in zip((p_lo, p_mode, p_hi, q_lo, q_mode, q_hi), p + q):
+            acc.append(v)
+
+    for (gid, factor), c in overrides.items():
+        errors.append(f"нет оценки ОСЭ: цель {c.goal}, фактор {c.factor}")
+    if errors:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors[:MAX_ERRORS])
+
+    cells = TreeCells(parent, cell_goal, (p_lo, p_mode, p_hi), (q_lo, q_mode, q_hi))
+
+    requested = req.samples or DEFAULT_SAMPLES
+    samples = max(1, min(requested, MAX_SAMPLES, MAX_GOAL_SAMPLES // max(1, len(nodes))))
+    workers = max(1, min(req.workers or MAX_WORKERS, MAX_WORKERS))
+    time_limit = min(req.time_limit or TIME_LIMIT, TIME_LIMIT)
+
+    base_own, base_sub = cells.sums(calculate_ose_matrix(cells.p[1], cells.q[1])[None, :])
+
+    started = time.monotonic()
+    chunks, truncated = run_samples(cells, samples, workers, time_limit, req.seed, req.distribution)
+    elapsed = time.monotonic() - started
+    if not chunks:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Не успели посчитать ни одной порции сэмплов, увеличьте time_limit.",
+        )
+
+    per_goal, overall = summarize(chunks, base_own[:, 0], base_sub[:, 0], req.level, max(1, req.top))
+
+    goals = []
+    for n in iter_preorder(dialog.root):
+        i = pos[n.id]
+        goals.append({"id": n.id, "name": n.name, **per_goal[i]})
+
+    return {
+        "samples": int(sum(c[0].shape[1] for c in chunks)),
+        "requested": requested,
+        "workers": workers,
+        "truncated": truncated,
+        "elapsed": round(elapsed, 3),
+        "level": req.level,
+        "top": max(1, req.top),
+        "cells": len(cell_goal),
+        "goals": goals,
+        "ranking": overall,
+    }
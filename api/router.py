@@ -1,19 +1,37 @@
 from typing import Optional, Dict
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 
+from core.delta import finalize_response
+from core.tree_layout import tidy_layout
 from core.dialog_state import dialog
-from core.schemas import AnswerRequest, DialogResponse
+from core.schemas import (
+    AnswerRequest, ClfComboDecideRequest, CommandBatchRequest, CommandBatchResponse,
+    DialogResponse, OseSensitivityRequest,
+)
+
+from sqlalchemy.orm import Session
 
-from db.session import SessionLocal
-from db.goal import GoalNode, serialize_tree, collect_goals
-from db.goals import get_all_goals, get_ose_results
-from db.schemes import list_schemes, create_scheme, delete_scheme
+from db.session import get_db
+from db.goal import GoalNode, serialize_tree
+from db.traversal import iter_preorder_depth
+from db.goals import get_all_goals, get_ancestors, get_children, get_ose_results, get_subtree, get_subtree_h
+from db.schemes import list_schemes, create_scheme, delete_scheme, get_tree_version, mark_snapshot_stale
+from db.snapshots import load_snapshot
+from db.tree_cache import get_cached_tree, put_cached_tree, drop_cached_tree
 
 from api.adpacf import handle_adpacf
-from api.adpose import handle_adpose, _append_goal_summaries, _strip_summaries
+from api.adpose import handle_adpose, _refresh_summaries, _strip_summaries
+from api.ose_bulk import parse_matrix_body, handle_ose_matrix
+from api.ose_sensitivity import handle_ose_sensitivity
+from api.clf_combinations import handle_combinations_page, handle_combinations_decide
+from api.clf_upload import parse_items_body, handle_items_upload
+from api.edit_batch import run_command_batch
 from api.edit_commands import (
-    try_parse_edit_command,
-    handle_edit_command, menu_question,
+    try_parse_edit_command, edit_response,
+    handle_edit_command, handle_clf_pair_answer, menu_question,
+    check_move, EditCommandError,
 )
 
 
@@ -21,115 +39,167 @@ from api.edit_commands import (
 router = APIRouter(prefix="/api")
 
 
-def _ensure_active_scheme_id() -> int:
+def _ensure_active_scheme_id(session: Session) -> int:
     if not hasattr(dialog, "active_scheme_id"):
         dialog.active_scheme_id = None
 
-    session = SessionLocal()
-    try:
-        schemes = list_schemes(session)
-        if not schemes:
-            s = create_scheme(session, "Default")
-            schemes = [s]
-
-        if dialog.active_scheme_id is None:
-            dialog.active_scheme_id = schemes[0].id
-
-        return dialog.active_scheme_id
-    finally:
-        session.close()
-
-
-def _load_tree_from_db(scheme_id: int) -> Optional[GoalNode]:
-    session = SessionLocal()
-    try:
-        goals = get_all_goals(session, scheme_id)
-        if not goals:
-            return None
-
-        goals = sorted(goals, key=lambda g: g.id)
-        nodes: Dict[int, GoalNode] = {}
-        for g in goals:
-            node = GoalNode(g.name)
-            node.id = g.id
-            nodes[g.id] = node
-
-        root: Optional[GoalNode] = None
-        for g in goals:
-            if g.parent_id is None and root is None:
-                root = nodes[g.id]
-            else:
-                parent = nodes.get(g.parent_id)
-                if parent:
-                    child = nodes[g.id]
-                    child.parent = parent
-                    parent.children.append(child)
-
-        def _fix_levels(n: GoalNode, lvl: int = 1):
-            n.level = lvl
-            for ch in getattr(n, "children", []) or []:
-                ch.parent = n
-                _fix_levels(ch, lvl + 1)
-
-        if root:
-            _fix_levels(root, 1)
-
-        GoalNode._id_counter = (max(nodes.keys()) + 1) if nodes else 1
-
-        return root
-
-    finally:
-        session.close()
+    schemes = list_schemes(session)
+    if not schemes:
+        s = create_scheme(session, "Default")
+        schemes = [s]
+
+    if dialog.active_scheme_id is None:
+        dialog.active_scheme_id = schemes[0].id
+
+    return dialog.active_scheme_id
+
+
+def _load_tree_from_db(session: Session, scheme_id: int) -> Optional[GoalNode]:
+    goals = get_all_goals(session, scheme_id)
+    if not goals:
+        return None
+
+    goals = sorted(goals, key=lambda g: g.id)
+    nodes: Dict[int, GoalNode] = {}
+    for g in goals:
+        node = GoalNode(g.name)
+        node.id = g.id
+        nodes[g.id] = node
+
+    root: Optional[GoalNode] = None
+    for g in goals:
+        if g.parent_id is None and root is None:
+            root = nodes[g.id]
+        else:
+            parent = nodes.get(g.parent_id)
+            if parent:
+                child = nodes[g.id]
+                child.parent = parent
+                parent.children.append(child)
+
+    for n, lvl in iter_preorder_depth(root, 1):
+        n.level = lvl
+        for ch in n.children:
+            ch.parent = n
+
+    # счётчик общий для всех схем, поэтому только растёт:
+    # новый узел не должен получить id уже сохранённой цели
+    GoalNode._id_counter = max(GoalNode._id_counter, max(nodes.keys()) + 1)
+
+    return root
+
 
 @router.get("/schemes")
-def get_schemes():
-    session = SessionLocal()
-    try:
-        items = list_schemes(session)
-        return [{"id": s.id, "name": s.name} for s in items]
-    finally:
-        session.close()
+def get_schemes(session: Session = Depends(get_db)):
+    items = list_schemes(session)
+    return [{"id": s.id, "name": s.name} for s in items]
 
 @router.post("/schemes")
-def post_scheme(name: str = Query(..., min_length=1)):
-    session = SessionLocal()
-    try:
-        s = create_scheme(session, name)
-        if not hasattr(dialog, "active_scheme_id"):
-            dialog.active_scheme_id = None
-        dialog.active_scheme_id = s.id
-        return {"id": s.id, "name": s.name}
-    finally:
-        session.close()
+def post_scheme(name: str = Query(..., min_length=1), session: Session = Depends(get_db)):
+    s = create_scheme(session, name)
+    if not hasattr(dialog, "active_scheme_id"):
+        dialog.active_scheme_id = None
+    dialog.active_scheme_id = s.id
+    return {"id": s.id, "name": s.name}
 
 @router.delete("/schemes/{scheme_id}")
-def delete_scheme_route(scheme_id: int):
-    session = SessionLocal()
-    try:
-        delete_scheme(session, scheme_id)
+def delete_scheme_route(scheme_id: int, session: Session = Depends(get_db)):
+    delete_scheme(session, scheme_id)
+    drop_cached_tree(scheme_id)
+
+    if getattr(dialog, "active_scheme_id", None) == scheme_id:
+        dialog.active_scheme_id = None
+        _ensure_active_scheme_id(session)
+
+    return {"ok": True}
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
 
-        if getattr(dialog, "active_scheme_id", None) == scheme_id:
-            dialog.active_scheme_id = None
-            _ensure_active_scheme_id()
+def _goals_response(session: Session, scheme_id: int, if_none_match: Optional[str]) -> Response:
+    version = get_tree_version(session, scheme_id)
+
+    etag = f'"{scheme_id}-{version}"'
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    data = get_cached_tree(scheme_id, version)
+    if data is None:
+        root = _load_tree_from_db(session, scheme_id)
+        data = serialize_tree(root) if root else []
+        # координаты для preset-раскладки графа — один раз на версию дерева, в кеше вместе с ним
+        pos = tidy_layout(root)
+        for item in data:
+            x, y = pos[item["id"]]
+            item["x"], item["y"] = round(x, 1), round(y, 1)
+        put_cached_tree(scheme_id, version, data)
+
+    return JSONResponse(content=data, headers={"ETag": etag})
 
-        return {"ok": True}
-    finally:
-        session.close()
 
 @router.get("/schemes/{scheme_id}/goals")
-def get_scheme_goals(scheme_id: int):
-    root = _load_tree_from_db(scheme_id)
-    return serialize_tree(root) if root else []
+def get_scheme_goals(
+    scheme_id: int,
+    if_none_match: Optional[str] = Header(None),
+    session: Session = Depends(get_db),
+):
+    return _goals_response(session, scheme_id, if_none_match)
 
 @router.get("/goals")
-def get_goals():
-    scheme_id = _ensure_active_scheme_id()
-    root = _load_tree_from_db(scheme_id)
-    return serialize_tree(root) if root else []
-
-@router.post("/dialog/start", response_model=DialogResponse)
-def start_dialog(scheme_id: Optional[int] = Query(None)):
-    dialog.__init__()
+def get_goals(if_none_match: Optional[str] = Header(None), session: Session = Depends(get_db)):
+    scheme_id = _ensure_active_scheme_id(session)
+    return _goals_response(session, scheme_id, if_none_match)
+
+@router.get("/goals/{goal_id}/subtree")
+def get_goal_subtree(
+    goal_id: int,
+    depth: Optional[int] = Query(None, ge=0),
+    session: Session = Depends(get_db),
+):
+    nodes = get_subtree(session, goal_id, depth)
+    if not nodes:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Цель не найдена.")
+    return {"goal_id": goal_id, "depth": depth, "nodes": nodes, "sum_h": get_subtree_h(session, goal_id)}
+
+@router.get("/goals/{goal_id}/children")
+def get_goal_children(
+    goal_id: int,
+    depth: int = Query(1, ge=1),
+    session: Session = Depends(get_db),
+):
+    nodes = get_children(session, goal_id, depth)
+    if not nodes:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Цель не найдена.")
+    return {"goal_id": goal_id, "depth": depth, "nodes": nodes}
+
+@router.get("/goals/{goal_id}/ancestors")
+def get_goal_ancestors(goal_id: int, session: Session = Depends(get_db)):
+    return {"goal_id": goal_id, "ancestors": get_ancestors(session, goal_id)}
+
+@router.post("/goals/{goal_id}/move", response_model=DialogResponse)
+def post_goal_move(goal_id: int, parent_id: int = Query(...)):
+    # ошибки — статусами до вызова команды: в диалоге она отвечает на них текстом с 200
+    node = dialog.goals.get(goal_id) if dialog.root else None
+    parent = dialog.goals.get(parent_id) if dialog.root else None
+    if node is None or parent is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Цель не найдена.")
+    if node.parent is not parent:
+        try:
+            check_move(node, parent)
+        except EditCommandError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    resp = handle_edit_command(("move_goal", str(goal_id), str(parent_id)))
+    return finalize_response(resp, dialog)
+
+def _start_dialog(session: Session, scheme_id: Optional[int]) -> DialogResponse:
+    dialog.reset()
 
     if not hasattr(dialog, "active_scheme_id"):
         dialog.active_scheme_id = None
@@ -137,38 +207,34 @@ def start_dialog(scheme_id: Optional[int] = Query(None)):
     if scheme_id is not None:
         dialog.active_scheme_id = scheme_id
     else:
-        _ensure_active_scheme_id()
-
-    root = _load_tree_from_db(dialog.active_scheme_id)
+        _ensure_active_scheme_id(session)
 
-    session = SessionLocal()
-    try:
+    snap = load_snapshot(session, dialog.active_scheme_id)
+    if snap is not None:
+        root, base = snap
+    else:
+        root = _load_tree_from_db(session, dialog.active_scheme_id)
         base = get_ose_results(session, dialog.active_scheme_id)
-    finally:
-        session.close()
-
-    dialog.factors_results = _append_goal_summaries(_strip_summaries(base), root) if root else base
+        # снимок соберётся из загруженного состояния перед коммитом запроса
+        mark_snapshot_stale(session, dialog.active_scheme_id)
+
+    dialog.root = root
+    dialog.goals.rebuild(root)
+    dialog.ose_store.load(_strip_summaries(base))
+    dialog.sums.rebuild(dialog.ose_store.rows(), dialog.goals, root)
+    _refresh_summaries()
     dialog.factor_set = set(str(r.get("factor", "")).lower() for r in _strip_summaries(dialog.factors_results) if r.get("factor"))
 
     if root:
-        dialog.root = root
         dialog.current_node = root
 
         dialog.phase = "menu"
         dialog.state = "menu"
 
-        dialog.used_names = set()
-        dialog.goal_by_name = {}
-
-        for n in collect_goals(dialog.root):
-            dialog.used_names.add(n.name.lower())
-            dialog.goal_by_name[n.name.lower()] = n
-
         return DialogResponse(
             phase=dialog.phase,
             state=dialog.state,
             question=menu_question(),
-            tree=serialize_tree(dialog.root),
             ose_results=dialog.factors_results,
         )
 
@@ -182,9 +248,31 @@ def start_dialog(scheme_id: Optional[int] = Query(None)):
     )
 
 
+@router.post("/dialog/start", response_model=DialogResponse)
+def start_dialog(scheme_id: Optional[int] = Query(None), session: Session = Depends(get_db)):
+    return finalize_response(_start_dialog(session, scheme_id), dialog)
+
+
 @router.post("/dialog/answer", response_model=DialogResponse)
 def process_answer(req: AnswerRequest):
-    text = req.answer.strip()
+    resp = _answer(req.answer.strip())
+    return finalize_response(resp, dialog, req.tree_version, req.ose_version)
+
+
+@router.post("/dialog/commands", response_model=CommandBatchResponse)
+def process_command_batch(req: CommandBatchRequest):
+    ok, results = run_command_batch(req.commands)
+    text = "Пакет команд выполнен." if ok else "Пакет команд отменён, изменения не сохранены."
+    resp = finalize_response(edit_response(text), dialog, req.tree_version, req.ose_version)
+    return CommandBatchResponse(ok=ok, results=results, dialog=resp)
+
+
+def _answer(text: str) -> DialogResponse:
+    if dialog.phase == "menu" and dialog.state == "clf_pair_decide":
+        cmd = try_parse_edit_command(text)
+        if cmd:
+            return handle_edit_command(cmd)
+        return handle_clf_pair_answer(text)
 
     if dialog.phase == "menu" and dialog.state == "menu":
         cmd = try_parse_edit_command(text)
@@ -195,7 +283,6 @@ def process_answer(req: AnswerRequest):
             phase="menu",
             state="menu",
             question=menu_question(),
-            tree=serialize_tree(dialog.root) if dialog.root else [],
             ose_results=dialog.factors_results,
         )
 
@@ -209,7 +296,6 @@ def process_answer(req: AnswerRequest):
                 phase="menu",
                 state="menu",
                 question=menu_question(),
-                tree=serialize_tree(dialog.root) if dialog.root else [],
                 ose_results=dialog.factors_results,
             )
 
@@ -225,8 +311,35 @@ def process_answer(req: AnswerRequest):
                 phase="menu",
                 state="menu",
                 question=menu_question(),
-                tree=serialize_tree(dialog.root) if dialog.root else [],
                 ose_results=dialog.factors_results,
             )
 
         return resp
+
+
+@router.post("/ose/matrix")
+async def post_ose_matrix(request: Request):
+    # разбор большой матрицы (JSON/CSV) — тоже вне event loop
+    req = await run_in_threadpool(parse_matrix_body, await request.body(), request.headers.get("content-type"))
+    return await run_in_threadpool(handle_ose_matrix, req)
+
+
+@router.post("/ose/sensitivity")
+def post_ose_sensitivity(req: OseSensitivityRequest):
+    return handle_ose_sensitivity(req)
+
+
+@router.get("/classifiers/combinations")
+def get_clf_combinations(offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    return handle_combinations_page(offset, limit)
+
+
+@router.post("/classifiers/combinations/decide", response_model=DialogResponse)
+def post_clf_combinations_decide(req: ClfComboDecideRequest):
+    return finalize_response(handle_combinations_decide(req), dialog)
+
+
+@router.post("/classifiers/{name}/items")
+async def post_classifier_items(name: str, request: Request, level: int = Query(1, ge=1)):
+    values = await run_in_threadpool(parse_items_body, await request.body(), request.headers.get("content-type"))
+    return await run_in_threadpool(handle_items_upload, name, level, values)
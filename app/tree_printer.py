@@ -1,8 +1,10 @@
+from db.traversal import iter_preorder_depth
+
+
 def print_tree(goal, level: int = 0) -> None:
     if goal is None:
         print("(empty)")
         return
 
-    print("  " * level + "- " + goal.name)
-    for child in goal.children:
-        print_tree(child, level + 1)
+    for node, depth in iter_preorder_depth(goal, level):
+        print("  " * depth + "- " + node.name)
@@ -0,0 +1,162 @@
+import re
+import sys
+import time
+
+from api.edit_commands import _GRAMMAR, _split_clf_names
+
+
+ROUNDS = 2000
+
+CORPUS = [
+    ("помощь", "menu"),
+    ("Команды", "menu"),
+    ("цели", "menu"),
+    ("Посчитать ОСЭ", "menu"),
+    ("добавить классификатор Отрасль", "menu"),
+    ('добавь классификатор "Регион страны"', "menu"),
+    ('добавить элемент "Урал" в классификатор "Регион"', "menu"),
+    ("добавить элемент Сибирь в классификатор Регион", "menu"),
+    ('переименовать цель "Рост выручки" в "Рост продаж"', "menu"),
+    ("переименовать цель A1 в A1x", "menu"),
+    ("удалить цель Снижение затрат", "menu"),
+    ('удалить классификатор "Отрасль"', "menu"),
+    ("удалить фактор Кадры", "menu"),
+    ("удалить осэ", "menu"),
+    ("покажи классификаторы", "menu"),
+    ("начать классификаторы для цели Главная", "menu"),
+    ('используй классификаторы "Отрасль" и "Регион" и "Канал"', "menu"),
+    ("используй классификаторы Отрасль, Регион", "menu"),
+    ("следующее", "clf_pair_decide"),
+    ("пропустить 25", "clf_pair_decide"),
+    ("перейти к сочетанию 120", "clf_pair_decide"),
+    ("стоп классификаторы", "clf_pair_decide"),
+    # обычные ответы диалога — самый частый случай, должны отсекаться сразу
+    ("да", "menu"),
+    ("нет", "clf_pair_decide"),
+    ("Повышение качества обслуживания клиентов", "menu"),
+    ("0.35", "menu"),
+    ("удалить", "menu"),
+    ("добавить классификатор", "menu"),
+]
+
+
+def _old_parse(text, state):
+    s = text.strip()
+
+    if s.lower() in ["помощь", "help", "команды", "?"]:
+        return ("help",)
+
+    if s.lower() in ["завершить", "конец", "finish", "stop"]:
+        return ("finish",)
+
+    if s.lower() in ["цели", "цель", "дерево", "добавить цели", "добавить цель"]:
+        return ("go_tree",)
+
+    if s.lower() in ["осэ", "ose", "посчитать осэ", "считать осэ"]:
+        return ("go_ose",)
+
+    m = re.match(r'добав(ить|ь)\s+классификатор\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
+    if not m:
+        m = re.match(r'добав(ить|ь)\s+классификатор\s+(.+?)\s*$', s, flags=re.IGNORECASE)
+    if m:
+        return ("add_classifier", m.group(2))
+
+    m = re.match(r'добав(ить|ь)\s+элемент\s+"(.+?)"\s+в\s+классификатор\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
+    if not m:
+        m = re.match(r'добав(ить|ь)\s+элемент\s+(.+?)\s+в\s+классификатор\s+(.+?)\s*$', s, flags=re.IGNORECASE)
+    if m:
+        return ("add_classifier_item", m.group(2), m.group(3))
+
+    m = re.match(r'переименовать\s+цель\s+"(.+?)"\s+в\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
+    if not m:
+        m = re.match(r'переименовать\s+цель\s+(.+?)\s+в\s+(.+?)\s*$', s, flags=re.IGNORECASE)
+    if m:
+        return ("rename_goal", m.group(1), m.group(2))
+
+    m = re.match(r'удалить\s+цель\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
+    if not m:
+        m = re.match(r'удалить\s+цель\s+(.+?)\s*$', s, flags=re.IGNORECASE)
+    if m:
+        return ("delete_goal", m.group(1))
+
+    m = re.match(r'удалить\s+классификатор\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
+    if not m:
+        m = re.match(r'удалить\s+классификатор\s+(.+?)\s*$', s, flags=re.IGNORECASE)
+    if m:
+        return ("delete_classifier", m.group(1))
+
+    m = re.match(r'удалить\s+фактор\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
+    if not m:
+        m = re.match(r'удалить\s+фактор\s+(.+?)\s*$', s, flags=re.IGNORECASE)
+    if m:
+        return ("delete_factor", m.group(1))
+
+    if s.lower() in ["удалить осэ", "очистить осэ", "сбросить осэ"]:
+        return ("clear_ose",)
+
+    if s.lower() in ["покажи классификаторы", "показать классификаторы"]:
+        return ("show_classifiers",)
+
+    m = re.match(r'начать\s+классификаторы\s+для\s+цели\s+"(.+?)"\s*$', s, flags=re.IGNORECASE)
+    if not m:
+        m = re.match(r'начать\s+классификаторы\s+для\s+цели\s+(.+?)\s*$', s, flags=re.IGNORECASE)
+    if m:
+        return ("clf_start_for_goal", m.group(1))
+
+    m = re.match(r'используй\s+классификаторы\s+(.+?)\s*$', s, flags=re.IGNORECASE)
+    if m:
+        names = _split_clf_names(m.group(1))
+        if len(names) >= 2:
+            return ("clf_use", names)
+
+    if state == "clf_pair_decide":
+        low = s.lower()
+        if low in ["следующее сочетание", "следующее", "пропустить", "продолжить"]:
+            return ("clf_skip", 1)
+
+        m = re.match(r'пропустить\s+(\d+)\s*$', low)
+        if m:
+            return ("clf_skip", int(m.group(1)))
+
+        m = re.match(r'(?:перейти\s+к\s+)?сочетани[юе]\s+(\d+)\s*$', low)
+        if m:
+            return ("clf_goto", int(m.group(1)))
+
+        if low in ["стоп классификаторы", "остановить классификаторы"]:
+            return ("clf_stop",)
+
+    return None
+
+
+def _time(fn, rounds: int) -> float:
+    corpus = CORPUS
+    best = None
+    for _ in range(3):
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            for text, state in corpus:
+                fn(text, state)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def run(rounds: int = ROUNDS) -> None:
+    # новый разбор должен давать те же кортежи, что и старый, в обоих состояниях
+    for text, _state in CORPUS:
+        for state in ("menu", "clf_pair_decide"):
+            old, new = _old_parse(text, state), _GRAMMAR.parse(text, state)
+            assert old == new, (text, state, old, new)
+
+    n = rounds * len(CORPUS)
+    t_old = _time(_old_parse, rounds)
+    t_new = _time(_GRAMMAR.parse, rounds)
+    print(f"{len(CORPUS)} commands x {rounds} rounds")
+    print(f"{'parser':<14}{'total':>12}{'per command':>16}{'commands/s':>14}")
+    for label, t in (("sequential re", t_old), ("grammar", t_new)):
+        print(f"{label:<14}{t * 1000:>9.1f} ms{t / n * 1e6:>13.2f} us{n / t:>14.0f}")
+    print(f"speedup x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else ROUNDS)
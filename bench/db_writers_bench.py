@@ -0,0 +1,134 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from db.base import Base
+from db.config import make_engine
+from db.goal import GoalNode
+from db.goals import apply_ose_changes, get_ose_results, sync_goals_from_tree
+from db.scheme import Scheme
+from db.schemes import bump_tree_version
+
+
+WRITERS = 8
+READERS = 2
+TXNS = 100
+ROWS = 20
+
+
+def _fresh_engine(path: str, tune: bool):
+    # journal_mode=WAL сохраняется в самом файле, поэтому каждый режим — на новом файле
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    engine = make_engine(f"sqlite:///{path}", tune=tune)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    goal_ids = {}
+    with Session() as s:
+        s.add_all([Scheme(name=f"s{i}") for i in range(WRITERS)])
+        s.flush()
+        for sid in range(1, WRITERS + 1):
+            root = GoalNode("g0")
+            leaves = [root.add_child(f"g{i}") for i in range(1, 50)]
+            sync_goals_from_tree(s, sid, root)
+            goal_ids[sid] = [root.id] + [n.id for n in leaves]
+        s.commit()
+    return engine, Session, goal_ids
+
+
+def _writer(Session, scheme_id: int, goal_ids: list, txns: int, lat: list, errors: list) -> None:
+    for t in range(txns):
+        rows = [
+            {"goal_id": goal_ids[t % len(goal_ids)], "factor": f"f{k}", "p": 0.5, "q": 0.5, "H": 0.25}
+            for k in range(ROWS)
+        ]
+        t0 = time.perf_counter()
+        s = Session()
+        try:
+            apply_ose_changes(s, scheme_id, rows)
+            bump_tree_version(s, scheme_id)
+            s.commit()
+            lat.append(time.perf_counter() - t0)
+        except OperationalError as e:
+            s.rollback()
+            errors.append(str(e.orig))
+        finally:
+            s.close()
+
+
+def _reader(Session, stop: threading.Event, counter: list, errors: list) -> None:
+    n = 0
+    while not stop.is_set():
+        s = Session()
+        try:
+            get_ose_results(s, 1)
+            n += 1
+        except OperationalError as e:
+            errors.append(str(e.orig))
+        finally:
+            s.close()
+    counter.append(n)
+
+
+def _pct(xs: list, q: float) -> float:
+    if not xs:
+        return float("nan")
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))] * 1000
+
+
+def run_mode(path: str, tune: bool, writers: int, txns: int) -> dict:
+    engine, Session, goal_ids = _fresh_engine(path, tune)
+    lat: list = []
+    errors: list = []
+    reads: list = []
+    stop = threading.Event()
+
+    readers = [threading.Thread(target=_reader, args=(Session, stop, reads, errors)) for _ in range(READERS)]
+    threads = [
+        threading.Thread(target=_writer, args=(Session, i + 1, goal_ids[i + 1], txns, lat, errors))
+        for i in range(writers)
+    ]
+    for th in readers:
+        th.start()
+    t0 = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    for th in readers:
+        th.join()
+    engine.dispose()
+
+    return {
+        "commits": len(lat),
+        "tps": len(lat) / elapsed,
+        "locked": sum("locked" in e for e in errors),
+        "reads": sum(reads) / elapsed,
+        "p50": _pct(lat, 0.5),
+        "p99": _pct(lat, 0.99),
+    }
+
+
+def run(writers: int = WRITERS, txns: int = TXNS) -> None:
+    path = os.path.join(tempfile.mkdtemp(prefix="pf_bench_"), "writers.db")
+    print(f"{writers} writers x {txns} txns ({ROWS} OSE rows + tree version), {READERS} readers, {path}")
+    print(f"{'engine':<28}{'commits':>9}{'tx/s':>10}{'locked':>8}{'reads/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for label, tune in (("defaults", False), ("WAL + NORMAL + busy_timeout", True)):
+        r = run_mode(path, tune, writers, txns)
+        print(
+            f"{label:<28}{r['commits']:>9}{r['tps']:>10.0f}{r['locked']:>8}"
+            f"{r['reads']:>10.0f}{r['p50']:>10.1f}{r['p99']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    run(*(int(a) for a in sys.argv[1:3]))
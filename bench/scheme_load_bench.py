@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from bench.traversal_bench import build_wide
+from db.config import make_engine
+from db.goal import collect_goals
+from db.goals import apply_ose_changes, get_all_goals, get_ose_results, sync_goals_from_tree
+from db.migrations import run_migrations
+from db.scheme import Scheme, SchemeSnapshot
+from db.snapshots import load_normalized, load_snapshot, save_snapshot
+
+
+GOALS = 5_000
+FACTORS = 10
+ROUNDS = 20
+
+
+def _seed(Session, goals: int, factors: int) -> int:
+    with Session() as s:
+        scheme = Scheme(name="bench")
+        s.add(scheme)
+        s.flush()
+        root = build_wide(goals)
+        sync_goals_from_tree(s, scheme.id, root)
+        rows = [
+            {"goal_id": n.id, "factor": f"f{k}", "p": 0.5, "q": 0.5, "H": 0.35}
+            for n in collect_goals(root) if not n.children
+            for k in range(factors)
+        ]
+        apply_ose_changes(s, scheme.id, rows)
+        save_snapshot(s, scheme.id, root, get_ose_results(s, scheme.id))
+        s.commit()
+        return scheme.id
+
+
+def _old_load(s, scheme_id: int):
+    # как было в /dialog/start: ORM-объекты целей и отдельный запрос ОСЭ
+    goals = get_all_goals(s, scheme_id)
+    rows = get_ose_results(s, scheme_id)
+    return goals, rows
+
+
+def _time(Session, fn, rounds: int) -> float:
+    best = None
+    for _ in range(rounds):
+        with Session() as s:
+            t0 = time.perf_counter()
+            fn(s)
+            dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def run(goals: int = GOALS, factors: int = FACTORS, rounds: int = ROUNDS) -> None:
+    path = os.path.join(tempfile.mkdtemp(prefix="pf_bench_"), "load.db")
+    engine = make_engine(f"sqlite:///{path}")
+    run_migrations(engine)
+    Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    scheme_id = _seed(Session, goals, factors)
+
+    with Session() as s:
+        _root, snap_rows = load_snapshot(s, scheme_id)
+        _root, db_rows = load_normalized(s, scheme_id)
+        assert len(snap_rows) == len(db_rows)
+        size = s.execute(
+            select(func.length(SchemeSnapshot.data)).where(SchemeSnapshot.scheme_id == scheme_id)
+        ).scalar()
+
+    print(f"{goals} goals, {len(db_rows)} OSE rows, snapshot {size / 1024:.0f} KiB, best of {rounds}")
+    print(f"{'load':<24}{'time':>12}")
+    for label, fn in (
+        ("ORM goals + OSE join", lambda s: _old_load(s, scheme_id)),
+        ("normalized, Core", lambda s: load_normalized(s, scheme_id)),
+        ("snapshot", lambda s: load_snapshot(s, scheme_id)),
+    ):
+        print(f"{label:<24}{_time(Session, fn, rounds) * 1000:>9.1f} ms")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    run(*(int(a) for a in sys.argv[1:4]))
@@ -0,0 +1,110 @@
+import sys
+import time
+
+from db.goal import GoalNode, serialize_tree, collect_goals
+
+
+N = 100_000
+
+
+def _old_serialize_tree(node):
+    data = [{
+        "id": node.id,
+        "name": node.name,
+        "parent": node.parent.id if node.parent else None,
+        "level": node.level,
+    }]
+    for ch in node.children:
+        data.extend(_old_serialize_tree(ch))
+    return data
+
+
+def _old_collect_goals(node):
+    items = [node]
+    for ch in node.children:
+        items.extend(_old_collect_goals(ch))
+    return items
+
+
+def build_wide(n: int, fanout: int = 10) -> GoalNode:
+    root = GoalNode("g0")
+    queue = [root]
+    made = 1
+    i = 0
+    while made < n:
+        parent = queue[i]
+        i += 1
+        for _ in range(fanout):
+            if made >= n:
+                break
+            queue.append(parent.add_child(f"g{made}"))
+            made += 1
+    return root
+
+
+def build_deep(n: int) -> GoalNode:
+    root = GoalNode("g0")
+    cur = root
+    for i in range(1, n):
+        cur = cur.add_child(f"g{i}")
+    return root
+
+
+def build_caterpillar(n: int, spine: int = 900) -> GoalNode:
+    # длинная цепочка, на каждом звене которой висят листья
+    root = GoalNode("g0")
+    cur = root
+    made = 1
+    leaves = max(1, n // spine - 1)
+    while made < n:
+        for _ in range(leaves):
+            if made >= n:
+                break
+            cur.add_child(f"g{made}")
+            made += 1
+        if made < n:
+            cur = cur.add_child(f"g{made}")
+            made += 1
+    return root
+
+
+def _time(fn, *args, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        try:
+            fn(*args)
+        except RecursionError:
+            return None
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def _fmt(t):
+    return "RecursionError" if t is None else f"{t * 1000:9.1f} ms"
+
+
+def run(n: int = N) -> None:
+    shapes = {
+        "wide (fanout 10)": build_wide(n),
+        "caterpillar (depth 900)": build_caterpillar(n),
+        "chain": build_deep(n),
+    }
+
+    print(f"{n} nodes, recursion limit {sys.getrecursionlimit()}")
+    print(f"{'tree':<26}{'op':<16}{'recursive':>16}{'iterative':>16}")
+    for label, root in shapes.items():
+        for op, old, new in (
+            ("serialize_tree", _old_serialize_tree, serialize_tree),
+            ("collect_goals", _old_collect_goals, collect_goals),
+        ):
+            t_old = _time(old, root)
+            t_new = _time(new, root)
+            print(f"{label:<26}{op:<16}{_fmt(t_old):>16}{_fmt(t_new):>16}")
+
+        assert len(serialize_tree(root)) == n
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else N)
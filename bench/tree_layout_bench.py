@@ -0,0 +1,37 @@
+import sys
+import time
+
+from bench.traversal_bench import build_caterpillar, build_deep, build_wide
+from core.tree_layout import tidy_layout
+from db.traversal import iter_preorder_depth
+
+
+N = 100_000
+
+
+def _check(root, pos) -> None:
+    # на каждом уровне узлы идут слева направо не ближе шага, родитель — над серединой детей
+    rows = {}
+    for n, d in iter_preorder_depth(root):
+        rows.setdefault(d, []).append(pos[n.id][0])
+        if n.children:
+            mid = (pos[n.children[0].id][0] + pos[n.children[-1].id][0]) / 2
+            assert abs(pos[n.id][0] - mid) < 1e-6, n.id
+    for xs in rows.values():
+        for a, b in zip(xs, xs[1:]):
+            assert b - a >= 1 - 1e-6, (a, b)
+
+
+def run(n: int = N) -> None:
+    print(f"{'tree':<14}{'nodes':>10}{'layout':>12}{'per node':>12}")
+    for label, build in (("wide", build_wide), ("deep", build_deep), ("caterpillar", build_caterpillar)):
+        root = build(n)
+        t0 = time.perf_counter()
+        pos = tidy_layout(root, 1.0, 1.0)
+        dt = time.perf_counter() - t0
+        _check(root, pos)
+        print(f"{label:<14}{n:>10}{dt * 1000:>9.0f} ms{dt / n * 1e6:>9.2f} us")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else N)
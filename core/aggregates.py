@@ -0,0 +1,123 @@
+from typing import Dict, List, Optional
+
+from db.goal import GoalIndex, GoalNode
+from db.traversal import iter_postorder, iter_preorder
+
+
+GOAL_SUM = "ΣH (по цели)"
+SUBTREE_SUM = "ΣH (по поддереву)"
+
+
+def _h(row: dict) -> float:
+    try:
+        return float(row.get("H", 0) or 0)
+    except Exception:
+        return 0.0
+
+
+class SubtreeSums:
+    # ΣH по цели и по поддереву, ключ — id цели; одна ячейка (цель, фактор)
+    # меняет суммы только у цели и её предков
+    __slots__ = ("cells", "own", "sub")
+
+    def __init__(self):
+        self.cells: Dict[int, Dict[str, float]] = {}
+        self.own: Dict[int, float] = {}
+        self.sub: Dict[int, float] = {}
+
+    def rebuild(self, rows: List[dict], goals: GoalIndex, root: Optional[GoalNode]) -> None:
+        self.cells = {}
+        self.own = {}
+        self.sub = {}
+
+        for r in rows or []:
+            gid = r.get("goal_id")
+            node = goals.get(int(gid)) if gid is not None else None
+            if node is None:
+                continue
+            h = _h(r)
+            cells = self.cells.setdefault(node.id, {})
+            factor = str(r.get("factor", ""))
+            self.own[node.id] = self.own.get(node.id, 0.0) + h - cells.get(factor, 0.0)
+            cells[factor] = h
+
+        for n in iter_postorder(root):
+            s = self.own.get(n.id, 0.0)
+            for ch in n.children:
+                s += self.sub.get(ch.id, 0.0)
+            self.sub[n.id] = s
+
+    def _propagate(self, node: Optional[GoalNode], delta: float) -> None:
+        sub = self.sub
+        while node is not None:
+            sub[node.id] = sub.get(node.id, 0.0) + delta
+            node = node.parent
+
+    def set_cell(self, node: GoalNode, factor: str, h: float) -> None:
+        cells = self.cells.setdefault(node.id, {})
+        delta = h - cells.get(factor, 0.0)
+        cells[factor] = h
+        self.own[node.id] = self.own.get(node.id, 0.0) + delta
+        if delta:
+            self._propagate(node, delta)
+
+    def remove_cell(self, node: GoalNode, factor: str) -> None:
+        cells = self.cells.get(node.id)
+        if not cells or factor not in cells:
+            return
+        h = cells.pop(factor)
+        if cells:
+            self.own[node.id] -= h
+        else:
+            del self.cells[node.id]
+            self.own.pop(node.id, None)
+        if h:
+            self._propagate(node, -h)
+
+    def remove_subtree(self, node: GoalNode) -> None:
+        # вызывать до того, как узел отцеплен от родителя
+        total = self.sub.get(node.id, 0.0)
+        if total:
+            self._propagate(node.parent, -total)
+        for n in iter_preorder(node):
+            self.cells.pop(n.id, None)
+            self.own.pop(n.id, None)
+            self.sub.pop(n.id, None)
+
+    def move_subtree(
+        self,
+        node: GoalNode,
+        old_parent: Optional[GoalNode],
+        new_parent: Optional[GoalNode],
+    ) -> None:
+        total = self.sub.get(node.id, 0.0)
+        if total:
+            self._propagate(old_parent, -total)
+            self._propagate(new_parent, total)
+
+    def clear(self) -> None:
+        self.cells = {}
+        self.own = {}
+        for k in self.sub:
+            self.sub[k] = 0.0
+
+    def rekey(self, ids: Dict[int, int]) -> None:
+        # старый id -> новый; сначала снимаются все старые ключи: временный id
+        # одной цели может совпасть с новым id другой
+        for d in (self.cells, self.own, self.sub):
+            moved = {new: d.pop(old) for old, new in ids.items() if old in d}
+            d.update(moved)
+
+    def summary_rows(self, goals: GoalIndex, root: Optional[GoalNode]) -> List[dict]:
+        out = []
+        for gid, s in self.own.items():
+            node = goals.get(gid)
+            if node is None:
+                continue
+            out.append({"goal": node.name, "factor": GOAL_SUM, "p": "", "q": "", "H": round(s, 4) + 0.0})
+
+        for n in iter_postorder(root):
+            s = self.sub.get(n.id, 0.0)
+            out.append({"goal": n.name, "factor": SUBTREE_SUM, "p": "", "q": "", "H": round(s, 4) + 0.0})
+
+        return out
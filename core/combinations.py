@@ -0,0 +1,69 @@
+from typing import Iterator, List, Sequence, Tuple
+
+
+class CombinationSpace:
+    # декартово произведение списков элементов без материализации:
+    # сочетание <-> номер в смешанной системе счисления, последний список — младший разряд
+    # (тот же порядок, что и при переборе по одному сочетанию в диалоге)
+    __slots__ = ("items", "radices", "total")
+
+    def __init__(self, items: Sequence[Sequence[str]]):
+        self.items = [list(x) for x in items]
+        self.radices = [len(x) for x in self.items]
+        total = 1 if self.items else 0
+        for r in self.radices:
+            total *= r
+        self.total = total
+
+    def __len__(self) -> int:
+        return self.total
+
+    def digits(self, index: int) -> List[int]:
+        if not 0 <= index < self.total:
+            raise IndexError(index)
+        out = [0] * len(self.radices)
+        for i in range(len(self.radices) - 1, -1, -1):
+            index, out[i] = divmod(index, self.radices[i])
+        return out
+
+    def index_of(self, digits: Sequence[int]) -> int:
+        index = 0
+        for d, r in zip(digits, self.radices):
+            index = index * r + d
+        return index
+
+    def at(self, index: int) -> List[str]:
+        return [self.items[i][d] for i, d in enumerate(self.digits(index))]
+
+    def iter_from(self, start: int = 0) -> Iterator[Tuple[int, List[str]]]:
+        if start >= self.total:
+            return
+        digits = self.digits(max(0, start))
+        index = max(0, start)
+        last = len(digits) - 1
+        while True:
+            yield index, [self.items[i][d] for i, d in enumerate(digits)]
+            index += 1
+            i = last
+            while i >= 0:
+                digits[i] += 1
+                if digits[i] < self.radices[i]:
+                    break
+                digits[i] = 0
+                i -= 1
+            if i < 0:
+                return
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, List[str]]]:
+        out = []
+        if limit <= 0:
+            return out
+        for item in self.iter_from(offset):
+            out.append(item)
+            if len(out) >= limit:
+                break
+        return out
+
+    def restrict(self, allowed: Sequence[Sequence[int]]) -> "CombinationSpace":
+        # подпространство: по каждому списку остаются только элементы с указанными позициями
+        return CombinationSpace([[self.items[i][d] for d in ds] for i, ds in enumerate(allowed)])
@@ -0,0 +1,66 @@
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+Builder = Callable[[re.Match], Optional[tuple]]
+
+_RULES = ""
+
+
+class CommandGrammar:
+    # разбор в два шага: точные фразы — поиском в словаре, остальное — по префиксному
+    # дереву ключевых слов до короткого списка заранее скомпилированных шаблонов
+    def __init__(self):
+        self._exact: Dict[str, List[Tuple[Optional[str], tuple]]] = {}
+        self._trie: dict = {}
+
+    def phrase(self, phrases: Iterable[str], result: tuple, state: Optional[str] = None) -> None:
+        for p in phrases:
+            self._exact.setdefault(p.lower(), []).append((state, result))
+
+    def pattern(
+        self,
+        prefixes: Iterable[str],
+        regexes: Iterable[str],
+        build: Builder,
+        state: Optional[str] = None,
+    ) -> None:
+        # шаблоны пробуются по порядку (сначала в кавычках, потом без)
+        compiled = [re.compile(r, re.IGNORECASE) for r in regexes]
+        for prefix in prefixes:
+            node = self._trie
+            for w in prefix.lower().split():
+                node = node.setdefault(w, {})
+            rules = node.setdefault(_RULES, [])
+            for rx in compiled:
+                rules.append((state, rx, build))
+
+    def parse(self, text: str, state: Optional[str] = None) -> Optional[tuple]:
+        s = text.strip()
+        low = s.lower()
+
+        for st, result in self._exact.get(low, ()):
+            if st is None or st == state:
+                return result
+
+        found = []
+        node = self._trie
+        for w in low.split():
+            node = node.get(w)
+            if node is None:
+                break
+            rules = node.get(_RULES)
+            if rules:
+                found.append(rules)
+
+        # самый длинный префикс первым
+        for rules in reversed(found):
+            for st, rx, build in rules:
+                if st is not None and st != state:
+                    continue
+                m = rx.match(s)
+                if m:
+                    cmd = build(m)
+                    if cmd is not None:
+                        return cmd
+        return None
@@ -0,0 +1,115 @@
+import secrets
+from typing import Dict, List, Optional, Tuple
+
+from core.schemas import DialogResponse
+from core.tree_layout import tidy_layout
+from db.goal import serialize_tree
+
+
+def initial_version() -> int:
+    # случайное начало, чтобы версия клиента от чужого/старого диалога не совпала с нашей
+    return secrets.randbelow(2 ** 31) + 1
+
+
+def _tree_key(n: dict) -> str:
+    return str(n["id"])
+
+
+def _tree_val(n: dict) -> list:
+    return [n["name"], n["parent"], n["level"], n["x"], n["y"]]
+
+
+def _place(tree: List[dict], root, sent: Dict[str, list]) -> None:
+    # координаты для preset-раскладки графа едут в самом дереве: в патч попадают узлы,
+    # которые сдвинулись. Структура не менялась — координаты прежние, без пересчёта
+    same = len(tree) == len(sent)
+    for n in tree if same else ():
+        v = sent.get(_tree_key(n))
+        if v is None or len(v) != 5 or v[:3] != [n["name"], n["parent"], n["level"]]:
+            same = False
+            break
+    if same:
+        for n in tree:
+            n["x"], n["y"] = sent[_tree_key(n)][3:]
+        return
+    pos = tidy_layout(root)
+    for n in tree:
+        x, y = pos[n["id"]]
+        n["x"], n["y"] = round(x, 1), round(y, 1)
+
+
+def _ose_key(r: dict) -> str:
+    return f"{r.get('goal', '')}\x1f{r.get('factor', '')}"
+
+
+def _ose_val(r: dict) -> list:
+    return [r.get("p"), r.get("q"), r.get("H")]
+
+
+def _diff(
+    prev: Dict[str, list],
+    version: int,
+    items: List[dict],
+    key,
+    val,
+    client_version: Optional[int],
+) -> Tuple[Dict[str, list], int, Optional[dict]]:
+    cur: Dict[str, list] = {}
+    upsert: List[dict] = []
+    for it in items:
+        k = key(it)
+        v = val(it)
+        cur[k] = v
+        if prev.get(k) != v:
+            upsert.append(it)
+    removed = [k for k in prev if k not in cur]
+
+    new_version = version + 1 if (upsert or removed) else version
+    if client_version is None or client_version != version:
+        return cur, new_version, None
+    return cur, new_version, {"base": version, "upsert": upsert, "remove": removed}
+
+
+def finalize_response(
+    resp: DialogResponse,
+    state,
+    tree_version: Optional[int] = None,
+    ose_version: Optional[int] = None,
+) -> DialogResponse:
+    tree = serialize_tree(state.root) if state.root else []
+    _place(tree, state.root, state.sent_tree)
+    ose = list(state.factors_results or [])
+
+    state.sent_tree, state.tree_version, tree_patch = _diff(
+        state.sent_tree, state.tree_version, tree, _tree_key, _tree_val, tree_version,
+    )
+    state.sent_ose, state.ose_version, ose_patch = _diff(
+        state.sent_ose, state.ose_version, ose, _ose_key, _ose_val, ose_version,
+    )
+
+    resp.tree_version = state.tree_version
+    resp.ose_version = state.ose_version
+
+    if tree_version is None and ose_version is None:
+        # полный ответ; обработчик, явно отдавший [], дерево не показывает
+        if resp.tree is None:
+            resp.tree = tree
+        return resp
+
+    if tree_patch is not None:
+        resp.tree = []
+        resp.tree_patch = tree_patch
+    else:
+        resp.tree = tree
+
+    if ose_patch is not None:
+        resp.ose_results = []
+        resp.ose_patch = {
+            "base": ose_patch["base"],
+            "upsert": ose_patch["upsert"],
+            "remove": [k.split("\x1f", 1) for k in ose_patch["remove"]],
+        }
+    else:
+        resp.ose_results = ose
+
+    return resp
@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+from core.dialog_state import DialogState
+
+
+MAX_SESSIONS = int(os.getenv("DIALOG_MAX_SESSIONS", "500"))
+IDLE_TTL = float(os.getenv("DIALOG_IDLE_TTL", "3600"))
+MAX_COST = int(os.getenv("DIALOG_MAX_COST", "2000000"))
+
+
+def _state_cost(state: DialogState) -> int:
+    # грубая оценка памяти сессии: число целей, строк ОСЭ и элементов классификаторов
+    cost = 1
+    cost += len(getattr(state, "goals", None) or ())
+    cost += len(getattr(state, "factors_results", None) or [])
+    cost += sum(len(x) for x in getattr(state, "clf_combo_items", None) or [])
+    return cost
+
+
+class _Entry:
+    __slots__ = ("state", "last_seen", "cost")
+
+    def __init__(self, state: DialogState):
+        self.state = state
+        self.last_seen = time.monotonic()
+        self.cost = _state_cost(state)
+
+
+class DialogSessionManager:
+    # load() отдаёт сам объект из памяти: изменения неудачного запроса остаются в нём,
+    # пока их не откатить по снимку (см. main.py)
+    live_states = True
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        idle_ttl: float = IDLE_TTL,
+        max_cost: int = MAX_COST,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_cost = max_cost
+
+        self._items: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._total_cost = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def load(self, token: str) -> Tuple[DialogState, int]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+
+            entry = self._items.get(token)
+            if entry is None:
+                entry = _Entry(DialogState())
+                self._items[token] = entry
+                self._total_cost += entry.cost
+                self._evict_over_cap(keep=token)
+            else:
+                self._items.move_to_end(token)
+
+            entry.last_seen = now
+            return entry.state, 0
+
+    def save(self, token: str, state: DialogState, version: int) -> int:
+        # состояние и так живёт в памяти процесса — только пересчитываем его вес
+        with self._lock:
+            entry = self._items.get(token)
+            if entry is None:
+                return version
+            cost = _state_cost(state)
+            self._total_cost += cost - entry.cost
+            entry.cost = cost
+            entry.last_seen = time.monotonic()
+            self._evict_over_cap(keep=token)
+            return version
+
+    @contextmanager
+    def saving(self, token: str, state: DialogState, version: int) -> Iterator[int]:
+        # конфликтов версий здесь не бывает: пересчёт веса — после успешного тела with
+        yield version
+        self.save(token, state, version)
+
+    def discard(self, token: str) -> None:
+        with self._lock:
+            entry = self._items.pop(token, None)
+            if entry is not None:
+                self._total_cost -= entry.cost
+
+    def _evict_idle(self, now: float) -> None:
+        while self._items:
+            token, entry = next(iter(self._items.items()))
+            if now - entry.last_seen < self.idle_ttl:
+                break
+            self._items.popitem(last=False)
+            self._total_cost -= entry.cost
+
+    def _evict_over_cap(self, keep: str) -> None:
+        while len(self._items) > 1 and (
+            len(self._items) > self.max_sessions or self._total_cost > self.max_cost
+        ):
+            token, entry = next(iter(self._items.items()))
+            if token == keep:
+                self._items.move_to_end(token)
+                continue
+            self._items.popitem(last=False)
+            self._total_cost -= entry.cost
+
@@ -1,4 +1,11 @@
-from db.goal import GoalNode
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Iterator, Optional
+
+from db.goal import GoalIndex
+from core.aggregates import SubtreeSums
+from core.delta import initial_version
+from core.ose_store import OseStore
 
 
 class DialogState:
@@ -12,24 +19,27 @@ class DialogState:
         self.max_level = 15
         self.max_cls = 4
 
-        self.used_names = set()
-        self.goal_by_name = {}
+        self.goals = GoalIndex()
 
         self.current_factor_name = None
         self._ose_goal = None
         self._p = None
         self._q = None
         self.factors_results = []
+        self.ose_store = OseStore()
+        self.sums = SubtreeSums()
         self.ose_goals = []
         self.ose_goal_idx = 0
         self.factor_set = set()
 
         self.clfs = []
         self.clf_tmp_name = None
-        self.clf_indices = None
+        self.clf_index = None
         self.clf_level = 1
         self.clf_parent_goal = None
         self.clf_done = False
+        self.clf_combo_items = []
+        self.clf_combo_idx = 0
 
         self.prev_state = None
         self.edit_goal_target = None
@@ -41,5 +51,85 @@ class DialogState:
         self.add_goal_current_factor = None
         self.add_goal_tmp_p = None
 
+        self.sent_tree = {}
+        self.sent_ose = {}
+        self.tree_version = initial_version()
+        self.ose_version = initial_version()
+
+    def reset(self):
+        # номера версий продолжаются, чтобы патч не применился к снимку прошлого диалога
+        tree_version, ose_version = self.tree_version, self.ose_version
+        self.__init__()
+        self.tree_version = tree_version + 1
+        self.ose_version = ose_version + 1
+
+
+class DialogHandle:
+    # состояние сессии загружается из хранилища только при первом обращении к `dialog`
+    __slots__ = ("token", "state", "version", "saved", "snapshot", "_store")
+
+    def __init__(self, token: str, store):
+        self.token = token
+        self.state: Optional[DialogState] = None
+        self.version = 0
+        # сохранено (или намеренно не сохраняется) вместе с коммитом БД, см. main.py
+        self.saved = False
+        # состояние до запроса (serialize_state) — для отката вместе с БД
+        self.snapshot: Optional[bytes] = None
+        self._store = store
+
+    @property
+    def loaded(self) -> bool:
+        return self.state is not None
+
+    def get(self) -> DialogState:
+        if self.state is None:
+            self.state, self.version = self._store.load(self.token)
+        return self.state
+
+    @contextmanager
+    def saving(self) -> Iterator[None]:
+        with self._store.saving(self.token, self.state, self.version) as version:
+            yield
+        self.version = version
+        self.saved = True
+
+    def save(self) -> None:
+        self.version = self._store.save(self.token, self.state, self.version)
+        self.saved = True
+
+
+_default_dialog = DialogState()
+_current_dialog: ContextVar[Optional[DialogHandle]] = ContextVar("current_dialog", default=None)
+
+
+def bind_dialog(handle: DialogHandle) -> Token:
+    return _current_dialog.set(handle)
+
+
+def unbind_dialog(token: Token) -> None:
+    _current_dialog.reset(token)
+
+
+def current_handle() -> Optional[DialogHandle]:
+    return _current_dialog.get()
+
+
+def current_dialog() -> DialogState:
+    handle = _current_dialog.get()
+    return handle.get() if handle is not None else _default_dialog
+
+
+class _DialogProxy:
+    # обработчики работают с `dialog` как с одним объектом, а на деле
+    # каждый запрос видит DialogState своей сессии (см. core.dialog_store)
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        return getattr(current_dialog(), name)
+
+    def __setattr__(self, name, value):
+        setattr(current_dialog(), name, value)
+
 
-dialog = DialogState()
+dialog = _DialogProxy()
@@ -0,0 +1,206 @@
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from db.goal import GoalNode, collect_goals
+from core.combinations import CombinationSpace
+from core.dialog_state import DialogState
+from core.dialog_sessions import DialogSessionManager, IDLE_TTL
+from core.ose_store import OseStore
+
+
+SESSION_COOKIE = "pf_session"
+SESSION_HEADER = "X-Dialog-Session"
+
+_TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+# производные поля — восстанавливаются по дереву при загрузке
+_DERIVED = {"goals", "sums"}
+
+
+class DialogConflict(Exception):
+    pass
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def valid_token(token: Optional[str]) -> bool:
+    return bool(token) and bool(_TOKEN_RE.match(token))
+
+
+def _encode(v):
+    if isinstance(v, GoalNode):
+        return {"$n": v.id}
+    if isinstance(v, OseStore):
+        return {"$ose": v.dump()}
+    if isinstance(v, (set, frozenset)):
+        return {"$set": [_encode(x) for x in v]}
+    if isinstance(v, (list, tuple)):
+        return [_encode(x) for x in v]
+    if isinstance(v, dict):
+        return {str(k): _encode(x) for k, x in v.items()}
+    return v
+
+
+def _decode(v, nodes: Dict[int, GoalNode]):
+    if isinstance(v, list):
+        return [_decode(x, nodes) for x in v]
+    if isinstance(v, dict):
+        if "$n" in v and len(v) == 1:
+            return nodes.get(v["$n"])
+        if "$set" in v and len(v) == 1:
+            return set(_decode(x, nodes) for x in v["$set"])
+        if "$ose" in v and len(v) == 1:
+            return OseStore.restore(v["$ose"], nodes)
+        return {k: _decode(x, nodes) for k, x in v.items()}
+    return v
+
+
+def serialize_state(state: DialogState) -> bytes:
+    tree = []
+    if state.root is not None:
+        for n in collect_goals(state.root):
+            tree.append([n.id, n.parent.id if n.parent else None, n.name])
+
+    fields = {
+        k: _encode(v)
+        for k, v in vars(state).items()
+        if k not in _DERIVED and k != "root"
+    }
+    raw = json.dumps({"tree": tree, "fields": fields}, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(raw.encode("utf-8"), 6)
+
+
+def deserialize_state(data: bytes) -> DialogState:
+    payload = json.loads(zlib.decompress(data).decode("utf-8"))
+
+    state = DialogState()
+    nodes: Dict[int, GoalNode] = {}
+    for gid, parent_id, name in payload.get("tree") or []:
+        parent = nodes.get(parent_id) if parent_id is not None else None
+        node = parent.add_child(name) if parent else GoalNode(name)
+        node.id = gid
+        nodes[gid] = node
+        if parent is None and state.root is None:
+            state.root = node
+
+    if nodes:
+        GoalNode._id_counter = max(GoalNode._id_counter, max(nodes) + 1)
+
+    for k, v in (payload.get("fields") or {}).items():
+        setattr(state, k, _decode(v, nodes))
+
+    # сессия, сохранённая до перехода на номер сочетания: позиции по каждому классификатору
+    indices = vars(state).pop("clf_indices", None)
+    if indices is not None:
+        state.clf_index = CombinationSpace([c["items"] for c in state.clfs]).index_of(indices)
+
+    state.goals.rebuild(state.root)
+    state.sums.rebuild(state.ose_store.rows(), state.goals, state.root)
+
+    return state
+
+
+def restore_state(state: DialogState, data: bytes) -> None:
+    # на месте: хранилище в памяти и обработчики держат ссылку на этот объект
+    restored = deserialize_state(data)
+    vars(state).clear()
+    vars(state).update(vars(restored))
+
+
+class SqliteDialogStore:
+    # load() каждый раз собирает новый объект: неудачный запрос просто не сохраняется
+    live_states = False
+
+    def __init__(self, path: str, idle_ttl: float = IDLE_TTL):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self._local = threading.local()
+        self._last_vacuum = 0.0
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS dialog_sessions ("
+            " token TEXT PRIMARY KEY,"
+            " version INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " data BLOB NOT NULL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, token: str) -> Tuple[DialogState, int]:
+        row = self._conn().execute(
+            "SELECT version, data FROM dialog_sessions WHERE token = ?",
+            (token,),
+        ).fetchone()
+        if row is None:
+            return DialogState(), 0
+        return deserialize_state(row[1]), row[0]
+
+    @contextmanager
+    def saving(self, token: str, state: DialogState, version: int) -> Iterator[int]:
+        # версия проверяется и строка пишется в открытой транзакции, фиксируется она
+        # после тела with: туда main.py кладёт коммит БД, и конфликт не оставляет
+        # в БД изменений, которых нет в сохранённом диалоге
+        conn = self._conn()
+        data = serialize_state(state)
+        now = time.time()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version == 0:
+                cur = conn.execute(
+                    "INSERT INTO dialog_sessions (token, version, updated_at, data) VALUES (?, 1, ?, ?)"
+                    " ON CONFLICT(token) DO NOTHING",
+                    (token, now, data),
+                )
+            else:
+                cur = conn.execute(
+                    "UPDATE dialog_sessions SET version = version + 1, updated_at = ?, data = ?"
+                    " WHERE token = ? AND version = ?",
+                    (now, data, token, version),
+                )
+            if cur.rowcount != 1:
+                raise DialogConflict(token)
+            yield version + 1
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+        if now - self._last_vacuum > 60:
+            self._last_vacuum = now
+            conn.execute("DELETE FROM dialog_sessions WHERE updated_at < ?", (now - self.idle_ttl,))
+
+    def save(self, token: str, state: DialogState, version: int) -> int:
+        with self.saving(token, state, version) as new_version:
+            pass
+        return new_version
+
+
+def _make_store():
+    kind = os.getenv("DIALOG_STORE", "memory").strip().lower()
+    if kind == "sqlite":
+        return SqliteDialogStore(os.getenv("DIALOG_STORE_PATH", "./dialog_sessions.db"))
+    return DialogSessionManager()
+
+
+dialog_store = _make_store()
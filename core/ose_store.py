@@ -0,0 +1,116 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from db.goals import apply_ose_changes
+
+
+# (id цели, фактор); имя цели в строке — только для отображения
+OseKey = Tuple[int, str]
+
+
+class OseStore:
+    def __init__(self):
+        self._rows: Dict[OseKey, dict] = {}
+        self._dirty: Set[OseKey] = set()
+        # факторы, удаляемые целиком: их строки в БД уходят каскадом
+        self._dropped: Set[str] = set()
+        self._cleared = False
+
+    @staticmethod
+    def _key(row: dict) -> OseKey:
+        return (int(row["goal_id"]), str(row.get("factor", "")))
+
+    def load(self, rows: List[dict]) -> None:
+        self._rows = {self._key(r): dict(r) for r in rows or []}
+        self._dirty = set()
+        self._dropped = set()
+        self._cleared = False
+
+    def dump(self) -> list:
+        return [self.rows(), sorted(self._dirty), sorted(self._dropped), self._cleared]
+
+    @classmethod
+    def restore(cls, data: list, nodes: Optional[dict] = None) -> "OseStore":
+        rows, dirty = data[0], data[1]
+        if len(data) == 3:
+            # снимок до перехода на goal_id: изменения в нём всегда уже сброшены в БД
+            by_name = {n.name: n.id for n in (nodes or {}).values()}
+            rows = [{**r, "goal_id": by_name[r["goal"]]} for r in rows if r.get("goal") in by_name]
+            dirty, dropped, cleared = [], [], False
+        else:
+            dropped, cleared = data[2], data[3]
+        store = cls()
+        store.load(rows)
+        store._dirty = {(int(g), f) for g, f in dirty}
+        store._dropped = set(dropped)
+        store._cleared = bool(cleared)
+        return store
+
+    def rows(self) -> List[dict]:
+        return list(self._rows.values())
+
+    def put(self, row: dict) -> None:
+        key = self._key(row)
+        if self._rows.get(key) == row:
+            return
+        self._rows[key] = dict(row)
+        self._dirty.add(key)
+
+    def _pop(self, keys: Iterable[OseKey]) -> List[dict]:
+        removed = []
+        for k in list(keys):
+            removed.append(self._rows.pop(k))
+            self._dirty.discard(k)
+        return removed
+
+    def rename_goal(self, goal_id: int, new: str) -> None:
+        # в БД строки ссылаются на цель по id — переписывать нечего
+        for (gid, _f), row in self._rows.items():
+            if gid == goal_id:
+                row["goal"] = new
+
+    def rekey_goals(self, ids: Dict[int, int]) -> None:
+        # старый id цели -> новый: один проход по строкам, а не проход на каждую цель
+        if not ids:
+            return
+        rows: Dict[OseKey, dict] = {}
+        for (gid, factor), row in self._rows.items():
+            if gid in ids:
+                gid = row["goal_id"] = ids[gid]
+            rows[(gid, factor)] = row
+        self._rows = rows
+        self._dirty = {(ids.get(gid, gid), factor) for gid, factor in self._dirty}
+
+    def forget_goals(self, goal_ids: Set[int]) -> List[dict]:
+        # цели удаляются из БД вместе со своими строками ОСЭ
+        return self._pop(k for k in self._rows if k[0] in goal_ids)
+
+    def drop_factor(self, name: str) -> List[dict]:
+        low = name.strip().lower()
+        removed = self._pop(k for k in self._rows if k[1].lower() == low)
+        self._dropped.update(r["factor"] for r in removed)
+        return removed
+
+    def clear(self) -> None:
+        self._rows = {}
+        self._dirty = set()
+        self._dropped = set()
+        self._cleared = True
+
+    def has_changes(self) -> bool:
+        return bool(self._dirty or self._dropped or self._cleared)
+
+    def flush(self, session: Session, scheme_id: int) -> None:
+        if not self.has_changes():
+            return
+        apply_ose_changes(
+            session,
+            scheme_id,
+            [self._rows[k] for k in self._dirty],
+            sorted(self._dropped),
+            clear=self._cleared,
+        )
+        self._dirty = set()
+        self._dropped = set()
+        self._cleared = False
@@ -1,15 +1,75 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 from pydantic import BaseModel
 
 
 class AnswerRequest(BaseModel):
     answer: str
+    tree_version: Optional[int] = None
+    ose_version: Optional[int] = None
 
 
 class DialogResponse(BaseModel):
     phase: str
     state: str
     question: str
-    tree: List[Dict]
+    # None — дерево (с координатами) подставит finalize_response из состояния диалога
+    tree: Optional[List[Dict]] = None
     ose_results: List[Dict] = []
     message: Optional[str] = None
+    tree_version: Optional[int] = None
+    ose_version: Optional[int] = None
+    tree_patch: Optional[Dict] = None
+    ose_patch: Optional[Dict] = None
+
+
+class OseMatrixRequest(BaseModel):
+    goals: List[Union[int, str]]
+    factors: List[str]
+    p: List[List[Optional[float]]]
+    q: List[List[Optional[float]]]
+
+
+class OseCellRange(BaseModel):
+    goal: Union[int, str]
+    factor: str
+    # [min, max] или [min, наиболее вероятное, max]
+    p: Optional[List[float]] = None
+    q: Optional[List[float]] = None
+
+
+class OseSensitivityRequest(BaseModel):
+    cells: List[OseCellRange] = []
+    spread: float = 0.0
+    distribution: str = "uniform"
+    samples: Optional[int] = None
+    workers: Optional[int] = None
+    time_limit: Optional[float] = None
+    seed: Optional[int] = None
+    level: float = 0.9
+    top: int = 3
+
+
+class ClfComboRule(BaseModel):
+    # классификатор — по названию или по номеру (с 0) в порядке ввода
+    classifier: Union[int, str]
+    include: Optional[List[str]] = None
+    exclude: List[str] = []
+
+
+class ClfComboDecideRequest(BaseModel):
+    # all — включить все сочетания, none — ни одного, rules — по правилам
+    mode: str = "rules"
+    parent: Optional[Union[int, str]] = None
+    rules: List[ClfComboRule] = []
+
+
+class CommandBatchRequest(BaseModel):
+    commands: List[str]
+    tree_version: Optional[int] = None
+    ose_version: Optional[int] = None
+
+
+class CommandBatchResponse(BaseModel):
+    ok: bool
+    results: List[Dict]
+    dialog: DialogResponse
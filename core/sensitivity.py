@@ -0,0 +1,214 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+# модуль без зависимостей от приложения: его импортируют процессы-воркеры (spawn)
+MAX_WORKERS = int(os.getenv("OSE_MC_WORKERS", str(os.cpu_count() or 1)))
+MAX_SAMPLES = int(os.getenv("OSE_MC_MAX_SAMPLES", "20000"))
+DEFAULT_SAMPLES = int(os.getenv("OSE_MC_SAMPLES", "2000"))
+TIME_LIMIT = float(os.getenv("OSE_MC_TIME_LIMIT", "20"))
+# ограничение памяти: цели × сэмплы (на каждую пару ~24 байта результатов)
+MAX_GOAL_SAMPLES = int(os.getenv("OSE_MC_MAX_GOAL_SAMPLES", "5000000"))
+CHUNK = int(os.getenv("OSE_MC_CHUNK", "250"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def calculate_ose_matrix(p: np.ndarray, q: np.ndarray) -> np.ndarray:
+    # то же, что calculate_ose, но сразу для всей матрицы:
+    # p <= 0, q <= 0 и p >= 1 дают H = 0
+    h = np.zeros(np.broadcast(p, q).shape, dtype=float)
+    ok = (p > 0) & (q > 0) & (p < 1)
+    h[ok] = -q[ok] * np.log(1 - p[ok])
+    return h
+
+
+class TreeCells:
+    # дерево в постфиксном порядке (дети раньше родителя) и ячейки ОСЭ с диапазонами;
+    # ячейки отсортированы по цели, чтобы суммировать их через reduceat
+    def __init__(
+        self,
+        parent: List[int],
+        cell_goal: List[int],
+        p: Tuple[List[float], List[float], List[float]],
+        q: Tuple[List[float], List[float], List[float]],
+    ):
+        order = np.argsort(np.asarray(cell_goal, dtype=np.int64), kind="stable")
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self.cell_goal = np.asarray(cell_goal, dtype=np.int64)[order]
+        self.p = tuple(np.clip(np.asarray(a, dtype=float)[order], 0.0, 1.0) for a in p)
+        self.q = tuple(np.clip(np.asarray(a, dtype=float)[order], 0.0, 1.0) for a in q)
+
+        self.goals_with_cells, self.starts = np.unique(self.cell_goal, return_index=True)
+
+    @property
+    def n_goals(self) -> int:
+        return len(self.parent)
+
+    def sums(self, h: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # h: сэмплы × ячейки -> (ΣH по цели, ΣH по поддереву), оба цели × сэмплы
+        own = np.zeros((self.n_goals, h.shape[0]))
+        if h.shape[1]:
+            own[self.goals_with_cells] = np.add.reduceat(h, self.starts, axis=1).T
+        sub = own.copy()
+        for i, par in enumerate(self.parent):
+            if par >= 0:
+                sub[par] += sub[i]
+        return own, sub
+
+
+def _draw(rng: np.random.Generator, n: int, lo: np.ndarray, mode: np.ndarray, hi: np.ndarray, dist: str) -> np.ndarray:
+    fixed = hi <= lo
+    hi = np.where(fixed, lo + 1e-12, hi)
+    if dist == "triangular":
+        mode = np.clip(mode, lo, hi)
+        x = rng.triangular(lo, mode, hi, size=(n, len(lo)))
+    else:
+        x = rng.uniform(lo, hi, size=(n, len(lo)))
+    return np.where(fixed, lo, x)
+
+
+def ranks(values: np.ndarray) -> np.ndarray:
+    # места целей (1 — наибольшая ΣH) по каждому сэмплу; values: цели × сэмплы
+    order = np.argsort(-values, axis=0, kind="stable")
+    out = np.empty(values.shape, dtype=np.int32)
+    places = np.arange(1, values.shape[0] + 1, dtype=np.int32)[:, None]
+    np.put_along_axis(out, order, np.broadcast_to(places, values.shape), axis=0)
+    return out
+
+
+def simulate_chunk(task) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    cells, seed, n, dist = task
+    rng = np.random.default_rng(seed)
+    p = _draw(rng, n, *cells.p, dist)
+    q = _draw(rng, n, *cells.q, dist)
+    own, sub = cells.sums(calculate_ose_matrix(p, q))
+    return own.astype(np.float32), sub.astype(np.float32), ranks(own), ranks(sub)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: сервер многопоточный, fork из потока может унаследовать захваченные блокировки
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def run_samples(
+    cells: TreeCells,
+    samples: int,
+    workers: int,
+    time_limit: float,
+    seed: Optional[int] = None,
+    dist: str = "uniform",
+) -> Tuple[List[tuple], bool]:
+    # куски фиксированного размера: при одном seed результат не зависит от числа воркеров;
+    # по истечении времени берём готовые куски, остальные отменяем
+    n_chunks = max(1, -(-samples // CHUNK))
+    base, extra = divmod(samples, n_chunks)
+    sizes = [base + (1 if i < extra else 0) for i in range(n_chunks)]
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    tasks = [(cells, s, n, dist) for s, n in zip(seeds, sizes) if n]
+
+    deadline = time.monotonic() + time_limit
+    if workers <= 1:
+        done = []
+        for t in tasks:
+            if done and time.monotonic() > deadline:
+                return done, True
+            done.append(simulate_chunk(t))
+        return done, False
+
+    pool = _get_pool()
+    pending = {pool.submit(simulate_chunk, t) for t in tasks}
+    done = []
+    while pending:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            break
+        finished, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+        done.extend(f.result() for f in finished)
+    for f in pending:
+        f.cancel()
+    return done, bool(pending)
+
+
+def _spearman(r: np.ndarray, base: np.ndarray) -> np.ndarray:
+    g = r.shape[0]
+    if g < 2:
+        return np.ones(r.shape[1])
+    d = (r - base[:, None]).astype(np.float64)
+    return 1 - 6 * (d * d).sum(axis=0) / (g * (g * g - 1))
+
+
+def _r(x) -> float:
+    return round(float(x), 6) + 0.0
+
+
+def summarize(
+    chunks: List[tuple],
+    base_own: np.ndarray,
+    base_sub: np.ndarray,
+    level: float,
+    top: int,
+) -> Tuple[List[dict], dict]:
+    own = np.concatenate([c[0] for c in chunks], axis=1)
+    sub = np.concatenate([c[1] for c in chunks], axis=1)
+    own_rank = np.concatenate([c[2] for c in chunks], axis=1)
+    sub_rank = np.concatenate([c[3] for c in chunks], axis=1)
+
+    base_own_rank = ranks(base_own[:, None])[:, 0]
+    base_sub_rank = ranks(base_sub[:, None])[:, 0]
+    qs = [(1 - level) / 2, 0.5, (1 + level) / 2]
+
+    def stats(vals, rk, base_v, base_rk, i):
+        lo, med, hi = np.quantile(vals[i], qs)
+        r_lo, r_hi = np.quantile(rk[i], [qs[0], qs[2]])
+        return {
+            "base": _r(base_v[i]),
+            "mean": _r(vals[i].mean()),
+            "std": _r(vals[i].std()),
+            "median": _r(med),
+            "ci": [_r(lo), _r(hi)],
+            "rank": int(base_rk[i]),
+            "rank_mean": _r(rk[i].mean()),
+            "rank_ci": [int(math.floor(r_lo)), int(math.ceil(r_hi))],
+            "p_same_rank": _r((rk[i] == base_rk[i]).mean()),
+            "p_top": _r((rk[i] <= top).mean()),
+        }
+
+    per_goal = [
+        {
+            "goal": stats(own, own_rank, base_own, base_own_rank, i),
+            "subtree": stats(sub, sub_rank, base_sub, base_sub_rank, i),
+        }
+        for i in range(own.shape[0])
+    ]
+
+    overall = {}
+    for name, rk, base_rk in (("goal", own_rank, base_own_rank), ("subtree", sub_rank, base_sub_rank)):
+        rho = _spearman(rk, base_rk)
+        overall[name] = {
+            "spearman_mean": _r(rho.mean()),
+            "spearman_min": _r(rho.min()),
+            "spearman_ci": [_r(x) for x in np.quantile(rho, [qs[0], qs[2]])],
+            "p_same_order": _r((rk == base_rk[:, None]).all(axis=0).mean()),
+        }
+    return per_goal, overall
@@ -0,0 +1,124 @@
+from typing import Dict, List, Optional, Tuple
+
+from db.goal import GoalNode
+from db.traversal import iter_preorder
+
+
+# шаг между соседними узлами одного уровня и между уровнями, px
+X_STEP = 180.0
+Y_STEP = 110.0
+
+Positions = Dict[int, Tuple[float, float]]
+
+
+def tidy_layout(root: Optional[GoalNode], x_step: float = X_STEP, y_step: float = Y_STEP) -> Positions:
+    # Уокер в линейной версии Бухгейма — Юнгера — Лейперта: поддерево сдвигается
+    # вправо ровно настолько, чтобы не задеть левых соседей, родитель стоит над
+    # серединой детей. Контуры поддеревьев — через нити (thread), сдвиги копятся в mod
+    # и раздаются вторым проходом. Без рекурсии: глубина дерева не упирается в стек.
+    nodes = list(iter_preorder(root))
+    n = len(nodes)
+    if not n:
+        return {}
+
+    index = {id(node): i for i, node in enumerate(nodes)}
+    kids: List[List[int]] = [[index[id(c)] for c in node.children] for node in nodes]
+    parent = [-1] * n
+    number = [0] * n
+    for v, ch in enumerate(kids):
+        for k, c in enumerate(ch):
+            parent[c] = v
+            number[c] = k
+
+    prelim = [0.0] * n
+    mod = [0.0] * n
+    shift = [0.0] * n
+    change = [0.0] * n
+    mid = [0.0] * n
+    thread = [-1] * n
+    ancestor = list(range(n))
+
+    def next_left(v: int) -> int:
+        return kids[v][0] if kids[v] else thread[v]
+
+    def next_right(v: int) -> int:
+        return kids[v][-1] if kids[v] else thread[v]
+
+    def apportion(v: int, default_ancestor: int) -> int:
+        k = number[v]
+        if k == 0:
+            return default_ancestor
+        siblings = kids[parent[v]]
+        # vi* — внутренние контуры (правый у левого леса, левый у v), vo* — внешние
+        vir = vor = v
+        vil = siblings[k - 1]
+        vol = siblings[0]
+        sir, sor, sil, sol = mod[vir], mod[vor], mod[vil], mod[vol]
+        nr, nl = next_right(vil), next_left(vir)
+        while nr >= 0 and nl >= 0:
+            vil, vir = nr, nl
+            vol, vor = next_left(vol), next_right(vor)
+            ancestor[vor] = v
+            s = (prelim[vil] + sil) - (prelim[vir] + sir) + 1.0
+            if s > 0:
+                a = ancestor[vil]
+                wl = a if parent[a] == parent[v] else default_ancestor
+                # сдвиг v и равномерное раздвигание поддеревьев между wl и v
+                part = s / (number[v] - number[wl])
+                change[v] -= part
+                change[wl] += part
+                shift[v] += s
+                prelim[v] += s
+                mod[v] += s
+                sir += s
+                sor += s
+            sil += mod[vil]
+            sir += mod[vir]
+            sol += mod[vol]
+            sor += mod[vor]
+            nr, nl = next_right(vil), next_left(vir)
+        if nr >= 0 and next_right(vor) < 0:
+            thread[vor] = nr
+            mod[vor] += sil - sor
+        if nl >= 0 and next_left(vol) < 0:
+            thread[vol] = nl
+            mod[vol] += sir - sol
+            default_ancestor = v
+        return default_ancestor
+
+    # обратный прямой порядок: поддеревья детей готовы раньше родителя
+    for v in range(n - 1, -1, -1):
+        ch = kids[v]
+        if not ch:
+            continue
+        default_ancestor = ch[0]
+        for k, w in enumerate(ch):
+            if k:
+                prelim[w] = prelim[ch[k - 1]] + 1.0
+                if kids[w]:
+                    mod[w] = prelim[w] - mid[w]
+            else:
+                prelim[w] = mid[w]
+            default_ancestor = apportion(w, default_ancestor)
+
+        s = c = 0.0
+        for w in reversed(ch):
+            prelim[w] += s
+            mod[w] += s
+            c += change[w]
+            s += shift[w] + c
+        mid[v] = (prelim[ch[0]] + prelim[ch[-1]]) / 2
+    prelim[0] = mid[0]
+
+    xs = [0.0] * n
+    acc = [0.0] * n
+    depth = [0] * n
+    for v in range(n):
+        p = parent[v]
+        if p >= 0:
+            acc[v] = acc[p] + mod[p]
+            depth[v] = depth[p] + 1
+        xs[v] = prelim[v] + acc[v]
+
+    left = min(xs)
+    return {nodes[v].id: ((xs[v] - left) * x_step, depth[v] * y_step) for v in range(n)}
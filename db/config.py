@@ -0,0 +1,83 @@
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session
+
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./planfactor.db")
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+ECHO = os.getenv("DB_ECHO", "0") == "1"
+
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SYNCHRONOUS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def _sqlite_pragmas(dbapi_conn, _record) -> None:
+    # WAL: читатели не ждут писателя, а коммит не делает fsync журнала на каждую транзакцию
+    # (при synchronous=NORMAL синхронизация — только на checkpoint);
+    # busy_timeout: писатель ждёт блокировку вместо мгновенного "database is locked".
+    # Транзакцию pysqlite открывает сам перед первым INSERT/UPDATE/DELETE, поэтому
+    # блокировка на запись берётся сразу и busy_timeout для неё работает
+    cur = dbapi_conn.cursor()
+    try:
+        cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    finally:
+        cur.close()
+
+
+def _sqlite_foreign_keys(dbapi_conn, _record) -> None:
+    # без этого SQLite не проверяет внешние ключи и не выполняет ON DELETE CASCADE
+    cur = dbapi_conn.cursor()
+    try:
+        cur.execute("PRAGMA foreign_keys=ON")
+    finally:
+        cur.close()
+
+
+def make_engine(url: str = DATABASE_URL, tune: bool = True) -> Engine:
+    # tune=False — настройки драйвера по умолчанию (для сравнения в bench.db_writers_bench)
+    u = make_url(url)
+
+    if u.get_backend_name() == "sqlite":
+        if SQLITE_JOURNAL_MODE not in _JOURNAL_MODES or SQLITE_SYNCHRONOUS not in _SYNCHRONOUS:
+            raise RuntimeError("Недопустимые SQLITE_JOURNAL_MODE / SQLITE_SYNCHRONOUS.")
+
+        kwargs = {"connect_args": {"check_same_thread": False}, "echo": ECHO}
+        if u.database not in (None, "", ":memory:"):
+            kwargs.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT)
+        engine = create_engine(url, **kwargs)
+        event.listen(engine, "connect", _sqlite_foreign_keys)
+        if tune:
+            event.listen(engine, "connect", _sqlite_pragmas)
+        return engine
+
+    return create_engine(
+        url,
+        echo=ECHO,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def upsert_insert(session: Session, model):
+    # INSERT ... ON CONFLICT есть и в SQLite, и в PostgreSQL, но конструкторы у диалектов свои
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
@@ -1,8 +1,8 @@
-from db.session import SessionLocal, engine
-from db.base import Base
+from db.session import SessionLocal
+from db.init_db import init_db
 from db.scheme import Scheme
 
-Base.metadata.create_all(bind=engine)
+init_db()
 
 session = SessionLocal()
 try:
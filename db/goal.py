@@ -1,9 +1,10 @@
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator
 
-from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint, Float, Index
 from sqlalchemy.orm import relationship
 
 from db.base import Base
+from db.traversal import iter_preorder
 
 class Goal(Base):
     __tablename__ = "goals"
@@ -31,6 +32,29 @@ class Goal(Base):
         back_populates="goals",
     )
 
+    # выборка целей схемы и детей узла; у classifiers и classifier_items
+    # нужный префикс уже есть в уникальных индексах
+    __table_args__ = (
+        Index("ix_goals_scheme_parent", "scheme_id", "parent_id"),
+        Index("ix_goals_parent_id", "parent_id"),
+    )
+
+class GoalClosure(Base):
+    # все пары (предок, потомок) с расстоянием между ними, включая (цель, цель, 0);
+    # поддерево, предки и срез по глубине — один запрос по индексу
+    __tablename__ = "goal_closure"
+
+    ancestor_id = Column(Integer, ForeignKey("goals.id", ondelete="CASCADE"), primary_key=True)
+
+    descendant_id = Column(Integer, ForeignKey("goals.id", ondelete="CASCADE"), primary_key=True)
+
+    depth = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_goal_closure_ancestor_depth", "ancestor_id", "depth"),
+        Index("ix_goal_closure_descendant", "descendant_id", "depth"),
+    )
+
 class Classifier(Base):
     __tablename__ = "classifiers"
 
@@ -55,6 +79,25 @@ class Classifier(Base):
         "ClassifierItem",
         back_populates="classifier",
         cascade="all, delete-orphan",
+        order_by="ClassifierItem.id",
+    )
+
+class Factor(Base):
+    __tablename__ = "factors"
+
+    id = Column(Integer, primary_key=True)
+
+    scheme_id = Column(Integer, ForeignKey("schemes.id"), nullable=False)
+
+    name = Column(String, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("scheme_id", "name", name="uq_factor_scheme_name"),
+    )
+
+    scheme = relationship(
+        "Scheme",
+        back_populates="factors",
     )
 
 class OseResult(Base):
@@ -64,9 +107,10 @@ class OseResult(Base):
 
     scheme_id = Column(Integer, ForeignKey("schemes.id"), nullable=False)
 
-    goal = Column(String, nullable=False)
+    # строки уходят вместе с целью или фактором (ON DELETE CASCADE)
+    goal_id = Column(Integer, ForeignKey("goals.id", ondelete="CASCADE"), nullable=False)
 
-    factor = Column(String, nullable=False)
+    factor_id = Column(Integer, ForeignKey("factors.id", ondelete="CASCADE"), nullable=False)
 
     p = Column(Float, nullable=False)
 
@@ -80,7 +124,9 @@ class OseResult(Base):
     )
 
     __table_args__ = (
-        UniqueConstraint("scheme_id", "goal", "factor", name="uq_ose_scheme_goal_factor"),
+        UniqueConstraint("goal_id", "factor_id", name="uq_ose_goal_factor"),
+        Index("ix_ose_results_scheme_id", "scheme_id"),
+        Index("ix_ose_results_factor_id", "factor_id"),
     )
 
 class ClassifierItem(Base):
@@ -102,6 +148,8 @@ class ClassifierItem(Base):
     )
 
 class GoalNode:
+    __slots__ = ("id", "name", "level", "parent", "children")
+
     _id_counter = 1
 
     def __init__(
@@ -128,20 +176,72 @@ class GoalNode:
         return child
 
 
+class GoalIndex:
+    # id -> узел и имя в нижнем регистре -> узел; поддерживаются при каждом изменении дерева
+    __slots__ = ("by_id", "by_name")
+
+    def __init__(self, root: Optional[GoalNode] = None):
+        self.by_id: Dict[int, GoalNode] = {}
+        self.by_name: Dict[str, GoalNode] = {}
+        if root is not None:
+            self.rebuild(root)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def rebuild(self, root: Optional[GoalNode]) -> None:
+        self.by_id = {}
+        self.by_name = {}
+        for n in iter_preorder(root):
+            self.add(n)
+
+    def add(self, node: GoalNode) -> None:
+        self.by_id[node.id] = node
+        self.by_name[node.name.lower()] = node
+
+    def get(self, goal_id: int) -> Optional[GoalNode]:
+        return self.by_id.get(goal_id)
+
+    def find(self, name: str) -> Optional[GoalNode]:
+        return self.by_name.get(name.strip().lower())
+
+    def has_name(self, name: str) -> bool:
+        return name.strip().lower() in self.by_name
+
+    def rename(self, node: GoalNode, new_name: str) -> None:
+        if self.by_name.get(node.name.lower()) is node:
+            del self.by_name[node.name.lower()]
+        node.name = new_name
+        self.by_name[new_name.lower()] = node
+
+    def remove_subtree(self, node: GoalNode) -> List[GoalNode]:
+        removed = list(iter_preorder(node))
+        for n in removed:
+            if self.by_id.get(n.id) is n:
+                del self.by_id[n.id]
+            if self.by_name.get(n.name.lower()) is n:
+                del self.by_name[n.name.lower()]
+        return removed
+
+    def rekey(self, old_id: int, node: GoalNode) -> None:
+        if self.by_id.get(old_id) is node:
+            del self.by_id[old_id]
+        self.by_id[node.id] = node
+
+
+def iter_serialized(node: Optional[GoalNode]) -> Iterator[Dict]:
+    for n in iter_preorder(node):
+        yield {
+            "id": n.id,
+            "name": n.name,
+            "parent": n.parent.id if n.parent else None,
+            "level": n.level,
+        }
+
+
 def serialize_tree(node: GoalNode) -> List[Dict]:
-    data = [{
-        "id": node.id,
-        "name": node.name,
-        "parent": node.parent.id if node.parent else None,
-        "level": node.level,
-    }]
-    for ch in node.children:
-        data.extend(serialize_tree(ch))
-    return data
+    return list(iter_serialized(node))
 
 
 def collect_goals(node: GoalNode) -> List[GoalNode]:
-    items = [node]
-    for ch in node.children:
-        items.extend(collect_goals(ch))
-    return items
+    return list(iter_preorder(node))
@@ -1,6 +1,12 @@
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import delete, func, insert, select, true, update
+from sqlalchemy.orm import Session, aliased, joinedload
 
-from .goal import Goal, Classifier, ClassifierItem, GoalNode, OseResult
+from .config import upsert_insert
+from .goal import Goal, GoalClosure, Classifier, ClassifierItem, Factor, GoalNode, OseResult, collect_goals
+from .schemes import bump_ose_version, bump_tree_version
+
+
+_IN_CHUNK = 500
 
 
 def get_root_goal(session: Session) -> Goal | None:
@@ -34,8 +40,7 @@ def create_classifier(session: Session, scheme_id: int, name: str, level: int =
         level=level,
     )
     session.add(clf)
-    session.commit()
-    session.refresh(clf)
+    session.flush()
     return clf
 
 
@@ -45,11 +50,38 @@ def add_classifier_item(session: Session, classifier_id: int, value: str) -> Cla
         value=value,
     )
     session.add(item)
-    session.commit()
-    session.refresh(item)
+    session.flush()
     return item
 
 
+def add_classifier_items(session: Session, classifier_id: int, values: list[str]) -> tuple[list[str], int]:
+    # дубликаты (без учёта регистра) отсекаются в памяти, новые элементы — одним
+    # INSERT ... ON CONFLICT DO NOTHING; возвращает все элементы и число добавленных
+    existing = list(
+        session.execute(
+            select(ClassifierItem.value)
+            .where(ClassifierItem.classifier_id == classifier_id)
+            .order_by(ClassifierItem.id)
+        ).scalars()
+    )
+    seen = {v.strip().lower() for v in existing if v}
+
+    rows = []
+    for v in values:
+        v = (v or "").strip()
+        if not v or v.lower() in seen:
+            continue
+        seen.add(v.lower())
+        rows.append({"classifier_id": classifier_id, "value": v})
+
+    if rows:
+        # конфликт по uq_classifier_item_value
+        stmt = upsert_insert(session, ClassifierItem).on_conflict_do_nothing(index_elements=["classifier_id", "value"])
+        session.execute(stmt, rows)
+
+    return existing + [r["value"] for r in rows], len(rows)
+
+
 def get_classifier_with_items(session: Session, scheme_id: int, name: str, level: int | None = None) -> Classifier | None:
     q = (
         session.query(Classifier)
@@ -76,56 +108,270 @@ def delete_classifier(session: Session, scheme_id: int, name: str) -> bool:
     if not clf:
         return False
     session.delete(clf)
-    session.commit()
+    session.flush()
     return True
 
 
-def replace_goals_from_tree(session: Session, scheme_id: int, root: GoalNode | None) -> None:
-    session.query(Goal).filter(
-        Goal.scheme_id == scheme_id,
-        Goal.parent_id != None,
-    ).delete(synchronize_session=False)
-    session.query(Goal).filter(
-        Goal.scheme_id == scheme_id,
-        Goal.parent_id == None,
-    ).delete(synchronize_session=False)
+def _stored_depths(stored: dict[int, tuple[str, int | None]]) -> dict[int, int]:
+    depth: dict[int, int] = {}
+    for gid in stored:
+        path = []
+        cur = gid
+        while cur in stored and cur not in depth:
+            path.append(cur)
+            cur = stored[cur][1]
+        d = depth.get(cur, -1)
+        for x in reversed(path):
+            d += 1
+            depth[x] = d
+    return depth
+
+
+def _closure_rows(nodes: list[GoalNode]) -> list[dict]:
+    rows = []
+    for n in nodes:
+        a, d = n, 0
+        while a is not None:
+            rows.append({"ancestor_id": a.id, "descendant_id": n.id, "depth": d})
+            a = a.parent
+            d += 1
+    return rows
+
 
-    if not root:
-        session.commit()
+def _closure_move(session: Session, goal_id: int, new_parent_id: int | None) -> None:
+    # поддерево отрывается от прежних предков и подвешивается к предкам нового родителя:
+    # затрагиваются только строки поддерева
+    sub_ids = select(GoalClosure.descendant_id).where(GoalClosure.ancestor_id == goal_id)
+    session.execute(
+        delete(GoalClosure)
+        .where(GoalClosure.descendant_id.in_(sub_ids), GoalClosure.ancestor_id.not_in(sub_ids))
+        .execution_options(synchronize_session=False)
+    )
+    if new_parent_id is None:
         return
+    up = aliased(GoalClosure)
+    down = aliased(GoalClosure)
+    session.execute(
+        insert(GoalClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(up.ancestor_id, down.descendant_id, up.depth + down.depth + 1)
+            .select_from(up)
+            .join(down, true())
+            .where(up.descendant_id == new_parent_id, down.ancestor_id == goal_id),
+        )
+    )
+
+
+def move_goal(session: Session, scheme_id: int, goal_id: int, new_parent_id: int) -> None:
+    session.execute(update(Goal).where(Goal.id == goal_id).values(parent_id=new_parent_id))
+    _closure_move(session, goal_id, new_parent_id)
+    bump_tree_version(session, scheme_id)
+
+
+def sync_goals_from_tree(session: Session, scheme_id: int, root: GoalNode | None) -> list[tuple[int, GoalNode]]:
+    stored = {
+        gid: (name, parent_id)
+        for gid, name, parent_id in session.query(Goal.id, Goal.name, Goal.parent_id)
+        .filter(Goal.scheme_id == scheme_id)
+    }
+
+    nodes = collect_goals(root) if root else []
+    new_nodes = [n for n in nodes if n.id not in stored]
+
+    # новые цели вставляем по уровням: у каждой строки уже известен id родителя,
+    # и на уровень уходит один executemany с RETURNING вместо flush на каждый узел
+    by_level: dict[int, list[GoalNode]] = {}
+    for n in new_nodes:
+        by_level.setdefault(n.level, []).append(n)
+
+    renumbered: list[tuple[int, GoalNode]] = []
+    for lvl in sorted(by_level):
+        batch = by_level[lvl]
+        ids = session.scalars(
+            insert(Goal).returning(Goal.id, sort_by_parameter_order=True),
+            [
+                {
+                    "name": n.name,
+                    "scheme_id": scheme_id,
+                    "parent_id": n.parent.id if n.parent else None,
+                }
+                for n in batch
+            ],
+        ).all()
+        for n, gid in zip(batch, ids):
+            if n.id != gid:
+                renumbered.append((n.id, n))
+            n.id = gid
+
+    created = {n.id for n in new_nodes}
+    updates = []
+    moved = []
+    for n in nodes:
+        if n.id in created:
+            continue
+        parent_id = n.parent.id if n.parent else None
+        if stored[n.id] != (n.name, parent_id):
+            updates.append({"id": n.id, "name": n.name, "parent_id": parent_id})
+            if stored[n.id][1] != parent_id:
+                moved.append((n.id, parent_id))
+    if updates:
+        session.execute(update(Goal), updates)
+
+    # таблица замыкания: сначала новые цели (их предки уже окончательные),
+    # потом перенос поддеревьев; строки удалённых целей уходят каскадом
+    if new_nodes:
+        session.execute(insert(GoalClosure), _closure_rows(new_nodes))
+    for gid, parent_id in moved:
+        _closure_move(session, gid, parent_id)
+
+    alive = {n.id for n in nodes}
+    stale = [gid for gid in stored if gid not in alive]
+    # внешние ключи включены: потомок удаляется не позже предка, даже если они в разных пачках
+    depth = _stored_depths(stored)
+    stale.sort(key=lambda gid: -depth[gid])
+    for i in range(0, len(stale), _IN_CHUNK):
+        session.execute(
+            delete(Goal)
+            .where(Goal.id.in_(stale[i:i + _IN_CHUNK]))
+            .execution_options(synchronize_session=False)
+        )
+
+    if new_nodes or updates or stale:
+        bump_tree_version(session, scheme_id)
+
+    if alive:
+        GoalNode._id_counter = max(GoalNode._id_counter, max(alive) + 1)
+
+    return renumbered
+
+
+def _subtree_query(goal_id: int, max_depth: int | None):
+    # уровень корня поддерева — его расстояние до корня дерева, тем же запросом
+    top = (
+        select(func.max(GoalClosure.depth))
+        .where(GoalClosure.descendant_id == goal_id)
+        .scalar_subquery()
+    )
+    q = (
+        select(Goal.id, Goal.name, Goal.parent_id, GoalClosure.depth, top)
+        .join(GoalClosure, GoalClosure.descendant_id == Goal.id)
+        .where(GoalClosure.ancestor_id == goal_id)
+        .order_by(GoalClosure.depth, Goal.id)
+    )
+    if max_depth is not None:
+        q = q.where(GoalClosure.depth <= max_depth)
+    return q
+
+
+def get_subtree(session: Session, goal_id: int, max_depth: int | None = None) -> list[dict]:
+    return [
+        {"id": gid, "name": name, "parent": parent_id, "level": t + d + 1, "depth": d}
+        for gid, name, parent_id, d, t in session.execute(_subtree_query(goal_id, max_depth))
+    ]
+
+
+def get_children(session: Session, goal_id: int, depth: int = 1) -> list[dict]:
+    # сама цель и потомки до depth уровней; "children" — сколько детей у узла,
+    # чтобы граф мог показать свёрнутые узлы, не загружая их поддеревья
+    child = aliased(Goal)
+    n_children = (
+        select(func.count(child.id))
+        .where(child.parent_id == Goal.id)
+        .correlate(Goal)
+        .scalar_subquery()
+    )
+    q = _subtree_query(goal_id, depth).add_columns(n_children)
+    return [
+        {"id": gid, "name": name, "parent": parent_id, "level": t + d + 1, "depth": d, "children": n}
+        for gid, name, parent_id, d, t, n in session.execute(q)
+    ]
+
+
+def get_ancestors(session: Session, goal_id: int) -> list[dict]:
+    rows = session.execute(
+        select(Goal.id, Goal.name, Goal.parent_id, GoalClosure.depth)
+        .join(GoalClosure, GoalClosure.ancestor_id == Goal.id)
+        .where(GoalClosure.descendant_id == goal_id, GoalClosure.depth > 0)
+        .order_by(GoalClosure.depth.desc())
+    ).all()
+    # от корня вниз; depth — на сколько уровней предок выше цели
+    top = rows[0][3] if rows else 0
+    return [
+        {"id": gid, "name": name, "parent": parent_id, "level": top - d + 1, "depth": d}
+        for gid, name, parent_id, d in rows
+    ]
+
+
+def get_subtree_h(session: Session, goal_id: int) -> float:
+    return session.execute(
+        select(func.coalesce(func.sum(OseResult.h), 0.0))
+        .join(GoalClosure, GoalClosure.descendant_id == OseResult.goal_id)
+        .where(GoalClosure.ancestor_id == goal_id)
+    ).scalar()
 
-    def _create(node: GoalNode, parent_id: int | None):
-        g = Goal(name=node.name, scheme_id=scheme_id, parent_id=parent_id)
-        session.add(g)
-        session.flush()
-        node.id = g.id
-        for ch in getattr(node, "children", []) or []:
-            _create(ch, g.id)
 
-    _create(root, None)
-    session.commit()
 def get_ose_results(session: Session, scheme_id: int) -> list[dict]:
-    items = (
-        session.query(OseResult)
-        .filter(OseResult.scheme_id == scheme_id)
-        .order_by(OseResult.goal.asc(), OseResult.factor.asc())
-        .all()
+    rows = session.execute(
+        select(OseResult.goal_id, Goal.name, Factor.name, OseResult.p, OseResult.q, OseResult.h)
+        .join(Goal, Goal.id == OseResult.goal_id)
+        .join(Factor, Factor.id == OseResult.factor_id)
+        .where(OseResult.scheme_id == scheme_id)
+        .order_by(Goal.name.asc(), Factor.name.asc())
     )
     return [
-        {"goal": x.goal, "factor": x.factor, "p": x.p, "q": x.q, "H": x.h}
-        for x in items
+        {"goal_id": gid, "goal": goal, "factor": factor, "p": p, "q": q, "H": h}
+        for gid, goal, factor, p, q, h in rows
     ]
 
 
-def replace_ose_results(session: Session, scheme_id: int, rows: list[dict]) -> None:
-    session.query(OseResult).filter(
-        OseResult.scheme_id == scheme_id,
-    ).delete(synchronize_session=False)
+def get_factor_ids(session: Session, scheme_id: int, names: list[str]) -> dict[str, int]:
+    # недостающие факторы создаются одним INSERT ... ON CONFLICT DO NOTHING
+    names = sorted(set(names))
+    ids: dict[str, int] = {}
+
+    def _load(chunk):
+        ids.update(session.execute(
+            select(Factor.name, Factor.id)
+            .where(Factor.scheme_id == scheme_id, Factor.name.in_(chunk))
+        ).all())
+
+    for i in range(0, len(names), _IN_CHUNK):
+        _load(names[i:i + _IN_CHUNK])
+
+    missing = [n for n in names if n not in ids]
+    if missing:
+        stmt = upsert_insert(session, Factor).on_conflict_do_nothing(index_elements=["scheme_id", "name"])
+        session.execute(stmt, [{"scheme_id": scheme_id, "name": n} for n in missing])
+        for i in range(0, len(missing), _IN_CHUNK):
+            _load(missing[i:i + _IN_CHUNK])
+    return ids
+
 
-    for r in rows or []:
-        goal = (r.get("goal") or "").strip()
+def apply_ose_changes(
+    session: Session,
+    scheme_id: int,
+    upserts: list[dict],
+    dropped_factors: list[str] = (),
+    clear: bool = False,
+) -> None:
+    # строки ОСЭ удаляются каскадом вместе с фактором (или целью, см. sync_goals_from_tree)
+    if clear or dropped_factors or upserts:
+        bump_ose_version(session, scheme_id)
+    if clear:
+        session.execute(delete(Factor).where(Factor.scheme_id == scheme_id))
+
+    names = [f.strip() for f in dropped_factors or [] if f.strip()]
+    for i in range(0, len(names), _IN_CHUNK):
+        session.execute(
+            delete(Factor)
+            .where(Factor.scheme_id == scheme_id, Factor.name.in_(names[i:i + _IN_CHUNK]))
+            .execution_options(synchronize_session=False)
+        )
+
+    cells = []
+    for r in upserts or []:
         factor = (r.get("factor") or "").strip()
-        if not goal or not factor:
+        if r.get("goal_id") is None or not factor:
             continue
         try:
             p = float(r.get("p"))
@@ -133,15 +379,19 @@ def replace_ose_results(session: Session, scheme_id: int, rows: list[dict]) -> N
             h = float(r.get("H"))
         except Exception:
             continue
-        session.add(
-            OseResult(
-                scheme_id=scheme_id,
-                goal=goal,
-                factor=factor,
-                p=p,
-                q=q,
-                h=h,
-            )
-        )
+        cells.append((int(r["goal_id"]), factor, p, q, h))
+    if not cells:
+        return
 
-    session.commit()
\ No newline at end of file
+    factor_ids = get_factor_ids(session, scheme_id, [c[1] for c in cells])
+    values = [
+        {"scheme_id": scheme_id, "goal_id": gid, "factor_id": factor_ids[f], "p": p, "q": q, "h": h}
+        for gid, f, p, q, h in cells
+    ]
+    # конфликт по uq_ose_goal_factor
+    stmt = upsert_insert(session, OseResult)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["goal_id", "factor_id"],
+        set_={"p": stmt.excluded.p, "q": stmt.excluded.q, "h": stmt.excluded.h},
+    )
+    session.execute(stmt, values)
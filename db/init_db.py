@@ -1,5 +1,5 @@
 from db.session import engine
-from db.base import Base
+from db.migrations import run_migrations
 
 def init_db() -> None:
-    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
@@ -0,0 +1,250 @@
+import re
+import sys
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, event, inspect, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from db.base import Base
+from db.goal import Factor, Goal, OseResult
+from db.scheme import Scheme
+
+
+# Новые таблицы создаёт create_all по моделям; миграции меняют то, что create_all
+# в живой базе не тронет: индексы, столбцы, перенос данных. Шаги идемпотентны —
+# новая база получает всё из моделей, и шаги в ней только отмечаются как применённые.
+
+schema_version = Table(
+    "schema_version",
+    Base.metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+Step = Callable[[Connection], None]
+
+MIGRATIONS: List[Tuple[int, str, Step]] = []
+
+
+def migration(version: int, name: str):
+    def deco(fn: Step) -> Step:
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return deco
+
+
+@migration(1, "индексы goals(scheme_id, parent_id) и goals(parent_id)")
+def _m1_goal_indexes(conn: Connection) -> None:
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_goals_scheme_parent ON goals (scheme_id, parent_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_goals_parent_id ON goals (parent_id)"))
+
+
+@migration(2, "факторы в таблице factors, ose_results ссылается на цель и фактор по id")
+def _m2_ose_ids(conn: Connection) -> None:
+    if "goal_id" in {c["name"] for c in inspect(conn).get_columns("ose_results")}:
+        return
+
+    # таблица пересобирается: SQLite не умеет добавлять внешние ключи через ALTER.
+    # Строки, чьей цели в схеме уже нет, не переносятся — в дереве их и так не видно
+    conn.execute(text(
+        "INSERT INTO factors (scheme_id, name)"
+        " SELECT DISTINCT r.scheme_id, r.factor FROM ose_results r"
+        " WHERE EXISTS (SELECT 1 FROM goals g WHERE g.scheme_id = r.scheme_id AND g.name = r.goal)"
+    ))
+
+    m = MetaData()
+    for t in (Scheme.__table__, Goal.__table__, Factor.__table__):
+        t.to_metadata(m)
+    new = OseResult.__table__.to_metadata(m, name="ose_results_new")
+    new.create(conn)
+
+    conn.execute(text(
+        "INSERT INTO ose_results_new (scheme_id, goal_id, factor_id, p, q, h)"
+        " SELECT r.scheme_id, g.goal_id, f.id, r.p, r.q, r.h"
+        " FROM ose_results r"
+        " JOIN (SELECT scheme_id, name, MIN(id) AS goal_id FROM goals GROUP BY scheme_id, name) g"
+        "   ON g.scheme_id = r.scheme_id AND g.name = r.goal"
+        " JOIN factors f ON f.scheme_id = r.scheme_id AND f.name = r.factor"
+    ))
+    conn.execute(text("DROP TABLE ose_results"))
+    conn.execute(text("ALTER TABLE ose_results_new RENAME TO ose_results"))
+
+
+@migration(3, "таблица замыкания goal_closure для существующих деревьев")
+def _m3_goal_closure(conn: Connection) -> None:
+    conn.execute(text("DELETE FROM goal_closure"))
+    conn.execute(text(
+        "INSERT INTO goal_closure (ancestor_id, descendant_id, depth)"
+        " WITH RECURSIVE c (ancestor_id, descendant_id, depth) AS ("
+        "   SELECT id, id, 0 FROM goals"
+        "   UNION ALL"
+        "   SELECT c.ancestor_id, g.id, c.depth + 1 FROM c JOIN goals g ON g.parent_id = c.descendant_id"
+        " )"
+        " SELECT ancestor_id, descendant_id, depth FROM c"
+    ))
+
+
+@migration(4, "scheme_versions.ose_version для снимков схем")
+def _m4_ose_version(conn: Connection) -> None:
+    if "ose_version" in {c["name"] for c in inspect(conn).get_columns("scheme_versions")}:
+        return
+    conn.execute(text("ALTER TABLE scheme_versions ADD COLUMN ose_version INTEGER NOT NULL DEFAULT 0"))
+
+
+def latest_version() -> int:
+    return max((v for v, _, _ in MIGRATIONS), default=0)
+
+
+def run_migrations(bind: Engine) -> int:
+    with bind.begin() as conn:
+        fresh = not inspect(conn).has_table("schemes")
+        Base.metadata.create_all(conn)
+        done = set(conn.execute(select(schema_version.c.version)).scalars())
+
+    for version, name, step in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in done:
+            continue
+        # каждый шаг — своя транзакция: упавший шаг не отменяет уже применённые
+        with bind.begin() as conn:
+            if not fresh:
+                step(conn)
+            conn.execute(insert(schema_version).values(
+                version=version, name=name, applied_at=datetime.now(timezone.utc),
+            ))
+    return latest_version()
+
+
+def current_version(bind: Engine) -> int:
+    with bind.connect() as conn:
+        if not inspect(conn).has_table("schema_version"):
+            return 0
+        return conn.execute(select(schema_version.c.version).order_by(schema_version.c.version.desc())).scalar() or 0
+
+
+def _hot_queries(session) -> None:
+    # те же вызовы, что делают эндпоинты диалога; запросы перехватываются и проверяются
+    from db.goal import GoalNode
+    from db.goals import (
+        add_classifier_items, apply_ose_changes, create_classifier, delete_classifier,
+        get_all_goals, get_ancestors, get_children, get_classifier_with_items, get_goal_by_id, get_ose_results,
+        get_root_goal, get_subtree, get_subtree_h, list_classifiers, move_goal, sync_goals_from_tree,
+    )
+    from db.schemes import create_scheme, delete_scheme, get_tree_version
+    from db.snapshots import check_snapshot, load_snapshot, save_snapshot
+
+    scheme_id = create_scheme(session, "check").id
+    root = GoalNode("A0")
+    a1 = root.add_child("A1")
+    a1.add_child("A11")
+    root.add_child("A2")
+    sync_goals_from_tree(session, scheme_id, root)
+
+    # переименование и перенос, затем перенос обратно и удаление
+    a1.name = "A1x"
+    a11 = a1.children[0]
+    a2 = root.children.pop()
+    a11.children.append(a2)
+    a2.parent = a11
+    sync_goals_from_tree(session, scheme_id, root)
+    a11.children.pop()
+    root.children.append(a2)
+    a2.parent = root
+    move_goal(session, scheme_id, a2.id, root.id)
+    root.children.pop()
+    sync_goals_from_tree(session, scheme_id, root)
+
+    rows = [{"goal_id": a1.id, "goal": "A1x", "factor": f, "p": 0.5, "q": 0.5, "H": 0.25} for f in ("F1", "F2")]
+    apply_ose_changes(session, scheme_id, rows)
+    apply_ose_changes(session, scheme_id, rows[:1], ["F2"])
+
+    get_all_goals(session, scheme_id)
+    get_ose_results(session, scheme_id)
+    get_root_goal(session)
+    get_goal_by_id(session, root.id)
+    get_tree_version(session, scheme_id)
+    get_subtree(session, root.id, 1)
+    get_children(session, a1.id, 2)
+    get_ancestors(session, a11.id)
+    get_subtree_h(session, a1.id)
+
+    save_snapshot(session, scheme_id, root, rows[:1])
+    load_snapshot(session, scheme_id)
+    check_snapshot(session, scheme_id)
+
+    clf = create_classifier(session, scheme_id, "K", level=1)
+    add_classifier_items(session, clf.id, ["a", "b"])
+    list_classifiers(session, scheme_id, level=1)
+    get_classifier_with_items(session, scheme_id, "K", level=1)
+    delete_classifier(session, scheme_id, "K")
+
+    apply_ose_changes(session, scheme_id, [], clear=True)
+    delete_scheme(session, scheme_id)
+
+
+_SCAN = re.compile(r"^SCAN (\w+)")
+
+
+def check_query_plans() -> List[Tuple[str, List[str], bool]]:
+    # EXPLAIN QUERY PLAN на временной базе SQLite, собранной теми же миграциями;
+    # запрос плохой, если читает таблицу целиком (SCAN вместо SEARCH)
+    from sqlalchemy.orm import Session
+    from db.config import make_engine
+
+    eng = make_engine("sqlite://", tune=False)
+    run_migrations(eng)
+    tables = set(Base.metadata.tables)
+
+    captured: List[Tuple[str, tuple]] = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        head = statement.lstrip().split(None, 1)[0].upper()
+        if head in ("SELECT", "UPDATE", "DELETE"):
+            params = parameters[0] if executemany and parameters else parameters
+            captured.append((statement, params))
+
+    event.listen(eng, "before_cursor_execute", _capture)
+    with Session(bind=eng) as session:
+        _hot_queries(session)
+        session.commit()
+    event.remove(eng, "before_cursor_execute", _capture)
+
+    report = []
+    seen = set()
+    with eng.connect() as conn:
+        for statement, params in captured:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            plan = [r[-1] for r in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params)]
+            ok = True
+            for line in plan:
+                m = _SCAN.match(line)
+                if m and re.sub(r"_\d+$", "", m.group(1)) in tables:
+                    ok = False
+            report.append((" ".join(statement.split()), plan, ok))
+    eng.dispose()
+    return report
+
+
+def main(argv: List[str]) -> int:
+    if "--check" in argv:
+        report = check_query_plans()
+        for sql, plan, ok in report:
+            print(("ok   " if ok else "SCAN ") + sql[:150])
+            for line in plan:
+                print("       " + line)
+        bad = sum(1 for _, _, ok in report if not ok)
+        print(f"{len(report)} запросов, без индекса: {bad}")
+        return 1 if bad else 0
+
+    from db.session import engine
+    before = current_version(engine)
+    after = run_migrations(engine)
+    print(f"схема: версия {before} -> {after}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, ForeignKey, Integer, LargeBinary, String
 from sqlalchemy.orm import relationship
 
 from db.base import Base
@@ -22,8 +22,44 @@ class Scheme(Base):
         cascade="all, delete-orphan",
     )
 
+    factors = relationship(
+        "Factor",
+        back_populates="scheme",
+        cascade="all, delete-orphan",
+    )
+
     ose_results = relationship(
         "OseResult",
         back_populates="scheme",
         cascade="all, delete-orphan",
     )
+
+    version = relationship(
+        "SchemeVersion",
+        uselist=False,
+        cascade="all, delete-orphan",
+    )
+
+
+class SchemeVersion(Base):
+    __tablename__ = "scheme_versions"
+
+    scheme_id = Column(Integer, ForeignKey("schemes.id"), primary_key=True)
+
+    tree_version = Column(Integer, nullable=False, default=0)
+
+    ose_version = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class SchemeSnapshot(Base):
+    # дерево и строки ОСЭ схемы одним сжатым блобом (см. db.snapshots);
+    # действителен, пока версии совпадают с scheme_versions
+    __tablename__ = "scheme_snapshots"
+
+    scheme_id = Column(Integer, ForeignKey("schemes.id"), primary_key=True)
+
+    tree_version = Column(Integer, nullable=False)
+
+    ose_version = Column(Integer, nullable=False)
+
+    data = Column(LargeBinary, nullable=False)
@@ -1,23 +1,89 @@
 from __future__ import annotations
+import secrets
+from typing import Tuple
+
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
-from db.scheme import Scheme
+from db.config import upsert_insert
+from db.goal import Classifier, ClassifierItem, Factor, Goal, OseResult
+from db.scheme import Scheme, SchemeSnapshot, SchemeVersion
 
 
 def list_schemes(session: Session) -> list[Scheme]:
     return session.query(Scheme).order_by(Scheme.id.desc()).all()
 
 
+def _initial_version() -> int:
+    # случайное начало версий: SQLite может выдать id удалённой схемы заново,
+    # и ETag "{id}-{версия}" не должен совпасть с закешированным у клиента
+    return secrets.randbelow(2 ** 31) + 1
+
+
 def create_scheme(session: Session, name: str) -> Scheme:
     s = Scheme(name=name)
     session.add(s)
-    session.commit()
-    session.refresh(s)
+    session.flush()
+    session.execute(insert(SchemeVersion).values(
+        scheme_id=s.id, tree_version=_initial_version(), ose_version=_initial_version(),
+    ))
     return s
 
 
 def delete_scheme(session: Session, scheme_id: int) -> None:
-    s = session.query(Scheme).filter(Scheme.id == scheme_id).first()
-    if not s:
-        return
-    session.delete(s)
-    session.commit()
+    # по таблицам, зависимые раньше: дерево не загружается в ORM, и порядок
+    # удаления не расходится с ON DELETE CASCADE у ose_results
+    clf_ids = select(Classifier.id).where(Classifier.scheme_id == scheme_id).scalar_subquery()
+    for stmt in (
+        delete(OseResult).where(OseResult.scheme_id == scheme_id),
+        delete(Factor).where(Factor.scheme_id == scheme_id),
+        delete(ClassifierItem).where(ClassifierItem.classifier_id.in_(clf_ids)),
+        delete(Classifier).where(Classifier.scheme_id == scheme_id),
+        delete(Goal).where(Goal.scheme_id == scheme_id),
+        delete(SchemeSnapshot).where(SchemeSnapshot.scheme_id == scheme_id),
+        delete(SchemeVersion).where(SchemeVersion.scheme_id == scheme_id),
+        delete(Scheme).where(Scheme.id == scheme_id),
+    ):
+        session.execute(stmt.execution_options(synchronize_session=False))
+
+
+def get_tree_version(session: Session, scheme_id: int) -> int:
+    v = (
+        session.query(SchemeVersion.tree_version)
+        .filter(SchemeVersion.scheme_id == scheme_id)
+        .scalar()
+    )
+    return v or 0
+
+
+def get_versions(session: Session, scheme_id: int) -> Tuple[int, int]:
+    row = session.execute(
+        select(SchemeVersion.tree_version, SchemeVersion.ose_version)
+        .where(SchemeVersion.scheme_id == scheme_id)
+    ).first()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def mark_snapshot_stale(session: Session, scheme_id: int) -> None:
+    # снимок схемы пересобирается перед коммитом запроса (db.snapshots.refresh_snapshots)
+    session.info.setdefault("stale_snapshots", set()).add(scheme_id)
+
+
+def _bump(session: Session, scheme_id: int, column: str) -> None:
+    # строки ещё нет только у схем, созданных до случайных версий
+    stmt = upsert_insert(session, SchemeVersion).values(
+        scheme_id=scheme_id, tree_version=_initial_version(), ose_version=_initial_version(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["scheme_id"],
+        set_={column: getattr(SchemeVersion, column) + 1},
+    )
+    session.execute(stmt)
+    mark_snapshot_stale(session, scheme_id)
+
+
+def bump_tree_version(session: Session, scheme_id: int) -> None:
+    _bump(session, scheme_id, "tree_version")
+
+
+def bump_ose_version(session: Session, scheme_id: int) -> None:
+    _bump(session, scheme_id, "ose_version")
@@ -1,15 +1,75 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from contextvars import ContextVar, Token
+from typing import Optional
 
-DATABASE_URL = "sqlite:///./planfactor.db"
+from sqlalchemy.orm import Session, sessionmaker
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
-)
+from db.config import DATABASE_URL, make_engine
+
+engine = make_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
     bind=engine,
 )
+
+
+class UnitOfWork:
+    # одна сессия на HTTP-запрос: открывается при первом обращении к БД,
+    # хелперы только делают flush, коммит — один раз в конце запроса (см. main.py)
+    __slots__ = ("_session",)
+
+    def __init__(self):
+        self._session: Optional[Session] = None
+
+    @property
+    def session(self) -> Session:
+        if self._session is None:
+            self._session = SessionLocal()
+        return self._session
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None
+
+    def commit(self) -> None:
+        if self._session is not None:
+            self._session.commit()
+
+    def rollback(self) -> None:
+        if self._session is not None:
+            self._session.rollback()
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+_current_uow: ContextVar[Optional[UnitOfWork]] = ContextVar("current_uow", default=None)
+
+
+def bind_uow(uow: UnitOfWork) -> Token:
+    return _current_uow.set(uow)
+
+
+def unbind_uow(token: Token) -> None:
+    _current_uow.reset(token)
+
+
+def current_uow() -> UnitOfWork:
+    uow = _current_uow.get()
+    if uow is None:
+        raise RuntimeError("Сессия БД доступна только внутри запроса; в скриптах используйте SessionLocal().")
+    return uow
+
+
+def current_session() -> Session:
+    return current_uow().session
+
+
+def get_db() -> Session:
+    # зависимость FastAPI: маршруты получают сессию запроса параметром и передают её своим хелперам;
+    # обработчики диалога (adpacf, adpose, команды правки) вызываются через общий автомат
+    # и берут ту же сессию через current_session(), как состояние — через dialog
+    return current_session()
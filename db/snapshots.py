@@ -0,0 +1,193 @@
+import json
+import sys
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from db.config import upsert_insert
+from db.goal import Goal, GoalNode
+from db.goals import get_ose_results
+from db.scheme import Scheme, SchemeSnapshot, SchemeVersion
+from db.schemes import get_versions
+from db.traversal import iter_preorder, iter_preorder_depth
+
+
+# Снимок — дерево и строки ОСЭ схемы одним сжатым JSON: загрузка схемы читает
+# одну строку вместо goals + ose_results. Источник истины — нормализованные таблицы;
+# снимок годен, только пока его версии совпадают с scheme_versions.
+
+Snapshot = Tuple[Optional[GoalNode], List[dict]]
+
+
+def encode_snapshot(root: Optional[GoalNode], ose_rows: List[dict]) -> bytes:
+    tree = [[n.id, n.parent.id if n.parent else None, n.name] for n in iter_preorder(root)]
+    # строки — в порядке get_ose_results, чтобы не сортировать при чтении;
+    # факторы — индексами в общий список
+    rows = sorted(ose_rows, key=lambda r: (r["goal"], r["factor"]))
+    factors = sorted({r["factor"] for r in rows})
+    fidx = {f: i for i, f in enumerate(factors)}
+    ose = [[int(r["goal_id"]), fidx[r["factor"]], r["p"], r["q"], r["H"]] for r in rows]
+    raw = json.dumps({"tree": tree, "factors": factors, "ose": ose}, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(raw.encode("utf-8"))
+
+
+def decode_snapshot(data: bytes) -> Snapshot:
+    raw = json.loads(zlib.decompress(data))
+    nodes: Dict[int, GoalNode] = {}
+    root: Optional[GoalNode] = None
+    # прямой порядок: родитель всегда раньше детей
+    for gid, parent_id, name in raw["tree"]:
+        node = GoalNode(name)
+        node.id = gid
+        nodes[gid] = node
+        if parent_id is None:
+            root = node
+        else:
+            parent = nodes[parent_id]
+            node.parent = parent
+            parent.children.append(node)
+
+    for n, lvl in iter_preorder_depth(root, 1):
+        n.level = lvl
+
+    if nodes:
+        GoalNode._id_counter = max(GoalNode._id_counter, max(nodes) + 1)
+
+    factors = raw["factors"]
+    rows = [
+        {"goal_id": gid, "goal": nodes[gid].name, "factor": factors[f], "p": p, "q": q, "H": h}
+        for gid, f, p, q, h in raw["ose"]
+        if gid in nodes
+    ]
+    return root, rows
+
+
+def load_snapshot(session: Session, scheme_id: int) -> Optional[Snapshot]:
+    # одним запросом: снимок вместе с проверкой версий
+    data = session.execute(
+        select(SchemeSnapshot.data)
+        .outerjoin(SchemeVersion, SchemeVersion.scheme_id == SchemeSnapshot.scheme_id)
+        .where(
+            SchemeSnapshot.scheme_id == scheme_id,
+            SchemeSnapshot.tree_version == func.coalesce(SchemeVersion.tree_version, 0),
+            SchemeSnapshot.ose_version == func.coalesce(SchemeVersion.ose_version, 0),
+        )
+    ).scalar()
+    return decode_snapshot(data) if data is not None else None
+
+
+def save_snapshot(session: Session, scheme_id: int, root: Optional[GoalNode], ose_rows: List[dict]) -> None:
+    tree_version, ose_version = get_versions(session, scheme_id)
+    stmt = upsert_insert(session, SchemeSnapshot).values(
+        scheme_id=scheme_id,
+        tree_version=tree_version,
+        ose_version=ose_version,
+        data=encode_snapshot(root, ose_rows),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["scheme_id"],
+        set_={
+            "tree_version": stmt.excluded.tree_version,
+            "ose_version": stmt.excluded.ose_version,
+            "data": stmt.excluded.data,
+        },
+    )
+    session.execute(stmt)
+
+
+def refresh_snapshots(session: Session, state) -> None:
+    # перед коммитом запроса. Снимок активной схемы собирается из состояния диалога —
+    # после flush оно совпадает с БД; остальные схемы остаются с устаревшими версиями
+    # и пересобираются при следующей загрузке
+    stale = session.info.pop("stale_snapshots", None)
+    if not stale or state is None:
+        return
+    scheme_id = getattr(state, "active_scheme_id", None)
+    if scheme_id not in stale or state.ose_store.has_changes():
+        return
+    save_snapshot(session, scheme_id, state.root, state.ose_store.rows())
+
+
+def load_normalized(session: Session, scheme_id: int) -> Snapshot:
+    goals = session.execute(
+        select(Goal.id, Goal.parent_id, Goal.name).where(Goal.scheme_id == scheme_id).order_by(Goal.id)
+    ).all()
+    nodes: Dict[int, GoalNode] = {}
+    root: Optional[GoalNode] = None
+    for gid, _parent_id, name in goals:
+        node = GoalNode(name)
+        node.id = gid
+        nodes[gid] = node
+    for gid, parent_id, _name in goals:
+        parent = nodes.get(parent_id)
+        if parent_id is None and root is None:
+            root = nodes[gid]
+        elif parent is not None:
+            nodes[gid].parent = parent
+            parent.children.append(nodes[gid])
+
+    for n, lvl in iter_preorder_depth(root, 1):
+        n.level = lvl
+
+    if nodes:
+        GoalNode._id_counter = max(GoalNode._id_counter, max(nodes) + 1)
+    return root, get_ose_results(session, scheme_id)
+
+
+def _tree_set(root: Optional[GoalNode]) -> set:
+    return {(n.id, n.parent.id if n.parent else None, n.name) for n in iter_preorder(root)}
+
+
+def _ose_set(rows: List[dict]) -> set:
+    return {(r["goal_id"], r["factor"], float(r["p"]), float(r["q"]), float(r["H"])) for r in rows}
+
+
+def check_snapshot(session: Session, scheme_id: int) -> str:
+    row = session.execute(
+        select(SchemeSnapshot.tree_version, SchemeSnapshot.ose_version, SchemeSnapshot.data)
+        .where(SchemeSnapshot.scheme_id == scheme_id)
+    ).first()
+    if row is None:
+        return "нет снимка"
+    if (row[0], row[1]) != get_versions(session, scheme_id):
+        return "устарел"
+
+    root, rows = decode_snapshot(row[2])
+    db_root, db_rows = load_normalized(session, scheme_id)
+    problems = []
+    tree, db_tree = _tree_set(root), _tree_set(db_root)
+    if tree != db_tree:
+        problems.append(f"дерево: лишних {len(tree - db_tree)}, недостаёт {len(db_tree - tree)}")
+    ose, db_ose = _ose_set(rows), _ose_set(db_rows)
+    if ose != db_ose:
+        problems.append(f"ОСЭ: лишних {len(ose - db_ose)}, недостаёт {len(db_ose - ose)}")
+    return "расходится: " + "; ".join(problems) if problems else "ok"
+
+
+def main(argv: List[str]) -> int:
+    # --check сверяет снимки с таблицами; без флага снимки всех схем пересобираются
+    from db.session import SessionLocal
+
+    with SessionLocal() as session:
+        scheme_ids = list(session.execute(select(Scheme.id).order_by(Scheme.id)).scalars())
+        if "--check" in argv:
+            bad = 0
+            for scheme_id in scheme_ids:
+                result = check_snapshot(session, scheme_id)
+                bad += result.startswith("расходится")
+                print(f"схема {scheme_id}: {result}")
+            print(f"схем: {len(scheme_ids)}, расходится: {bad}")
+            return 1 if bad else 0
+
+        for scheme_id in scheme_ids:
+            root, rows = load_normalized(session, scheme_id)
+            save_snapshot(session, scheme_id, root, rows)
+        session.commit()
+        print(f"снимков пересобрано: {len(scheme_ids)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,47 @@
+from typing import Iterator, Tuple
+
+
+def _children(node):
+    return getattr(node, "children", None) or ()
+
+
+def iter_preorder(root) -> Iterator:
+    if root is None:
+        return
+    stack = [root]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        node = pop()
+        yield node
+        ch = getattr(node, "children", None)
+        if ch:
+            extend(reversed(ch))
+
+
+def iter_preorder_depth(root, depth: int = 0) -> Iterator[Tuple[object, int]]:
+    if root is None:
+        return
+    stack = [(root, depth)]
+    while stack:
+        node, d = stack.pop()
+        yield node, d
+        ch = _children(node)
+        if ch:
+            stack.extend((c, d + 1) for c in reversed(ch))
+
+
+def iter_postorder(root) -> Iterator:
+    if root is None:
+        return
+    # (узел, дети уже в стеке) — потомки выдаются раньше родителя, порядок детей сохраняется
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            yield node
+            continue
+        stack.append((node, True))
+        ch = _children(node)
+        if ch:
+            stack.extend((c, False) for c in reversed(ch))
@@ -0,0 +1,30 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+MAX_SCHEMES = 64
+
+_lock = threading.Lock()
+_cache: "OrderedDict[int, Tuple[int, List[Dict]]]" = OrderedDict()
+
+
+def get_cached_tree(scheme_id: int, version: int) -> Optional[List[Dict]]:
+    with _lock:
+        hit = _cache.get(scheme_id)
+        if hit is None or hit[0] != version:
+            return None
+        _cache.move_to_end(scheme_id)
+        return hit[1]
+
+
+def put_cached_tree(scheme_id: int, version: int, data: List[Dict]) -> None:
+    with _lock:
+        _cache[scheme_id] = (version, data)
+        _cache.move_to_end(scheme_id)
+        while len(_cache) > MAX_SCHEMES:
+            _cache.popitem(last=False)
+
+
+def drop_cached_tree(scheme_id: int) -> None:
+    with _lock:
+        _cache.pop(scheme_id, None)
@@ -24,10 +24,14 @@ export function apiStart(schemeId = null) {
     return requestJson(url, { method: "POST" });
 }
 
-export function apiAnswer(text) {
+export function apiAnswer(text, versions = {}) {
     return requestJson("/api/dialog/answer", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ answer: text })
+        body: JSON.stringify({ answer: text, ...versions })
     });
 }
+
+export function apiGoalChildren(goalId, depth = 1) {
+    return requestJson(`/api/goals/${goalId}/children?depth=${depth}`);
+}
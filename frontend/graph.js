@@ -1,5 +1,25 @@
+import { apiGoalChildren } from "./api.js";
+
 let cy = null;
 
+const LAYOUT = {
+    name: "breadthfirst",
+    directed: true,
+    spacingFactor: 1.2
+};
+
+// с какого размера дерево показывается свёрнутым: видны корень и раскрытые узлы,
+// дети подгружаются по щелчку (GET /api/goals/{id}/children). Полное дерево
+// раскладывает сервер, так что порог задаёт только стоимость отрисовки
+const COLLAPSE_FROM = 1000;
+
+let collapsedMode = false;
+let collapsedRoot = null;
+let collapsedVersion = undefined;
+let expanded = new Set();
+let childPages = new Map();
+let loadSeq = 0;
+
 export function initGraph() {
     cy = cytoscape({
         container: document.getElementById("graph"),
@@ -10,10 +30,10 @@ export function initGraph() {
                 style: {
                     "background-color": "#4a90e2",
                     "color": "#fff",
-                    "label": "data(label)",
+                    "label": "data(caption)",
                     "font-size": "12px",
                     "text-wrap": "wrap",
-                    "text-max-width": "150px",
+                    "text-max-width": "160px",
                     "text-valign": "center",
                     "text-halign": "center",
                     "shape": "round-rectangle",
@@ -25,6 +45,14 @@ export function initGraph() {
                     "max-width": "200px",
                 }
             },
+            {
+                selector: "node.collapsed",
+                style: {
+                    "background-color": "#2f6fb8",
+                    "border-width": 3,
+                    "border-color": "#1b4f8a"
+                }
+            },
             {
                 selector: "edge",
                 style: {
@@ -36,45 +64,194 @@ export function initGraph() {
             }
         ],
 
-        layout: {
-            name: "breadthfirst",
-            directed: true,
-            spacingFactor: 1.2
-        }
+        layout: LAYOUT
     });
+
+    cy.on("tap", "node", evt => toggleNode(evt.target.id()));
 }
 
-export function updateGraph(tree) {
-    if (!cy) return;
+// ребро в дереве однозначно задаётся ребёнком
+function edge(parentId, childId) {
+    return { data: { id: `e${childId}`, source: String(parentId), target: String(childId) } };
+}
 
-    cy.elements().remove();
+function syncElements(nodes, edges) {
+    // сравнение с тем, что уже нарисовано, по id цели: неизменённые элементы
+    // не трогаются; true — появились новые узлы или перенос, нужна раскладка
+    const want = new Map();
+    for (const el of nodes) want.set(el.data.id, el);
+    for (const el of edges) want.set(el.data.id, el);
 
-    const nodes = (tree || []).map(n => ({
-        data: { id: String(n.id), label: n.name }
-    }));
+    let relayout = false;
 
-    const edges = (tree || [])
-        .filter(n => n.parent)
-        .map(n => ({
-            data: { source: String(n.parent), target: String(n.id) }
-        }));
+    cy.batch(() => {
+        cy.elements().forEach(el => {
+            if (el.removed()) return;
+            const next = want.get(el.id());
+            if (!next) {
+                el.remove();
+                return;
+            }
+            if (el.isEdge()) {
+                if (el.data("source") !== next.data.source) {
+                    el.remove();
+                    relayout = true;
+                }
+                return;
+            }
+            for (const [k, v] of Object.entries(next.data)) {
+                if (el.data(k) !== v) el.data(k, v);
+            }
+            const classes = next.classes || "";
+            if (el.classes().join(" ") !== classes) el.classes(classes);
+        });
+
+        const addNodes = nodes.filter(el => cy.getElementById(el.data.id).empty());
+        const addEdges = edges.filter(el => cy.getElementById(el.data.id).empty());
+        if (addNodes.length) relayout = true;
+        cy.add(addNodes);
+        cy.add(addEdges);
+    });
+
+    updateNodeLabels();
 
-    cy.add(nodes);
-    cy.add(edges);
+    return relayout;
+}
 
-    cy.layout({
-        name: "breadthfirst",
-        directed: true,
-        spacingFactor: 1.2
-    }).run();
+function runLayout(options) {
+    cy.layout(options).run();
 
     setTimeout(() => {
         cy.resize();
         cy.fit();
-        updateNodeLabels();
     }, 100);
 }
 
+function presetLayout(list) {
+    // координаты считает сервер: x/y приходят в дереве ответа диалога, патч несёт
+    // только сдвинувшиеся узлы. Узлы без координат — повод разложить граф в браузере
+    const positions = new Map(
+        list
+            .filter(n => n.x !== undefined)
+            .map(n => [String(n.id), { x: n.x, y: n.y }])
+    );
+
+    const nodes = cy.nodes();
+    if (nodes.nonempty() && nodes.every(n => positions.has(n.id()))) {
+        runLayout({ name: "preset", positions: n => positions.get(n.id()) });
+    } else {
+        runLayout(LAYOUT);
+    }
+}
+
+export function updateGraph(tree, version) {
+    if (!cy) return;
+
+    const list = tree || [];
+
+    if (list.length >= COLLAPSE_FROM) {
+        const root = list.find(n => !n.parent);
+        showCollapsed(root ? String(root.id) : null, version);
+        return;
+    }
+
+    collapsedMode = false;
+
+    const nodes = list.map(n => ({
+        data: { id: String(n.id), label: n.name, hidden: 0 }
+    }));
+
+    const edges = list
+        .filter(n => n.parent)
+        .map(n => edge(n.parent, n.id));
+
+    if (syncElements(nodes, edges)) presetLayout(list);
+}
+
+async function showCollapsed(rootId, version) {
+    // тот же корень и та же версия дерева — видимая часть не изменилась
+    if (collapsedMode && rootId === collapsedRoot && version !== undefined && version === collapsedVersion) return;
+
+    if (!collapsedMode || rootId !== collapsedRoot) {
+        expanded = new Set(rootId ? [rootId] : []);
+    }
+    collapsedMode = true;
+    collapsedRoot = rootId;
+    collapsedVersion = version;
+
+    // дерево изменилось: раскрытые узлы перечитываются, удалённые из них выпадают
+    const seq = ++loadSeq;
+    const ids = [...expanded];
+    const pages = await Promise.all(ids.map(id => apiGoalChildren(id).catch(() => null)));
+    if (seq !== loadSeq) return;
+
+    childPages = new Map();
+    ids.forEach((id, i) => {
+        if (pages[i]) childPages.set(id, pages[i].nodes);
+        else expanded.delete(id);
+    });
+    renderCollapsed();
+}
+
+function renderCollapsed() {
+    const rootPage = collapsedRoot !== null ? childPages.get(collapsedRoot) : null;
+    if (!rootPage) {
+        if (syncElements([], [])) runLayout(LAYOUT);
+        return;
+    }
+
+    const nodes = [];
+    const edges = [];
+    // depth 0 в ответе — сам узел, depth 1 — его дети
+    const queue = [rootPage[0]];
+    for (let i = 0; i < queue.length; i++) {
+        const n = queue[i];
+        const id = String(n.id);
+        const open = expanded.has(id) && childPages.has(id);
+
+        nodes.push({
+            data: { id, label: n.name, hidden: open ? 0 : n.children },
+            classes: !open && n.children ? "collapsed" : ""
+        });
+        if (id !== collapsedRoot) {
+            edges.push(edge(n.parent, id));
+        }
+        if (open) {
+            for (const ch of childPages.get(id)) {
+                if (ch.depth === 1) queue.push(ch);
+            }
+        }
+    }
+
+    if (syncElements(nodes, edges)) runLayout(LAYOUT);
+}
+
+async function toggleNode(id) {
+    if (!collapsedMode || id === collapsedRoot) return;
+
+    if (expanded.has(id)) {
+        expanded.delete(id);
+        renderCollapsed();
+        return;
+    }
+
+    if (!cy.getElementById(id).data("hidden")) return;
+
+    const seq = loadSeq;
+    let page;
+    try {
+        page = await apiGoalChildren(id);
+    } catch (e) {
+        console.error(e);
+        return;
+    }
+    if (seq !== loadSeq) return;
+
+    childPages.set(id, page.nodes);
+    expanded.add(id);
+    renderCollapsed();
+}
+
 let oseByGoal = {};
 let activeFactors = new Set();
 
@@ -86,25 +263,36 @@ export function setOseData(byGoal, factors) {
 export function updateNodeLabels() {
     if (!cy) return;
 
-    cy.nodes().forEach(node => {
-        const goal = node.data("label");
-        const vals = oseByGoal[goal] || {};
+    // подпись — в данных узла: перерисовываются только узлы, у которых она изменилась
+    cy.batch(() => {
+        cy.nodes().forEach(node => {
+            const goal = node.data("label");
+            const vals = oseByGoal[goal] || {};
 
-        let lines = [goal];
+            let lines = [goal];
 
-        activeFactors.forEach(f => {
-            if (vals[f] !== undefined) {
-                lines.push(`${f}: ${vals[f]}`);
-            }
-        });
+            activeFactors.forEach(f => {
+                if (vals[f] !== undefined) {
+                    lines.push(`${f}: ${vals[f]}`);
+                }
+            });
+
+            const hidden = node.data("hidden");
+            if (hidden) lines.push(`▸ ещё ${hidden}`);
 
-        node.style("label", lines.join("\n"));
-        node.style("text-wrap", "wrap");
-        node.style("text-max-width", "160px");
+            const caption = lines.join("\n");
+            if (node.data("caption") !== caption) node.data("caption", caption);
+        });
     });
 }
 
 export function clearGraph() {
+    collapsedMode = false;
+    collapsedRoot = null;
+    collapsedVersion = undefined;
+    expanded = new Set();
+    childPages = new Map();
+    loadSeq++;
     if (cy) cy.elements().remove();
 }
 
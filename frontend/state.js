@@ -94,4 +94,44 @@ export function setDialogActive(schemeId, isActive) {
 
 export function isDialogActive(schemeId) {
     return localStorage.getItem(_dialogKey(DIALOG_ACTIVE_PREFIX, schemeId)) === "1";
-}
\ No newline at end of file
+}
+// зеркало дерева и таблицы ОСЭ: сервер присылает только изменения относительно версии клиента
+let treeVersion = null;
+let oseVersion = null;
+let treeNodes = new Map();
+let oseRows = new Map();
+
+function _oseKey(goal, factor) {
+    return `${goal ?? ""}\u001f${factor ?? ""}`;
+}
+
+export function getDialogVersions() {
+    return { tree_version: treeVersion, ose_version: oseVersion };
+}
+
+export function applyDialogPatches(data) {
+    if (!data || typeof data !== "object") return data;
+
+    if (data.tree_patch) {
+        for (const id of data.tree_patch.remove || []) treeNodes.delete(String(id));
+        for (const n of data.tree_patch.upsert || []) treeNodes.set(String(n.id), n);
+    } else {
+        treeNodes = new Map((data.tree || []).map(n => [String(n.id), n]));
+    }
+
+    if (data.ose_patch) {
+        for (const [goal, factor] of data.ose_patch.remove || []) oseRows.delete(_oseKey(goal, factor));
+        for (const r of data.ose_patch.upsert || []) oseRows.set(_oseKey(r.goal, r.factor), r);
+    } else {
+        oseRows = new Map((data.ose_results || []).map(r => [_oseKey(r.goal, r.factor), r]));
+    }
+
+    treeVersion = data.tree_version ?? null;
+    oseVersion = data.ose_version ?? null;
+
+    return {
+        ...data,
+        tree: [...treeNodes.values()],
+        ose_results: [...oseRows.values()]
+    };
+}
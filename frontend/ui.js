@@ -16,7 +16,9 @@ import {
     setDialogActive,
     saveSchemeState,
     loadSchemeState,
-    clearSchemeState
+    clearSchemeState,
+    getDialogVersions,
+    applyDialogPatches
 } from "./state.js";
 
 import {
@@ -221,7 +223,7 @@ function persistStatePatch(schemeId, data) {
 }
 
 function applyDialogResponseSilent(data) {
-    if (data.tree) updateGraph(data.tree);
+    if (data.tree) updateGraph(data.tree, data.tree_version);
 
     if (data.ose_results) {
         buildOse(data.ose_results);
@@ -250,7 +252,7 @@ function applyDialogResponseSilent(data) {
 function applyDialogResponse(data) {
     addMessage(data.question, "bot");
 
-    if (data.tree) updateGraph(data.tree);
+    if (data.tree) updateGraph(data.tree, data.tree_version);
 
     if (data.ose_results) {
         buildOse(data.ose_results);
@@ -277,7 +279,7 @@ function applyDialogResponse(data) {
 }
 
 async function sendAnswer(text) {
-    const data = await apiAnswer(text);
+    const data = applyDialogPatches(await apiAnswer(text, getDialogVersions()));
     applyDialogResponse(data);
 }
 
@@ -299,13 +301,13 @@ async function startForScheme(schemeId) {
         applySavedState(schemeId);
 
         // синхронизируем дерево/ОСЭ из backend (источник истины), не добавляя новое сообщение в историю
-        const data = await apiStart(schemeId);
+        const data = applyDialogPatches(await apiStart(schemeId));
         applyDialogResponseSilent(data);
         return;
     }
 
     clearDialog();
-    const data = await apiStart(schemeId);
+    const data = applyDialogPatches(await apiStart(schemeId));
     applyDialogResponse(data);
 }
 
@@ -4,11 +4,20 @@ import secrets
 
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 
 from api.router import router
+from core.dialog_state import DialogHandle, bind_dialog, current_handle, unbind_dialog
+from core.dialog_store import (
+    SESSION_COOKIE, SESSION_HEADER,
+    DialogConflict, dialog_store, new_token, restore_state, serialize_state, valid_token,
+)
+from core.sensitivity import shutdown_pool
 from db.init_db import init_db
+from db.session import UnitOfWork, bind_uow, unbind_uow
+from db.snapshots import refresh_snapshots
 
 
 app = FastAPI(
@@ -26,6 +35,116 @@ PASSWORD = os.getenv("AUTH_PASS")
 def _startup():
     init_db()
 
+
+@app.on_event("shutdown")
+def _shutdown():
+    shutdown_pool()
+
+
+def _conflict_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"detail": "Состояние диалога изменено параллельным запросом, повторите."},
+    )
+
+
+def _rollback_dialog() -> None:
+    # БД откатилась — диалог возвращается к состоянию до запроса и не сохраняется
+    handle = current_handle()
+    if handle is None:
+        return
+    if handle.snapshot is not None and handle.loaded:
+        restore_state(handle.state, handle.snapshot)
+    handle.saved = True
+
+
+def _commit(uow: UnitOfWork) -> None:
+    # снимки схем, записанных запросом, — в той же транзакции (см. db.snapshots)
+    handle = current_handle()
+    state = handle.state if handle is not None else None
+    refresh_snapshots(uow.session, state)
+    if state is None:
+        uow.commit()
+        return
+    # версия диалога проверяется до коммита БД, а запись фиксируется после него:
+    # 409 значит, что не сохранено ни то, ни другое
+    with handle.saving():
+        uow.commit()
+
+
+# объявлен раньше dialog_session_middleware, поэтому выполняется внутри неё
+# и сохраняет состояние диалога вместе с коммитом БД
+@app.middleware("http")
+async def db_session_middleware(request: Request, call_next):
+    if not request.url.path.startswith("/api"):
+        return await call_next(request)
+
+    uow = UnitOfWork()
+    ctx = bind_uow(uow)
+    try:
+        response = await call_next(request)
+    except Exception:
+        await run_in_threadpool(uow.rollback)
+        await run_in_threadpool(uow.close)
+        _rollback_dialog()
+        raise
+    finally:
+        unbind_uow(ctx)
+
+    if not uow.started:
+        return response
+
+    try:
+        if response.status_code < 400:
+            await run_in_threadpool(_commit, uow)
+        else:
+            await run_in_threadpool(uow.rollback)
+            _rollback_dialog()
+    except DialogConflict:
+        await run_in_threadpool(uow.rollback)
+        _rollback_dialog()
+        response = _conflict_response()
+    except Exception:
+        await run_in_threadpool(uow.rollback)
+        _rollback_dialog()
+        response = JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": "Не удалось сохранить изменения."},
+        )
+    finally:
+        await run_in_threadpool(uow.close)
+    return response
+
+
+@app.middleware("http")
+async def dialog_session_middleware(request: Request, call_next):
+    if not request.url.path.startswith("/api"):
+        return await call_next(request)
+
+    sent = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    token = sent if valid_token(sent) else new_token()
+
+    handle = DialogHandle(token, dialog_store)
+    ctx = bind_dialog(handle)
+    if dialog_store.live_states and request.method not in ("GET", "HEAD"):
+        # изменяющий запрос правит живой объект хранилища — снимок для отката
+        handle.snapshot = await run_in_threadpool(lambda: serialize_state(handle.get()))
+    try:
+        response = await call_next(request)
+    finally:
+        unbind_dialog(ctx)
+
+    # запросы с коммитом БД уже сохранили диалог в db_session_middleware
+    if handle.loaded and not handle.saved:
+        try:
+            await run_in_threadpool(handle.save)
+        except DialogConflict:
+            response = _conflict_response()
+
+    if token != sent:
+        response.set_cookie(SESSION_COOKIE, token, httponly=True, samesite="lax")
+    return response
+
 if AUTH_ENABLED:
     if not USERNAME or not PASSWORD:
         raise RuntimeError("AUTH_USER и AUTH_PASS не установлены (AUTH_ENABLED=1).")
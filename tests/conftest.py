@@ -0,0 +1,93 @@
+import os
+import tempfile
+
+# до импорта приложения: db.session создаёт движок по DATABASE_URL при импорте
+_TMP = tempfile.mkdtemp(prefix="pf_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP}/app.db"
+os.environ["AUTH_ENABLED"] = "0"
+os.environ["DIALOG_STORE"] = "memory"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from db.config import make_engine
+from db.goal import GoalNode
+from db.goals import apply_ose_changes, sync_goals_from_tree
+from db.migrations import run_migrations
+from db.schemes import create_scheme
+from db.traversal import iter_preorder
+
+
+@pytest.fixture
+def engine(tmp_path):
+    eng = make_engine(f"sqlite:///{tmp_path}/test.db", tune=False)
+    run_migrations(eng)
+    yield eng
+    eng.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    with sessionmaker(bind=engine, autoflush=False, autocommit=False)() as s:
+        yield s
+
+
+@pytest.fixture(scope="session")
+def app():
+    import main
+    return main.app
+
+
+@pytest.fixture
+def client(app):
+    # новый клиент — новая cookie, то есть своё состояние диалога
+    with TestClient(app) as c:
+        yield c
+
+
+def build_tree(spec: dict) -> GoalNode:
+    # {"Root": {"A": {"A1": {}}, "B": {}}}
+    (name, children), = spec.items()
+    root = GoalNode(name)
+    stack = [(root, children)]
+    while stack:
+        node, kids = stack.pop()
+        for child_name, grand in kids.items():
+            stack.append((node.add_child(child_name), grand))
+    return root
+
+
+def closure_of(parent: dict) -> set:
+    # ожидаемые строки goal_closure по карте id → id родителя
+    out = set()
+    for gid in parent:
+        node, depth = gid, 0
+        while node is not None:
+            out.add((node, gid, depth))
+            node, depth = parent[node], depth + 1
+    return out
+
+
+@pytest.fixture
+def scheme(client):
+    # схема в БД приложения с деревом и строками ОСЭ, диалог открыт на ней
+    from db.session import SessionLocal
+
+    def make(spec: dict, ose: dict = None) -> dict:
+        with SessionLocal() as s:
+            scheme_id = create_scheme(s, "test").id
+            root = build_tree(spec)
+            sync_goals_from_tree(s, scheme_id, root)
+            ids = {n.name: n.id for n in iter_preorder(root)}
+            rows = [
+                {"goal_id": ids[g], "goal": g, "factor": f, "p": p, "q": q, "H": h}
+                for (g, f), (p, q, h) in (ose or {}).items()
+            ]
+            apply_ose_changes(s, scheme_id, rows)
+            s.commit()
+        resp = client.post("/api/dialog/start", params={"scheme_id": scheme_id})
+        assert resp.status_code == 200, resp.text
+        return {"id": scheme_id, "goals": ids, "start": resp.json()}
+
+    return make
@@ -0,0 +1,22 @@
+from conftest import build_tree
+from core.aggregates import SubtreeSums
+from db.goal import GoalIndex
+from db.traversal import iter_preorder
+
+
+def test_rekey_when_temp_id_equals_another_new_id():
+    root = build_tree({"Root": {"A": {}, "B": {}}})
+    nodes = {n.name: n for n in iter_preorder(root)}
+    a, b = nodes["A"].id, nodes["B"].id
+    goals = GoalIndex()
+    goals.rebuild(root)
+
+    sums = SubtreeSums()
+    sums.rebuild([{"goal_id": a, "factor": "F", "H": 1.0}, {"goal_id": b, "factor": "F", "H": 2.0}], goals, root)
+
+    # при сохранении A получает бывший временный id B, а B — новый
+    ids = {a: b, b: b + 100}
+    sums.rekey(ids)
+    assert sums.own == {b: 1.0, b + 100: 2.0}
+    assert sums.cells == {b: {"F": 1.0}, b + 100: {"F": 2.0}}
+    assert sums.sub[b] == 1.0 and sums.sub[b + 100] == 2.0 and sums.sub[root.id] == 3.0
@@ -0,0 +1,85 @@
+from db.schemes import create_scheme
+from db.session import SessionLocal
+
+
+def _answer(client, text: str) -> dict:
+    resp = client.post("/api/dialog/answer", json={"answer": text})
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def _to_combinations(client) -> None:
+    with SessionLocal() as s:
+        scheme_id = create_scheme(s, "clf").id
+        s.commit()
+    start = client.post("/api/dialog/start", params={"scheme_id": scheme_id}).json()
+    assert start["state"] == "ask_root"
+
+    for text in ("Root", "нет", "Цвет", "красный, синий", "да", "Размер", "S, M", "нет", "Root"):
+        body = _answer(client, text)
+    assert body["state"] == "clf_combo_decide"
+
+
+def test_decide_finishes_into_menu(client):
+    _to_combinations(client)
+
+    resp = client.post("/api/classifiers/combinations/decide", json={"mode": "all"})
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert (body["phase"], body["state"]) == ("menu", "menu")
+    assert body["question"].startswith("Введите команду:")
+    assert body["message"].startswith("Добавлено подцелей: 4")
+
+    # следующий ответ — команда меню, а не подтверждение finish_adpacf
+    body = _answer(client, "помощь")
+    assert body["phase"] == "menu"
+    assert body["question"].startswith("Введите команду:")
+
+
+def _combo(body: dict) -> str:
+    return body["question"].split("⟨")[1].split("⟩")[0]
+
+
+def test_dialog_walk_follows_page_order(client):
+    _to_combinations(client)
+    page = client.get("/api/classifiers/combinations").json()
+    names = [item["name"] for item in page["items"]]
+    assert page["total"] == 4
+
+    # повтор вопроса не сдвигает перебор
+    body = _answer(client, "?")
+    seen = [_combo(body)]
+    for answer in ("да", "нет", "да"):
+        body = _answer(client, answer)
+        seen.append(_combo(body))
+    assert seen == names
+
+    body = _answer(client, "нет")
+    assert (body["phase"], body["state"]) == ("menu", "menu")
+    assert {n["name"] for n in body["tree"]} == {"Root", names[0], names[2]}
+
+
+def test_decide_over_limit_is_rejected_until_narrowed(client, monkeypatch):
+    import api.clf_combinations as clf_combinations
+
+    monkeypatch.setattr(clf_combinations, "BULK_LIMIT", 3)
+    _to_combinations(client)
+
+    resp = client.post("/api/classifiers/combinations/decide", json={"mode": "all"})
+    assert resp.status_code == 422
+    detail = resp.json()["detail"]
+    assert "4 сочетаний" in detail[0] and "CLF_BULK_LIMIT" in detail[0]
+    assert detail[1] == "элементов по классификаторам: Цвет — 2, Размер — 2"
+    assert "include" in detail[2]
+
+    # ничего не добавлено, перебор не прерван
+    body = _answer(client, "?")
+    assert body["state"] == "clf_combo_decide"
+    assert [n["name"] for n in body["tree"]] == ["Root"]
+
+    resp = client.post(
+        "/api/classifiers/combinations/decide",
+        json={"mode": "rules", "rules": [{"classifier": "Цвет", "include": ["синий"]}]},
+    )
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["message"].startswith("Добавлено подцелей: 2")
@@ -0,0 +1,45 @@
+from db.goals import get_all_goals, get_ose_results
+from db.session import SessionLocal, UnitOfWork
+
+
+def _memory(client) -> tuple:
+    # "помощь" не меняет дерево: ответ показывает состояние диалога в памяти как есть
+    body = client.post("/api/dialog/answer", json={"answer": "помощь"}).json()
+    tree = sorted(n["name"] for n in body["tree"])
+    ose = {(r["goal"], r["factor"]) for r in body["ose_results"] if not r["factor"].startswith("ΣH ")}
+    return tree, ose
+
+
+def _db(scheme_id: int) -> tuple:
+    with SessionLocal() as s:
+        tree = sorted(g.name for g in get_all_goals(s, scheme_id))
+        ose = {(r["goal"], r["factor"]) for r in get_ose_results(s, scheme_id)}
+    return tree, ose
+
+
+def test_failed_commit_rolls_back_dialog_state(client, scheme, monkeypatch):
+    sc = scheme({"Root": {"A": {"A1": {}}, "B": {}}}, {("A1", "F"): (0.5, 0.5, 0.35), ("B", "G"): (0.2, 0.5, 0.11)})
+    before = _db(sc["id"])
+    assert _memory(client) == before
+
+    real_commit = UnitOfWork.commit
+
+    def failing_commit(self):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(UnitOfWork, "commit", failing_commit)
+    resp = client.post("/api/dialog/commands", json={"commands": ["переименовать цель A в A2", "удалить фактор F"]})
+    assert resp.status_code == 500
+    resp = client.post("/api/dialog/answer", json={"answer": "удалить цель B"})
+    assert resp.status_code == 500
+    monkeypatch.setattr(UnitOfWork, "commit", real_commit)
+
+    assert _db(sc["id"]) == before
+    assert _memory(client) == before
+
+    # следующий удачный коммит пишет только свои изменения, и память снова совпадает с БД
+    resp = client.post("/api/dialog/answer", json={"answer": "переименовать цель A1 в A1x"})
+    assert resp.status_code == 200
+    after = _db(sc["id"])
+    assert after == (["A", "A1x", "B", "Root"], {("A1x", "F"), ("B", "G")})
+    assert _memory(client) == after
@@ -0,0 +1,155 @@
+from conftest import build_tree
+from core.delta import finalize_response
+from core.dialog_state import DialogState
+from core.schemas import DialogResponse
+from db.goal import collect_goals
+
+
+def _state(spec: dict) -> DialogState:
+    state = DialogState()
+    state.root = build_tree(spec)
+    return state
+
+
+def _send(state: DialogState, version=None) -> DialogResponse:
+    resp = DialogResponse(phase="menu", state="menu", question="", tree=[])
+    return finalize_response(resp, state, version, state.ose_version)
+
+
+def _by_name(state: DialogState, name: str):
+    return next(n for n in collect_goals(state.root) if n.name == name)
+
+
+def _mirror(resp: DialogResponse, tree: dict, ose: dict) -> tuple:
+    # то же, что applyDialogPatches во frontend/state.js
+    if resp.tree_patch:
+        for k in resp.tree_patch["remove"]:
+            tree.pop(str(k), None)
+        for n in resp.tree_patch["upsert"]:
+            tree[str(n["id"])] = n
+    else:
+        tree = {str(n["id"]): n for n in resp.tree}
+    if resp.ose_patch:
+        for goal, factor in resp.ose_patch["remove"]:
+            ose.pop((goal, factor), None)
+        for r in resp.ose_patch["upsert"]:
+            ose[(r["goal"], r["factor"])] = r
+    else:
+        ose = {(r["goal"], r["factor"]): r for r in resp.ose_results}
+    return tree, ose
+
+
+def test_patch_only_for_matching_client_version():
+    state = _state({"Root": {"A": {}}})
+    first = _send(state)
+    v = first.tree_version
+
+    # клиент без версии или с чужой версией получает всё дерево
+    _by_name(state, "A").add_child("A1")
+    resp = _send(state, v + 100)
+    assert resp.tree_patch is None and len(resp.tree) == 3
+    assert resp.tree_version == v + 1
+
+    resp = _send(state, resp.tree_version)
+    assert resp.tree == [] and resp.tree_patch["base"] == v + 1
+
+    # удаление: id уходит в remove
+    a = _by_name(state, "A")
+    a1 = a.children.pop()
+    resp = _send(state, state.tree_version)
+    assert resp.tree_patch["remove"] == [str(a1.id)] and resp.tree_version == v + 2
+
+
+def test_ose_patch_upserts_and_removes_rows():
+    state = _state({"Root": {"A": {}}})
+    state.factors_results = [
+        {"goal": "A", "factor": "F", "p": 0.5, "q": 0.5, "H": 0.35},
+        {"goal": "A", "factor": "G", "p": 0.2, "q": 0.5, "H": 0.11},
+    ]
+    base = _send(state, state.tree_version).ose_version
+
+    state.factors_results = [{"goal": "A", "factor": "F", "p": 0.6, "q": 0.5, "H": 0.3}]
+    resp = _send(state, state.tree_version)
+    assert resp.ose_results == []
+    assert resp.ose_patch == {"base": base, "upsert": state.factors_results, "remove": [["A", "G"]]}
+    assert resp.ose_version == base + 1
+
+
+def test_reset_keeps_old_versions_from_matching():
+    state = _state({"Root": {}})
+    v = _send(state).tree_version
+    state.reset()
+    state.root = build_tree({"Other": {}})
+    resp = _send(state, v)
+    assert resp.tree_patch is None and [n["name"] for n in resp.tree] == ["Other"]
+
+
+def test_client_mirror_matches_full_state():
+    state = _state({"Root": {"A": {"A1": {}}, "B": {"B1": {}}}})
+    state.factors_results = [
+        {"goal": "A1", "factor": "F", "p": 0.5, "q": 0.5, "H": 0.35},
+        {"goal": "B1", "factor": "G", "p": 0.4, "q": 0.4, "H": 0.1},
+    ]
+    resp = _send(state)
+    tree, ose = _mirror(resp, {}, {})
+
+    def rename():
+        _by_name(state, "A").name = "A2"
+
+    def move():
+        a1, b = _by_name(state, "A1"), _by_name(state, "B")
+        a1.parent.children.remove(a1)
+        b.children.append(a1)
+        a1.parent = b
+        a1.level = b.level + 1
+
+    def delete():
+        b1 = _by_name(state, "B1")
+        b1.parent.children.remove(b1)
+        state.factors_results = [r for r in state.factors_results if r["goal"] != "B1"]
+
+    def edit_ose():
+        state.factors_results = state.factors_results + [{"goal": "A2", "factor": "F", "p": 0.1, "q": 0.2, "H": 0.02}]
+
+    patched = 0
+    for change in (rename, move, delete, edit_ose, lambda: None):
+        change()
+        resp = _send(state, resp.tree_version)
+        patched += resp.tree_patch is not None
+        tree, ose = _mirror(resp, tree, ose)
+
+    assert patched == 5
+    full = finalize_response(DialogResponse(phase="menu", state="menu", question=""), state)
+    assert sorted(tree.values(), key=lambda n: n["id"]) == sorted(full.tree, key=lambda n: n["id"])
+    assert ose == {(r["goal"], r["factor"]): r for r in state.factors_results}
+
+
+def test_patch_carries_positions_of_moved_nodes():
+    state = _state({"Root": {"A": {}, "B": {}}})
+    full = {n["name"]: (n["x"], n["y"]) for n in _send(state).tree}
+    assert full["Root"] == ((full["A"][0] + full["B"][0]) / 2, 0)
+    assert full["A"][1] == full["B"][1] > 0
+
+    # переименование не двигает узлы: в патче только сам узел с прежними координатами
+    _by_name(state, "A").name = "A2"
+    resp = _send(state, state.tree_version)
+    assert [(n["name"], n["x"], n["y"]) for n in resp.tree_patch["upsert"]] == [("A2", *full["A"])]
+
+    # новый узел сдвигает соседей: их координаты приходят вместе с ним
+    _by_name(state, "B").add_child("B1")
+    resp = _send(state, state.tree_version)
+    moved = {n["name"] for n in resp.tree_patch["upsert"]}
+    assert "B1" in moved and moved <= {"Root", "A2", "B", "B1"}
+
+    resp = _send(state, state.tree_version)
+    assert resp.tree_patch == {"base": state.tree_version, "upsert": [], "remove": []}
+
+
+def test_full_response_has_positions():
+    state = _state({"Root": {"A": {}}})
+    # дерево не передано — подставляется из состояния, уже с координатами
+    resp = finalize_response(DialogResponse(phase="menu", state="menu", question=""), state)
+    assert all("x" in n and "y" in n for n in resp.tree) and len(resp.tree) == 2
+
+    resp = finalize_response(DialogResponse(phase="menu", state="menu", question="", tree=[]), state)
+    assert resp.tree == []
@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+
+import main
+from core.dialog_store import SqliteDialogStore
+from db.goals import get_all_goals
+from db.session import SessionLocal
+from db.traversal import iter_preorder
+
+
+@pytest.fixture
+def sqlite_store(tmp_path, monkeypatch):
+    store = SqliteDialogStore(str(tmp_path / "dialogs.db"))
+    monkeypatch.setattr(main, "dialog_store", store)
+    return store
+
+
+def _goal_names(scheme_id: int) -> list:
+    with SessionLocal() as s:
+        return sorted(g.name for g in get_all_goals(s, scheme_id))
+
+
+def test_conflict_leaves_db_untouched(client, scheme, sqlite_store, monkeypatch):
+    sc = scheme({"Root": {"A": {}}})
+    real_saving = sqlite_store.saving
+
+    def racing_saving(token, state, version):
+        # параллельный запрос той же сессии успел сохранить диалог раньше
+        with sqlite3.connect(sqlite_store.path) as conn:
+            conn.execute("UPDATE dialog_sessions SET version = version + 1 WHERE token = ?", (token,))
+        return real_saving(token, state, version)
+
+    monkeypatch.setattr(sqlite_store, "saving", racing_saving)
+    resp = client.post("/api/dialog/answer", json={"answer": "переименовать цель A в B"})
+    assert resp.status_code == 409
+    assert _goal_names(sc["id"]) == ["A", "Root"]
+
+
+def test_dialog_and_db_saved_together(client, scheme, sqlite_store):
+    sc = scheme({"Root": {"A": {}}})
+    token = client.cookies.get("pf_session")
+    _, version = sqlite_store.load(token)
+
+    resp = client.post("/api/dialog/answer", json={"answer": "переименовать цель A в B"})
+    assert resp.status_code == 200, resp.text
+    assert _goal_names(sc["id"]) == ["B", "Root"]
+
+    state, new_version = sqlite_store.load(token)
+    assert new_version == version + 1
+    assert sorted(n.name for n in iter_preorder(state.root)) == ["B", "Root"]
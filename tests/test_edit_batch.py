@@ -0,0 +1,54 @@
+import api.edit_batch as edit_batch
+from db.goals import get_all_goals, get_ose_results
+from db.session import SessionLocal
+
+
+def _tree(resp: dict) -> set:
+    return {(n["name"], n["parent"]) for n in resp["tree"]}
+
+
+def _ose(resp: dict) -> set:
+    return {(r["goal"], r["factor"], r["H"]) for r in resp["ose_results"] if not r["factor"].startswith("ΣH ")}
+
+
+def test_batch_is_all_or_nothing_when_persist_fails(client, scheme, monkeypatch):
+    sc = scheme({"Root": {"A": {"A1": {}}, "B": {}}}, {("A1", "F"): (0.5, 0.5, 0.35), ("B", "G"): (0.2, 0.5, 0.11)})
+    before = client.post("/api/dialog/start", params={"scheme_id": sc["id"]}).json()
+
+    real_sync = edit_batch.sync_goals_from_tree
+
+    def failing_sync(session, scheme_id, root):
+        # записи в БД уже сделаны, затем ошибка — как упавший flush
+        real_sync(session, scheme_id, root)
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(edit_batch, "sync_goals_from_tree", failing_sync)
+    resp = client.post("/api/dialog/commands", json={"commands": [
+        "переименовать цель A в A2",
+        "удалить цель B",
+        "удалить фактор F",
+    ]})
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert body["ok"] is False
+    assert body["results"][-1]["message"] == "Не удалось сохранить изменения."
+    assert _tree(body["dialog"]) == _tree(before)
+    assert _ose(body["dialog"]) == _ose(before)
+
+    monkeypatch.setattr(edit_batch, "sync_goals_from_tree", real_sync)
+    after = client.post("/api/dialog/start", params={"scheme_id": sc["id"]}).json()
+    assert _tree(after) == _tree(before)
+    assert _ose(after) == _ose(before)
+
+    with SessionLocal() as s:
+        assert sorted(g.name for g in get_all_goals(s, sc["id"])) == ["A", "A1", "B", "Root"]
+        assert {(r["goal"], r["factor"]) for r in get_ose_results(s, sc["id"])} == {("A1", "F"), ("B", "G")}
+
+
+def test_batch_applies_all_commands(client, scheme):
+    sc = scheme({"Root": {"A": {}, "B": {}}}, {("B", "G"): (0.2, 0.5, 0.11)})
+    resp = client.post("/api/dialog/commands", json={"commands": ["переименовать цель A в A2", "удалить цель B"]})
+    assert resp.json()["ok"] is True
+    with SessionLocal() as s:
+        assert sorted(g.name for g in get_all_goals(s, sc["id"])) == ["A2", "Root"]
+        assert get_ose_results(s, sc["id"]) == []
@@ -0,0 +1,94 @@
+import random
+
+from sqlalchemy import select
+
+from conftest import build_tree, closure_of
+from db.goal import Goal, GoalClosure, GoalNode
+from db.goals import get_ancestors, get_subtree, move_goal, sync_goals_from_tree
+from db.schemes import create_scheme
+from db.session import SessionLocal
+from db.traversal import iter_preorder
+
+
+def _stored(session) -> set:
+    return set(session.execute(select(GoalClosure.ancestor_id, GoalClosure.descendant_id, GoalClosure.depth)))
+
+
+def _expected(session) -> set:
+    # пересчёт по parent_id всех целей базы
+    return closure_of(dict(session.execute(select(Goal.id, Goal.parent_id)).all()))
+
+
+def _wide_tree(n: int, rnd: random.Random) -> GoalNode:
+    root = GoalNode("g0")
+    nodes = [root]
+    for i in range(1, n):
+        nodes.append(rnd.choice(nodes).add_child(f"g{i}"))
+    return root
+
+
+def test_move_goal_rewrites_only_subtree_paths(session):
+    scheme_id = create_scheme(session, "s").id
+    root = build_tree({"Root": {"A": {"A1": {"A11": {}}}, "B": {"B1": {}}}})
+    sync_goals_from_tree(session, scheme_id, root)
+    ids = {n.name: n.id for n in iter_preorder(root)}
+    assert _stored(session) == _expected(session)
+
+    move_goal(session, scheme_id, ids["A1"], ids["B1"])
+    assert _stored(session) == _expected(session)
+    assert [a["name"] for a in get_ancestors(session, ids["A11"])] == ["Root", "B", "B1", "A1"]
+    assert {n["name"] for n in get_subtree(session, ids["A"])} == {"A"}
+
+    # и обратно — к корню
+    move_goal(session, scheme_id, ids["A1"], ids["Root"])
+    assert _stored(session) == _expected(session)
+    assert [a["name"] for a in get_ancestors(session, ids["A11"])] == ["Root", "A1"]
+
+
+def test_random_moves_and_deletes_match_recompute(session):
+    rnd = random.Random(7)
+    scheme_id = create_scheme(session, "s").id
+    other_id = create_scheme(session, "other").id
+    root = _wide_tree(60, rnd)
+    sync_goals_from_tree(session, scheme_id, root)
+    sync_goals_from_tree(session, other_id, _wide_tree(10, rnd))
+
+    for step in range(40):
+        nodes = list(iter_preorder(root))
+        node = rnd.choice(nodes[1:])
+        if step % 5 == 4:
+            # удаление поддерева — через сверку дерева, строки замыкания уходят каскадом
+            node.parent.children.remove(node)
+            sync_goals_from_tree(session, scheme_id, root)
+        else:
+            sub = {id(n) for n in iter_preorder(node)}
+            parent = rnd.choice([n for n in nodes if id(n) not in sub])
+            node.parent.children.remove(node)
+            parent.children.append(node)
+            node.parent = parent
+            for n in iter_preorder(node):
+                n.level = n.parent.level + 1
+            # перенос — точечно или через сверку всего дерева
+            if step % 2:
+                move_goal(session, scheme_id, node.id, parent.id)
+            else:
+                sync_goals_from_tree(session, scheme_id, root)
+        assert _stored(session) == _expected(session), step
+
+
+def test_closure_after_move_and_delete_commands(client, scheme):
+    sc = scheme({"Root": {"A": {"A1": {"A11": {}}}, "B": {}}})
+    g = sc["goals"]
+
+    assert client.post(f"/api/goals/{g['A1']}/move", params={"parent_id": g["B"]}).status_code == 200
+    with SessionLocal() as s:
+        assert _stored(s) == _expected(s)
+        assert [a["name"] for a in get_ancestors(s, g["A11"])] == ["Root", "B", "A1"]
+
+    resp = client.post("/api/dialog/answer", json={"answer": f"удалить цель {g['B']}"})
+    assert resp.status_code == 200 and resp.json()["question"] == "Цель удалена."
+    with SessionLocal() as s:
+        assert _stored(s) == _expected(s)
+        assert not s.execute(
+            select(GoalClosure).where(GoalClosure.descendant_id.in_([g["B"], g["A1"], g["A11"]]))
+        ).first()
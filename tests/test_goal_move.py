@@ -0,0 +1,20 @@
+
+def _parents(resp: dict) -> dict:
+    return {n["name"]: n["parent"] for n in resp["tree"]}
+
+
+def test_move_status_codes(client, scheme):
+    sc = scheme({"Root": {"A": {"A1": {}}, "B": {}}})
+    g = sc["goals"]
+
+    assert client.post(f"/api/goals/{g['A']}/move", params={"parent_id": 999999}).status_code == 404
+    assert client.post("/api/goals/999999/move", params={"parent_id": g["B"]}).status_code == 404
+    # под собственного потомка — цикл
+    assert client.post(f"/api/goals/{g['A']}/move", params={"parent_id": g["A1"]}).status_code == 422
+    assert client.post(f"/api/goals/{g['A']}/move", params={"parent_id": g["A"]}).status_code == 422
+    assert client.post(f"/api/goals/{g['Root']}/move", params={"parent_id": g["B"]}).status_code == 422
+
+    resp = client.post(f"/api/goals/{g['A']}/move", params={"parent_id": g["B"]})
+    assert resp.status_code == 200, resp.text
+    tree = client.post("/api/dialog/start", params={"scheme_id": sc["id"]}).json()
+    assert _parents(tree)["A"] == g["B"]
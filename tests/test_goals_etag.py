@@ -0,0 +1,28 @@
+from conftest import build_tree
+from db.goals import sync_goals_from_tree
+from db.session import SessionLocal
+
+
+def _new_scheme(client, spec: dict) -> int:
+    scheme_id = client.post("/api/schemes", params={"name": "etag"}).json()["id"]
+    with SessionLocal() as s:
+        sync_goals_from_tree(s, scheme_id, build_tree(spec))
+        s.commit()
+    return scheme_id
+
+
+def test_etag_differs_when_scheme_id_is_reused(client):
+    first = _new_scheme(client, {"Old": {"A": {}}})
+    resp = client.get(f"/api/schemes/{first}/goals")
+    etag = resp.headers["etag"]
+    assert client.get(f"/api/schemes/{first}/goals", headers={"If-None-Match": etag}).status_code == 304
+
+    assert client.delete(f"/api/schemes/{first}").status_code == 200
+    second = _new_scheme(client, {"New": {"B": {}}})
+    # SQLite выдаёт id последней удалённой строки заново
+    assert second == first
+
+    resp = client.get(f"/api/schemes/{second}/goals", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+    assert {n["name"] for n in resp.json()} == {"New", "B"}
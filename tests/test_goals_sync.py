@@ -0,0 +1,99 @@
+import db.goals as goals
+from conftest import build_tree
+from db.goal import Goal, OseResult, collect_goals
+from db.goals import apply_ose_changes, sync_goals_from_tree
+from db.schemes import create_scheme, get_tree_version
+
+
+def _rows(session, scheme_id: int) -> set:
+    return set(session.query(Goal.id, Goal.name, Goal.parent_id).filter(Goal.scheme_id == scheme_id))
+
+
+def _tree_rows(root) -> set:
+    return {(n.id, n.name, n.parent.id if n.parent else None) for n in collect_goals(root)}
+
+
+def _node(root, name: str):
+    return next(n for n in collect_goals(root) if n.name == name)
+
+
+def _remove(node) -> None:
+    node.parent.children.remove(node)
+    node.parent = None
+
+
+def test_first_sync_inserts_tree_and_renumbers(session):
+    scheme_id = create_scheme(session, "s").id
+    root = build_tree({"Root": {"A": {"A1": {}}, "B": {}}})
+    old_ids = {n.name: n.id for n in collect_goals(root)}
+    v0 = get_tree_version(session, scheme_id)
+
+    renumbered = sync_goals_from_tree(session, scheme_id, root)
+
+    assert _rows(session, scheme_id) == _tree_rows(root)
+    assert {old for old, n in renumbered} <= set(old_ids.values())
+    assert all(old_ids[n.name] == old for old, n in renumbered)
+    assert get_tree_version(session, scheme_id) == v0 + 1
+
+
+def test_unchanged_tree_writes_nothing(session):
+    scheme_id = create_scheme(session, "s").id
+    root = build_tree({"Root": {"A": {}, "B": {}}})
+    sync_goals_from_tree(session, scheme_id, root)
+    v = get_tree_version(session, scheme_id)
+    before = _rows(session, scheme_id)
+
+    assert sync_goals_from_tree(session, scheme_id, root) == []
+    assert _rows(session, scheme_id) == before == _tree_rows(root)
+    assert get_tree_version(session, scheme_id) == v
+
+
+def test_diff_updates_in_place_and_deletes_stale(session, monkeypatch):
+    scheme_id = create_scheme(session, "s").id
+    other_id = create_scheme(session, "other").id
+    root = build_tree({"Root": {"A": {"A1": {"A11": {"A111": {}}}}, "B": {"B1": {}}}})
+    other = build_tree({"Root": {"A": {}}})
+    sync_goals_from_tree(session, scheme_id, root)
+    sync_goals_from_tree(session, other_id, other)
+    other_rows = _rows(session, other_id)
+
+    a111 = _node(root, "A111")
+    b1 = _node(root, "B1")
+    apply_ose_changes(session, scheme_id, [
+        {"goal_id": a111.id, "factor": "F", "p": 0.5, "q": 0.5, "H": 0.35},
+        {"goal_id": b1.id, "factor": "F", "p": 0.2, "q": 0.5, "H": 0.11},
+    ])
+    kept = {n.name: n.id for n in collect_goals(root)}
+
+    # переименование, перенос, новая цель и удаление цепочки из трёх целей
+    _node(root, "B").name = "B2"
+    moved = _node(root, "B1")
+    _remove(moved)
+    _node(root, "A").children.append(moved)
+    moved.parent = _node(root, "A")
+    _node(root, "B2").add_child("C")
+    _remove(_node(root, "A1"))
+
+    # по одной цели на пачку удаления: потомок должен уйти раньше предка
+    monkeypatch.setattr(goals, "_IN_CHUNK", 1)
+    v = get_tree_version(session, scheme_id)
+    sync_goals_from_tree(session, scheme_id, root)
+
+    assert _rows(session, scheme_id) == _tree_rows(root)
+    # переименованная и перенесённая цели — те же строки
+    assert _node(root, "B2").id == kept["B"] and _node(root, "B1").id == kept["B1"]
+    assert not {kept["A1"], kept["A11"], kept["A111"]} & {r[0] for r in _rows(session, scheme_id)}
+    assert get_tree_version(session, scheme_id) == v + 1
+
+    # строки ОСЭ удалённых целей уходят каскадом, остальные на месте
+    ose = {gid for gid, in session.query(OseResult.goal_id).filter(OseResult.scheme_id == scheme_id)}
+    assert ose == {b1.id}
+    assert _rows(session, other_id) == other_rows
+
+
+def test_empty_tree_deletes_everything(session):
+    scheme_id = create_scheme(session, "s").id
+    sync_goals_from_tree(session, scheme_id, build_tree({"Root": {"A": {"A1": {}}}}))
+
+    sync_goals_from_tree(session, scheme_id, None)
+    assert _rows(session, scheme_id) == set()
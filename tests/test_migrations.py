@@ -0,0 +1,103 @@
+from sqlalchemy import inspect, text
+
+from conftest import closure_of
+from db.config import make_engine
+from db.migrations import latest_version, run_migrations
+
+
+# таблицы базы до миграций — в том виде, как их создавал create_all исходных моделей
+BASELINE = (
+    "CREATE TABLE schemes (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL)",
+    "CREATE TABLE goals ("
+    " id INTEGER PRIMARY KEY, name VARCHAR NOT NULL,"
+    " scheme_id INTEGER NOT NULL REFERENCES schemes (id),"
+    " parent_id INTEGER REFERENCES goals (id))",
+    "CREATE TABLE ose_results ("
+    " id INTEGER PRIMARY KEY, scheme_id INTEGER NOT NULL REFERENCES schemes (id),"
+    " goal VARCHAR NOT NULL, factor VARCHAR NOT NULL,"
+    " p FLOAT NOT NULL, q FLOAT NOT NULL, h FLOAT NOT NULL)",
+)
+
+# схема 1: Root(1) → A(2) → A1(3), Root → B(4); схема 2: X(5) → A(6)
+GOALS = [(1, "Root", 1, None), (2, "A", 1, 1), (3, "A1", 1, 2), (4, "B", 1, 1), (5, "X", 2, None), (6, "A", 2, 5)]
+
+OSE = [
+    (1, "A1", "F", 0.5, 0.5, 0.35),
+    (1, "B", "G", 0.2, 0.5, 0.11),
+    # цели уже нет: строка не переносится, фактор H не создаётся
+    (1, "Gone", "H", 0.1, 0.1, 0.01),
+    (1, "Gone", "F", 0.1, 0.1, 0.01),
+    # та же цель по имени в другой схеме
+    (2, "A", "F", 0.3, 0.3, 0.09),
+]
+
+
+def _baseline(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path}/old.db", tune=False)
+    with engine.begin() as conn:
+        for ddl in BASELINE:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO schemes (id, name) VALUES (1, 's1'), (2, 's2')"))
+        for row in GOALS:
+            conn.execute(
+                text("INSERT INTO goals (id, name, scheme_id, parent_id) VALUES (:i, :n, :s, :p)"),
+                dict(zip("insp", row)),
+            )
+        for row in OSE:
+            conn.execute(
+                text("INSERT INTO ose_results (scheme_id, goal, factor, p, q, h) VALUES (:s, :g, :f, :p, :q, :h)"),
+                dict(zip("sgfpqh", row)),
+            )
+    return engine
+
+
+def test_baseline_to_latest(tmp_path):
+    engine = _baseline(tmp_path)
+    assert run_migrations(engine) == latest_version()
+
+    with engine.connect() as conn:
+        applied = set(conn.execute(text("SELECT version FROM schema_version")).scalars())
+        assert applied == set(range(1, latest_version() + 1))
+
+        cols = {c["name"] for c in inspect(conn).get_columns("ose_results")}
+        assert {"goal_id", "factor_id"} <= cols and not {"goal", "factor"} & cols
+        fks = {fk["referred_table"] for fk in inspect(conn).get_foreign_keys("ose_results")}
+        assert {"goals", "factors"} <= fks
+
+        factors = set(conn.execute(text("SELECT scheme_id, name FROM factors")))
+        assert factors == {(1, "F"), (1, "G"), (2, "F")}
+
+        rows = set(conn.execute(text(
+            "SELECT r.scheme_id, r.goal_id, f.name, r.p, r.q, r.h"
+            " FROM ose_results r JOIN factors f ON f.id = r.factor_id"
+        )))
+        assert rows == {(1, 3, "F", 0.5, 0.5, 0.35), (1, 4, "G", 0.2, 0.5, 0.11), (2, 6, "F", 0.3, 0.3, 0.09)}
+
+        closure = set(conn.execute(text("SELECT ancestor_id, descendant_id, depth FROM goal_closure")))
+        assert closure == closure_of({gid: pid for gid, _, _, pid in GOALS})
+
+        indexes = {ix["name"] for ix in inspect(conn).get_indexes("goals")}
+        assert {"ix_goals_scheme_parent", "ix_goals_parent_id"} <= indexes
+
+        assert "ose_version" in {c["name"] for c in inspect(conn).get_columns("scheme_versions")}
+
+    # внешние ключи действуют: удаление цели уносит её строки ОСЭ
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM goals WHERE id = 3"))
+        assert conn.execute(text("SELECT COUNT(*) FROM ose_results WHERE goal_id = 3")).scalar() == 0
+
+    # повторный запуск ничего не делает
+    assert run_migrations(engine) == latest_version()
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar() == latest_version()
+        assert conn.execute(text("SELECT COUNT(*) FROM ose_results")).scalar() == 2
+    engine.dispose()
+
+
+def test_fresh_database_only_records_steps(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path}/new.db", tune=False)
+    assert run_migrations(engine) == latest_version()
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar() == latest_version()
+        assert conn.execute(text("SELECT COUNT(*) FROM goal_closure")).scalar() == 0
+    engine.dispose()
@@ -0,0 +1,18 @@
+from core.ose_store import OseStore
+
+
+def _row(goal_id: int, factor: str, h: float) -> dict:
+    return {"goal_id": goal_id, "goal": f"g{goal_id}", "factor": factor, "p": 0.5, "q": 0.5, "H": h}
+
+
+def test_rekey_goals_moves_rows_and_dirty_keys_in_one_pass():
+    store = OseStore()
+    store.load([_row(1, "F", 1.0), _row(2, "F", 2.0), _row(3, "G", 3.0)])
+    store.put(_row(2, "G", 4.0))
+
+    # цель 1 получает бывший временный id цели 2, цель 2 — новый
+    store.rekey_goals({1: 2, 2: 10})
+
+    rows = {(r["goal_id"], r["factor"]): r["H"] for r in store.rows()}
+    assert rows == {(2, "F"): 1.0, (10, "F"): 2.0, (10, "G"): 4.0, (3, "G"): 3.0}
+    assert store._dirty == {(10, "G")}